@@ -6,14 +6,21 @@ file path as a command-line argument, since Antigravity has no Python API for
 reading the active editor state directly.
 
 Usage:
-    python dispatcher.py <file_path>
+    python dispatcher.py <file_path> [--sync] [--profile[=cprofile|sample]]
+                         [--import-time] [--worker[=timeout]] [--namespace[=key]]
+                         [--record=<log path>] [--timeout=N]
+
+    python dispatcher.py --status [--bench=N]
 
 Where <file_path> is the absolute path to the file currently open in the
 Antigravity editor, typically provided via the ${file} VS Code task variable.
+Put ``--`` before a file path or text that itself starts with ``--``.
 """
 
 import sys
 import os
+import time
+import tempfile
 from pathlib import Path
 
 
@@ -33,6 +40,11 @@ if _src_dir not in sys.path:
 import pigeons
 import pigeons.maya
 import pigeons.cascadeur
+import pigeons.recorder
+import pigeons.selection
+import pigeons.context
+import pigeons.status
+from pigeons import log
 
 sys.path.remove(_src_dir)
 
@@ -45,6 +57,21 @@ CARRIERS = [
     pigeons.cascadeur.CascadeurPigeon(),
 ]
 
+SELECTION_POLICY = pigeons.selection.LatencyPolicy()
+"""Chooses the carrier for each dispatch. See pigeons/selection.py"""
+
+POLICY_PATH = os.path.join(tempfile.gettempdir(), 'wingcarrier_antigravity_policy.json')
+"""Where SELECTION_POLICY's latency and failure history is kept between
+runs, since every dispatch is a new process"""
+
+SELECTION_POLICY.load(POLICY_PATH)
+
+DISPATCH_OPTIONS = {'stream': True, 'follow': 'block', 'follow_timeout': 60.0}
+"""Options passed to every Pigeon.send().  Output from the DCC is streamed
+back and printed to the task terminal before the script exits, giving up
+after ``follow_timeout`` seconds (``--timeout=N``) so a DCC that never
+answers doesn't hold the terminal."""
+
 
 def _get_module_info(file_path: str):
     """Resolve the Python module namespace for *file_path* by walking parent
@@ -112,19 +139,27 @@ def _get_doc_type(file_path: str) -> str:
     return ''
 
 
-def _find_best_carrier():
-    """Return the first carrier that reports it can currently dispatch.
+def _save_policy():
+    """Writes SELECTION_POLICY's history to POLICY_PATH for the next run"""
+    try:
+        SELECTION_POLICY.save(POLICY_PATH)
+    except OSError as e:
+        log.debug('wing-carrier [antigravity]: could not save the selection history: {}'.format(e))
+
+
+def _find_best_carrier(file_path: str = '', doc_type: str = ''):
+    """Return the carrier ``SELECTION_POLICY`` picks for *file_path*.
+
+    File type affinity (``Pigeon.file_types``) comes first, then the lowest
+    probe latency among carriers that can currently dispatch.
 
     Returns:
         Pigeon | None: A ready carrier pigeon, or None if none are available.
     """
-    for carrier in CARRIERS:
-        if carrier.can_dispatch():
-            return carrier
-    return None
+    return SELECTION_POLICY.select(CARRIERS, file_path, doc_type)
 
 
-def dispatch(file_path: str, highlighted_text: str = ''):
+def dispatch(file_path: str, highlighted_text: str = '', sync: bool = False, options: dict = None):
     """Collect document metadata and send it to the best available carrier.
 
     This is the Antigravity equivalent of ``dispatch_carrier()`` in the Wing
@@ -137,30 +172,113 @@ def dispatch(file_path: str, highlighted_text: str = ''):
         file_path (str): Absolute path to the active document.
         highlighted_text (str): Currently selected text, if any. Defaults to
             an empty string.
+        sync (bool): Mirror the file's package into the target with
+            ``Pigeon.sync_package()`` before sending. Defaults to False.
+        options (dict): Extra send options merged over ``DISPATCH_OPTIONS``,
+            e.g. ``{'profile': 'sample'}``.
+
+    Returns:
+        bool: True if the carrier accepted the command.
     """
-    carrier = _find_best_carrier()
+    context = pigeons.context.DispatchContext(
+        loaders={'module_path': lambda: _get_module_info(file_path)[0]},
+        selection=highlighted_text,
+        doc_type=_get_doc_type(file_path),
+        file_path=file_path.replace('\\', '/'),
+    )
+    carrier = _find_best_carrier(file_path, context.doc_type)
     if carrier is None:
         print('wing-carrier [antigravity]: No application available to dispatch to!')
-        return
+        _save_policy()
+        return False
 
-    module_path, norm_file_path = _get_module_info(file_path)
-    doc_type = _get_doc_type(file_path)
+    # the module walk only runs when the carrier needs the module path
+    values = context.values(carrier.context_fields(highlighted_text))
+    module_path, norm_file_path, doc_type = values['module_path'], values['file_path'], values['doc_type']
 
-    print('wing-carrier [antigravity]: module_path={!r}  file_path={!r}  doc_type={!r}'.format(
+    log.debug('wing-carrier [antigravity]: module_path={!r}  file_path={!r}  doc_type={!r}'.format(
         module_path, norm_file_path, doc_type))
 
-    carrier.send(highlighted_text, module_path, norm_file_path, doc_type)
+    if sync and not highlighted_text:
+        carrier.sync_package(file_path)
+
+    send_options = dict(DISPATCH_OPTIONS)
+    send_options.update(options or {})
+    send_options = pigeons.recorder.record_dispatch(
+        carrier, highlighted_text, module_path, norm_file_path, doc_type, send_options)
+
+    start = time.perf_counter()
+    try:
+        result = carrier.send(highlighted_text, module_path, norm_file_path, doc_type, options=send_options)
+    except Exception:
+        SELECTION_POLICY.record_send(carrier, time.perf_counter() - start, ok=False)
+        _save_policy()
+        raise
+    SELECTION_POLICY.record_send(carrier, time.perf_counter() - start, ok=bool(result))
+    _save_policy()
+    return bool(result)
 
 
 # ---------------------------------------------------------------------------
 # Entry point – called by the VS Code task
 # ---------------------------------------------------------------------------
-if __name__ == '__main__':
-    if len(sys.argv) < 2:
-        print('Usage: python dispatcher.py <file_path> [highlighted_text]')
-        sys.exit(1)
+def main(args=None):
+    """Parses the command line and dispatches, or prints the status report.
 
-    _file_path = sys.argv[1]
-    _highlighted_text = sys.argv[2] if len(sys.argv) > 2 else ''
+    Put ``--`` before a file path or text that itself starts with ``--``.
 
-    dispatch(_file_path, _highlighted_text)
+    Returns:
+        int: The process exit code.
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Dispatch a file to the best available wing-carrier application')
+    parser.add_argument('file_path', nargs='?', help='The active document, eg ${file}')
+    parser.add_argument('highlighted_text', nargs='?', default='', help='Code to send instead of the file')
+    parser.add_argument('--sync', action='store_true', help='Mirror the package into the application first')
+    parser.add_argument('--profile', nargs='?', const='cprofile', choices=['cprofile', 'sample'])
+    parser.add_argument('--import-time', action='store_true', help='Report how long each import took')
+    parser.add_argument('--worker', nargs='?', type=float, const=0.0, metavar='TIMEOUT',
+                        help='Run on the application\'s task pool, cancelled after TIMEOUT seconds')
+    parser.add_argument('--namespace', nargs='?', const='file', metavar='KEY',
+                        help='Run in a reusable namespace, keyed by the file by default')
+    parser.add_argument('--record', metavar='LOG', help='Append the dispatch to a session log')
+    parser.add_argument('--timeout', type=float, help='Seconds to wait for output. Default {}'.format(
+        DISPATCH_OPTIONS['follow_timeout']))
+    parser.add_argument('--status', action='store_true', help='Report the health of every carrier')
+    parser.add_argument('--bench', type=int, default=0, help='With --status, time N round trips')
+    parsed, unknown = parser.parse_known_args(args)
+    if unknown:
+        print('wing-carrier [antigravity]: ignoring unknown arguments {}'.format(' '.join(unknown)))
+
+    if parsed.status:
+        print(pigeons.status.format_report(pigeons.status.report(CARRIERS, SELECTION_POLICY, bench=parsed.bench)))
+        _save_policy()
+        return 0
+
+    if not parsed.file_path:
+        parser.print_usage()
+        return 1
+
+    options = {}
+    if parsed.profile:
+        options['profile'] = parsed.profile
+    if parsed.import_time:
+        options['import_time'] = True
+    if parsed.worker is not None:
+        options['worker'] = True
+        if parsed.worker:
+            options['task_timeout'] = parsed.worker
+    if parsed.namespace:
+        options['namespace'] = parsed.namespace
+    if parsed.timeout is not None:
+        options['follow_timeout'] = parsed.timeout
+    if parsed.record:
+        # each run appends to the same log, so a session spans many runs
+        pigeons.recorder.start_recording(parsed.record)
+
+    return 0 if dispatch(parsed.file_path, parsed.highlighted_text, sync=parsed.sync, options=options) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
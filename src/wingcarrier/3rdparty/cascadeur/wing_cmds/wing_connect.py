@@ -1,10 +1,35 @@
-
+_INVOKER = None
+"""Keeps the Qt object that runs the attach on Cascadeur's main thread alive"""
 
 
 def command_name():
     return "Guru.Connect to Wing"
 
 
+def _main_thread_scheduler():
+    """Returns a callable that runs a function on Cascadeur's Qt main thread,
+    or None when Qt can't be imported. Must be called on the main thread."""
+    global _INVOKER
+    if _INVOKER is None:
+        try:
+            from PySide6 import QtCore
+        except ImportError:
+            try:
+                from PySide2 import QtCore
+            except ImportError:
+                return None
+
+        class _Invoker(QtCore.QObject):
+            call = QtCore.Signal(object)
+
+        # emitting from the waiting thread queues the call onto the thread
+        # the invoker was created on
+        _INVOKER = _Invoker()
+        _INVOKER.call.connect(lambda function: function())
+
+    return _INVOKER.call.emit
+
+
 def run(scene):
     try:
         import sys
@@ -13,7 +38,25 @@ def run(scene):
         _3rdparty_path = os.path.normpath(_3rdparty_path)
         if _3rdparty_path not in sys.path:
             sys.path.insert(0, _3rdparty_path)
-        import wing.wingdbstub
-        wing.wingdbstub.Ensure()
+        #wing.attach stays loaded, so reconnects skip the wingdbstub bootstrap
+        import wing.attach
+        scheduler = _main_thread_scheduler()
+        if scheduler is None:
+            if not wing.attach.ensure():
+                scene.error('Wing-IDE is not listening for debug connections on {}.'.format(
+                    wing.attach.MANAGER.host_port))
+            return
+
+        def _report(connected):
+            if connected:
+                return
+            if wing.attach.MANAGER.state == 'loaded':
+                scene.info('Wing-IDE is not listening on {} yet, it can attach to Cascadeur once it runs.'.format(
+                    wing.attach.MANAGER.host_port))
+            else:
+                scene.error('Connection to Wing-IDE failed.')
+
+        #waits for Wing off the main thread, then attaches on it
+        wing.attach.ensure_async(scheduler=scheduler, callback=lambda connected: scheduler(lambda: _report(connected)))
     except:
-        scene.error('Connection to Wing-IDE failed.') 
\ No newline at end of file
+        scene.error('Connection to Wing-IDE failed.') 
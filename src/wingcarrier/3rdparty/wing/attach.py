@@ -0,0 +1,204 @@
+"""Resident manager for attaching a DCC to the Wing debugger.
+
+Importing wingdbstub runs Wing's whole bootstrap (loading the bootstrap
+modules, creating the meta importer, finding the netserver module) and
+then connects. When Wing isn't listening, that connection blocks the DCC's
+UI until it times out.
+
+AttachManager stays loaded between "connect to Wing" actions. ensure() is
+for callers on the UI thread: it first checks that Wing accepts
+connections, with a short bounded timeout, and only then imports
+wingdbstub (once, the module keeps the debugger) and calls Ensure().
+Repeated connects reuse the loaded debugger, so they are close to instant,
+and a Wing that isn't running costs at most the probe timeout.
+
+ensure_async() waits for Wing in a background thread and then runs the
+attach through a scheduler, eg maya.utils.executeDeferred, so the DCC
+never waits at all. It loads wingdbstub even when Wing never showed up, so
+the stub's own behaviour still applies: its attach port listener, the
+kEmbedded setting, and Wing connecting later on its own.
+
+Finding the Wing installation is left to wingdbstub, winghome reports
+what it settled on.
+"""
+
+import os
+import sys
+import time
+import socket
+import threading
+
+
+DEFAULT_HOST_PORT = 'localhost:50005'
+"""Must match kWingHostPort in wingdbstub.py"""
+
+class AttachManager(object):
+    """Attaches this process to the Wing debugger.
+
+    Args:
+        host_port (string) : Where Wing listens. Defaults to the
+            WINGDB_HOSTPORT environment variable, like wingdbstub
+    """
+
+    def __init__(self, host_port=None):
+        self._host_port = host_port
+        self.state = 'idle'
+        """'idle', 'waiting', 'connected', 'loaded', 'not listening' or
+        'failed'. 'loaded' means wingdbstub is up and waiting for Wing."""
+        self.load_seconds = None
+        """How long the one time wingdbstub bootstrap took"""
+        self._lock = threading.Lock()
+        self._waiter = None
+
+
+    @property
+    def host_port(self):
+        return self._host_port or os.environ.get('WINGDB_HOSTPORT', DEFAULT_HOST_PORT)
+
+
+    @property
+    def winghome(self):
+        """The Wing installation wingdbstub loaded from, or '' before the
+        stub is loaded"""
+        return getattr(self.stub, 'WINGHOME', None) or ''
+
+
+    @property
+    def address(self):
+        host, _, port = self.host_port.rpartition(':')
+        return host, int(port)
+
+
+    def wing_listening(self, timeout=0.3):
+        """Returns True if Wing accepts connections right now"""
+        try:
+            with socket.create_connection(self.address, timeout):
+                return True
+        except (OSError, socket.timeout):
+            return False
+
+
+    @property
+    def stub(self):
+        """The loaded wingdbstub module, or None before the first attach"""
+        return sys.modules.get(__package__ + '.wingdbstub')
+
+
+    def _load_stub(self):
+        stub = self.stub
+        if stub is None:
+            start = time.perf_counter()
+            from . import wingdbstub as stub
+            self.load_seconds = time.perf_counter() - start
+
+        return stub
+
+
+    @property
+    def connected(self):
+        stub = self.stub
+        debugger = getattr(stub, 'debugger', None)
+        return debugger is not None and not debugger.ChannelClosed()
+
+
+    def ensure(self, timeout=0.3):
+        """Connects to Wing if it is listening. Returns True once connected.
+
+        Args:
+            timeout (float) : Seconds to wait for Wing to accept the probe
+        """
+        with self._lock:
+            if self.connected:
+                self.state = 'connected'
+                return True
+
+            if not self.wing_listening(timeout):
+                self.state = 'not listening'
+                return False
+
+            return self._attach(require_connection=True)
+
+
+    def _attach(self, require_connection):
+        """Loads wingdbstub and has it connect. Call with self._lock held.
+
+        Args:
+            require_connection (bool) : Treat Wing not accepting the
+                connection as a failure. Without it the loaded stub keeps
+                listening on its attach port for Wing to connect later.
+        """
+        try:
+            self._load_stub().Ensure(require_connection=int(require_connection))
+        except ImportError as e:
+            # wingdbstub couldn't find a Wing installation
+            print('wing-carrier: loading wingdbstub failed: {}'.format(e))
+            self.state = 'failed'
+            return False
+        except Exception as e:
+            print('wing-carrier: attaching to Wing failed: {}'.format(e))
+            self.state = 'failed'
+            return False
+
+        self.state = 'connected' if self.connected else 'loaded'
+        return self.connected
+
+
+    def ensure_async(self, timeout=10.0, scheduler=None, callback=None):
+        """Waits up to timeout seconds for Wing in the background, then attaches.
+
+        The stub is loaded whether or not Wing turned up in time, so Wing
+        can still connect to it later. The callback then gets False and
+        the state is 'loaded'.
+
+        Calls made while an earlier one is still waiting are ignored.
+
+        Args:
+            timeout (float) : Seconds to keep waiting for Wing to listen
+            scheduler (callable) : Runs the attach, eg on the DCC's main
+                thread with maya.utils.executeDeferred. None attaches on
+                the background thread.
+            callback (callable) : Called with True or False when done
+        """
+        if self._waiter is not None and self._waiter.is_alive():
+            return self._waiter
+
+        def _attach():
+            with self._lock:
+                result = self.connected or self._attach(require_connection=False)
+                if self.connected:
+                    self.state = 'connected'
+            if callback is not None:
+                callback(result)
+
+        def _wait():
+            self.state = 'waiting'
+            deadline = time.perf_counter() + timeout
+            while not self.wing_listening():
+                if time.perf_counter() > deadline:
+                    break
+                time.sleep(0.25)
+
+            if scheduler is None:
+                _attach()
+            else:
+                scheduler(_attach)
+
+        self._waiter = threading.Thread(target=_wait, name='wing-carrier-attach')
+        self._waiter.daemon = True
+        self._waiter.start()
+        return self._waiter
+
+
+
+MANAGER = AttachManager()
+"""The resident manager. It lives as long as this module stays imported"""
+
+
+def ensure(timeout=0.3):
+    """See AttachManager.ensure()"""
+    return MANAGER.ensure(timeout)
+
+
+def ensure_async(timeout=10.0, scheduler=None, callback=None):
+    """See AttachManager.ensure_async()"""
+    return MANAGER.ensure_async(timeout, scheduler, callback)
@@ -3,6 +3,7 @@ import sys
 import subprocess
 import socket
 import os
+import time
 import tempfile
 from pathlib import Path
 
@@ -26,6 +27,12 @@ if _wingcarrier_dir not in sys.path:
 import pigeons
 import pigeons.maya
 import pigeons.cascadeur
+import pigeons.recorder
+import pigeons.selection
+import pigeons.context
+import pigeons.discovery
+import pigeons.status
+from pigeons import log
 sys.path.remove(_wingcarrier_dir)
 
 
@@ -59,10 +66,41 @@ If a new Pigeon sub-class is created, it must also be added to this list to
 be used.
 """
 
+DISPATCH_OPTIONS = {'stream': True}
+"""Options passed to every Pigeon.send(). See Pigeon.resolve_options()
+
+'bytecode' and 'compress' only pay off for large sends, so they're left to
+carriers that need them, eg MayaPigeon().dispatch_options['compress'] = True"""
+
+SELECTION_POLICY = pigeons.selection.LatencyPolicy()
+"""Chooses the carrier when none is given. See pigeons/selection.py"""
+
+PREWARM_MODULES = {
+    'MayaPigeon': (),
+    'CascadeurPigeon': (),
+}
+"""{carrier class name: modules} imported in the application in the
+background as soon as it's found, so the first dispatch doesn't pay for
+them. eg {'MayaPigeon': ('numpy', 'pymel.core')}. See Pigeon.prewarm()"""
+
+PREWARM_POLL_SECONDS = 5.0
+"""How often Wing checks for applications to pre-warm. See _prewarm_available()"""
+
 _CLASS_INSTANCE_MAPPING = {item.__class__.__name__: item for item in CARRIERS}
+for _name, _modules in PREWARM_MODULES.items():
+    if _modules and _name in _CLASS_INSTANCE_MAPPING:
+        _CLASS_INSTANCE_MAPPING[_name].prewarm_modules = tuple(_modules)
 _ACTIVE_CARRIER: pigeons.pigeon.Pigeon = None
 _DEBUG_CARRIER: pigeons.pigeon.Pigeon = None
 
+_PROCESS_OWNERS = {}
+"""{pid: (psutil.Process, carrier or None)} so debug runstate changes don't
+repeat the process lookups. Entries are dropped once the process exits."""
+
+_DEBUG_CARRIERS = {}
+"""{pid: carrier} for every debug session attached right now, newest last.
+Sessions are dropped when their process exits or Wing detaches from it."""
+
 
 def _get_document_text():
     """Based on the Wing API returns (selected text, doctype) """
@@ -117,11 +155,52 @@ def _get_module_info():
 
 
 
+def _get_file_path():
+    """Returns the active document's path with forward slashes"""
+    editor = wingapi.gApplication.GetActiveEditor()
+    if editor is None:
+        return ''
+    
+    return editor.GetDocument().GetFilename().replace("\\", "/")
+
+
+
+def _get_dispatch_context():
+    """Returns a DispatchContext that reads the editor only as fields are used"""
+    
+    def _document():
+        document = _get_document_text()
+        if not document:
+            return {'selection': '', 'doc_type': ''}
+        return {'selection': document[0], 'doc_type': document[1]}
+    
+    def _module_path():
+        module_info = _get_module_info()
+        return module_info[0] if module_info else ''
+    
+    return pigeons.context.DispatchContext(loaders={
+        'selection': _document,
+        'doc_type': _document,
+        'file_path': _get_file_path,
+        'module_path': _module_path,
+    })
+
+
+
 def _find_process_owner(process):
+    """Returns the carrier that owns a psutil.Process, or None
+    
+    The process name is matched against every carrier's process_patterns
+    at once (pigeons/discovery.py). Carriers without patterns are asked
+    with owns_process().
+    """
     global CARRIERS
     
+    matched = pigeons.discovery.match(process.name())
     for dis in CARRIERS:
-        if dis.owns_process(process):  
+        if dis in matched and dis.owns_process(process):
+            return dis
+        if not dis.process_patterns and dis.owns_process(process):
             return dis
             
     return None  
@@ -143,20 +222,9 @@ def _find_process_owner(process):
                 
 
 
-def _find_best_process():
-    valid_dispatchers = []
-    
-    for dis in CARRIERS:
-        if dis.can_dispatch():
-            valid_dispatchers.append(dis)
-            
-    if not valid_dispatchers:
-        return None
-    
-    if len(valid_dispatchers) > 1:
-        print("Mutliple dispatchers found. Using first one :{}".format(valid_dispatchers))
-        
-    return valid_dispatchers[0]
+def _find_best_process(file_path='', doc_type='', current=None):
+    """Asks SELECTION_POLICY for the carrier to use, or None"""
+    return SELECTION_POLICY.select(CARRIERS, file_path, doc_type, current)
 
 
 
@@ -171,7 +239,7 @@ def _find_best_process():
         
         
 
-def dispatch_carrier(carrier: pigeons.pigeon.Pigeon = None):
+def dispatch_carrier(carrier: pigeons.pigeon.Pigeon = None, sync=False, options=None):
     """Used to send the data to an external app based on a set of rules.
     
     When no carrier is provided the target carrier will be the last carrier
@@ -183,29 +251,40 @@ def dispatch_carrier(carrier: pigeons.pigeon.Pigeon = None):
     the last active carrier will be used.
     
     If no carrier can be determined (or the previous carrier is no longer
-    valid) then the function will attempt to find the best process to
-    communicate with via Pigeon.can_dispatch().
+    valid) then SELECTION_POLICY chooses the best carrier, using file type
+    affinity, measured latency and recent failures. Send times are fed back
+    to it after every dispatch.
     
     args:
         carrier (Pigeon)(Optional) : a specific pigeon to become the active carrier
+        sync (bool)(Optional) : mirror the file's package into the target
+            via Pigeon.sync_package() before sending
+        options (dict)(Optional) : extra send options merged over
+            DISPATCH_OPTIONS, eg {'profile': 'sample'}
     """
     global CARRIERS, _ACTIVE_CARRIER, _DEBUG_CARRIER
     
+    context = _get_dispatch_context()
+    
     target_carrier = None
-    if carrier is None:
-        if _DEBUG_CARRIER:
-            target_carrier = _DEBUG_CARRIER
-        else:
-            target_carrier = _ACTIVE_CARRIER
-    else:
+    if carrier is not None:
         _ACTIVE_CARRIER = carrier
-        target_carrier = _ACTIVE_CARRIER
+        target_carrier = carrier
+    else:
+        target_carrier = _get_debug_carrier()
      
     #A previously valid carrier now might not be valid, so it's
     #ensure our target is good and replace it if not.
-    if target_carrier is None or not target_carrier.can_dispatch():
-        _ACTIVE_CARRIER = _find_best_process()
+    if target_carrier is not None and not SELECTION_POLICY.probe(target_carrier):
+        target_carrier = None
+        
+    if target_carrier is None:
+        previous = _ACTIVE_CARRIER
+        _ACTIVE_CARRIER = _find_best_process(context.file_path, context.doc_type, current=previous)
         target_carrier = _ACTIVE_CARRIER
+        if previous is not None and previous is not target_carrier:
+            #the app may be restarted with another python before it's back
+            previous.reset_handshake()
         
     #We'll always move the last valid carrier to the top of the list
     #so it have priority when searching for a new carrier.
@@ -216,12 +295,27 @@ def dispatch_carrier(carrier: pigeons.pigeon.Pigeon = None):
         
         
     if target_carrier is not None:
-        highlighted_text, doc_type = _get_document_text()
-        module_path, file_path = _get_module_info()
-        file_path = file_path.replace("\\", "/")
-        print('module path:{} full path:{}'.format(module_path, file_path))        
+        target_carrier.ensure_prewarmed()
+        values = context.values(target_carrier.context_fields(context.selection))
+        highlighted_text, module_path = values['selection'], values['module_path']
+        file_path, doc_type = values['file_path'], values['doc_type']
+        log.debug('module path:{} full path:{}'.format(module_path, file_path))
+        
+        if sync and not highlighted_text:
+            target_carrier.sync_package(file_path)
         
-        _ACTIVE_CARRIER.send(highlighted_text, module_path, file_path, doc_type)
+        send_options = dict(DISPATCH_OPTIONS)
+        send_options.update(options or {})
+        send_options = pigeons.recorder.record_dispatch(
+            target_carrier, highlighted_text, module_path, file_path, doc_type, send_options)
+        
+        start = time.perf_counter()
+        try:
+            result = target_carrier.send(highlighted_text, module_path, file_path, doc_type, options=send_options)
+        except Exception:
+            SELECTION_POLICY.record_send(target_carrier, time.perf_counter() - start, ok=False)
+            raise
+        SELECTION_POLICY.record_send(target_carrier, time.perf_counter() - start, ok=bool(result))
     else:
         print("No application to dispatch to!")
         
@@ -233,6 +327,97 @@ def dispatch_maya():
 
 def dispatch_cascadeur():
     dispatch_carrier(carrier=_CLASS_INSTANCE_MAPPING['CascadeurPigeon'])
+    
+    
+def dispatch_sync():
+    """Sync the active file's package into the target, then import it"""
+    dispatch_carrier(sync=True)
+    
+    
+def dispatch_profile():
+    """Send to the active carrier and profile the run with cProfile"""
+    dispatch_carrier(options={'profile': 'cprofile'})
+    
+    
+def dispatch_profile_sampled():
+    """Send to the active carrier and profile the run with the sampler"""
+    dispatch_carrier(options={'profile': 'sample'})
+    
+    
+def dispatch_import_time():
+    """Send to the active carrier and report how long each import took"""
+    dispatch_carrier(options={'import_time': True})
+    
+    
+def dispatch_worker():
+    """Send to the active carrier, running on the application's task pool
+    
+    The application stays responsive while the code runs, so only use this
+    for code that doesn't touch the UI. Progress is printed as it's reported.
+    """
+    dispatch_carrier(options={'worker': True})
+    
+    
+def dispatch_cancel():
+    """Cancel every unfinished worker dispatch in the active carrier"""
+    carrier = _get_debug_carrier() or _ACTIVE_CARRIER
+    if carrier is None:
+        print('wing-carrier: no carrier to cancel tasks in')
+        return
+    
+    carrier.cancel_tasks()
+    
+    
+def dispatch_status():
+    """Print each carrier's health, latency, caches and recent dispatches"""
+    print(pigeons.status.format_report(pigeons.status.report(CARRIERS, SELECTION_POLICY)))
+    
+    
+def dispatch_status_benchmark():
+    """Print each carrier's status with a 20 round trip benchmark"""
+    print(pigeons.status.format_report(pigeons.status.report(CARRIERS, SELECTION_POLICY, bench=20)))
+    
+    
+def dispatch_isolated():
+    """Send to the active carrier, running code in the file's own namespace
+    
+    Globals from earlier sends of the same file stay available, but nothing
+    is added to the application's __main__.
+    """
+    dispatch_carrier(options={'namespace': 'file'})
+    
+    
+def dispatch_debug_scope_toggle():
+    """Limit debugger tracing to the active file's top level package
+    
+    While scoped, dispatches of modules outside that package run in the
+    application with tracing suspended. Run again to trace everything.
+    """
+    if DISPATCH_OPTIONS.pop('debug_scope', None):
+        print('wing-carrier: debug scope cleared, tracing all dispatches')
+        return
+    
+    module_info = _get_module_info()
+    package = module_info[0].split('.')[0] if module_info else ''
+    if not package:
+        print('wing-carrier: no active file to scope debugging to')
+        return
+    
+    DISPATCH_OPTIONS['debug_scope'] = [package]
+    print('wing-carrier: debug scope set to {}'.format(package))
+    
+    
+def dispatch_record_toggle():
+    """Start or stop recording dispatches to a session log
+    
+    Logs are written to the temp dir and can be replayed with
+    python -m wingcarrier.pigeons.recorder <log>
+    """
+    if pigeons.recorder.active():
+        pigeons.recorder.stop_recording()
+    else:
+        name = 'wingcarrier_session_{}.jsonl.gz'.format(time.strftime('%Y%m%d_%H%M%S'))
+        pigeons.recorder.start_recording(os.path.join(tempfile.gettempdir(), name))
      
 
 #-----------WIN-IDE signal slots for active debug is below this line--------------
@@ -251,32 +436,136 @@ def _get_debug_process(current_run_state=None) :
     
     if PSUTILS_EXISTS:
         process: psutil.Process = psutil.Process(pid=pid)
-        print('connected to PID:{}   name:{}   exe:{}'.format(process.pid, process.name(), process.exe()))
+        log.debug('connected to PID:{}   name:{}   exe:{}'.format(process.pid, process.name(), process.exe()))
     else:
         print('wing-carrier: psutils missing')
 
     return process
 
 
+def _attached_pids():
+    """The pids of the processes Wing's debugger is attached to, or None
+    if the debugger can't list its run states"""
+    if not WING_API_EXISTS:
+        return None
+    
+    get_run_states = getattr(wingapi.gApplication.GetDebugger(), 'GetRunStates', None)
+    if get_run_states is None:
+        return None
+    
+    pids = set()
+    for run_state in get_run_states() or ():
+        pid = run_state.GetProcessID()
+        if pid:
+            pids.add(pid)
+            
+    return pids
+
+
+def _prune_process_owners():
+    """Forgets processes that have exited, and debug sessions Wing has
+    detached from even if their application is still running"""
+    for pid, (process, _) in list(_PROCESS_OWNERS.items()):
+        if not process.is_running():
+            _PROCESS_OWNERS.pop(pid)
+            _DEBUG_CARRIERS.pop(pid, None)
+            
+    attached = _attached_pids()
+    if attached is not None:
+        for pid in list(_DEBUG_CARRIERS):
+            if pid not in attached:
+                _DEBUG_CARRIERS.pop(pid)
+
+
+def _add_debug_session(run_state):
+    """Records the run state's carrier as the newest debug session and returns it"""
+    carrier = _get_run_state_carrier(run_state)
+    if carrier is not None:
+        pid = run_state.GetProcessID()
+        _DEBUG_CARRIERS.pop(pid, None)
+        _DEBUG_CARRIERS[pid] = carrier
+        
+    return carrier
+
+
+def _get_run_state_carrier(run_state):
+    """Returns the carrier that owns a debug run state's process, or None
+    
+    Ownership is cached by pid, so only the first lookup for a process
+    builds a psutil.Process and asks the carriers.
+    """
+    if not run_state:
+        return None
+    
+    pid = run_state.GetProcessID()
+    cached = _PROCESS_OWNERS.get(pid)
+    if cached is not None and cached[0].is_running():
+        return cached[1]
+    
+    process = _get_debug_process(run_state)
+    if process is None:
+        return None
+    
+    owner = _find_process_owner(process)
+    _PROCESS_OWNERS[pid] = (process, owner)
+    return owner
+
+
+def _get_debug_carrier():
+    """The carrier of the current debug session, falling back to the most
+    recent other session that is still attached"""
+    global _DEBUG_CARRIER
+    _prune_process_owners()
+    if _DEBUG_CARRIER is not None and _DEBUG_CARRIER not in _DEBUG_CARRIERS.values():
+        _DEBUG_CARRIER = None
+        
+    if _DEBUG_CARRIER is None and _DEBUG_CARRIERS:
+        _DEBUG_CARRIER = list(_DEBUG_CARRIERS.values())[-1]
+        
+    return _DEBUG_CARRIER
+
+
         
 def _debugger_connected(*args, **kwargs):
     global _DEBUG_CARRIER
     if args:
-        process = _get_debug_process(args[0])
-        if process is not None:
-            _DEBUG_CARRIER = _find_process_owner(process)
-        else:
-            _DEBUG_CARRIER = None
+        _DEBUG_CARRIER = _add_debug_session(args[0])
+        if _DEBUG_CARRIER is not None:
+            _DEBUG_CARRIER.ensure_prewarmed()
 
 
     
 def _debugger_changed(*args, **kwargs):
+    """Routes dispatches to whichever debug session Wing made current"""
     global _DEBUG_CARRIER
-    if not args:
+    _prune_process_owners()
+    if not args or not args[0]:
         _DEBUG_CARRIER = None
+    else:
+        _DEBUG_CARRIER = _add_debug_session(args[0])
+
+
+def _prewarm_available():
+    """Pre-warms carriers as soon as their application is up, ahead of the
+    first dispatch, and re-arms them once it exits so a restarted
+    application is warmed again. Runs on a Wing timeout."""
+    for carrier in CARRIERS:
+        if not carrier.prewarm_modules:
+            continue
+        
+        prewarmed = carrier.cache_state()['prewarmed']
+        if not carrier.find_processes():
+            if prewarmed:
+                carrier.reset_handshake()
+        elif not prewarmed and carrier.health_check():
+            carrier.ensure_prewarmed()
+            
+    return True
 
 
 if WING_API_EXISTS:
     debugger = wingapi.gApplication.GetDebugger()
     debugger.Connect('new-runstate', _debugger_connected)
     debugger.Connect('current-runstate-changed', _debugger_changed)
+    if any(carrier.prewarm_modules for carrier in CARRIERS):
+        wingapi.gApplication.InstallTimeout(int(PREWARM_POLL_SECONDS * 1000), _prewarm_available)
@@ -1,2 +1,3 @@
 from .maya import *
-from .cascadeur import * 
\ No newline at end of file
+from .cascadeur import *
+from .loopback import *
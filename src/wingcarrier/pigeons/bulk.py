@@ -0,0 +1,229 @@
+"""Bulk data channel for moving large buffers between the IDE and a DCC.
+
+Data is placed in a shared memory segment (or an mmap-backed file when
+multiprocessing.shared_memory isn't available) and only a small handle dict
+travels over the pigeon's normal transport. The receiving side maps the same
+memory and reads it through a memoryview, so nothing is serialized.
+
+IDE side:
+    pigeon.send_buffer('verts', array.array('f', positions))
+
+DCC side:
+    import wingcarrier.pigeons.bulk as bulk
+    verts = bulk.get('verts')      # memoryview with format 'f'
+"""
+
+import os
+import sys
+import mmap
+import uuid
+import tempfile
+
+SHARED_MEMORY_EXISTS = False
+try:
+    from multiprocessing import shared_memory
+    SHARED_MEMORY_EXISTS = True
+except ImportError:
+    pass
+
+
+BACKEND_SHM = 'shm'
+BACKEND_FILE = 'file'
+
+_PUBLISHED = {}
+"""Buffers this process created, kept alive until release() is called"""
+
+_RECEIVED = {}
+"""Buffers this process attached to, keyed by name"""
+
+
+def default_backend():
+    return BACKEND_SHM if SHARED_MEMORY_EXISTS else BACKEND_FILE
+
+
+def _bulk_dir():
+    path = os.path.join(tempfile.gettempdir(), 'wingcarrier_bulk')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+class BulkBuffer(object):
+    """A named, shared block of memory.
+
+    Use allocate() / publish() to create one and attach() to map one from a
+    handle. The raw bytes are exposed through view, which is cast to the
+    buffer's format and shape.
+
+    Args:
+        handle (dict) : name, backend, key, nbytes, format and shape
+        segment : The SharedMemory or (file, mmap) pair backing the buffer
+        owner (bool) : True if this process created the memory
+    """
+
+    def __init__(self, handle, segment, owner=False):
+        self.handle = handle
+        self._segment = segment
+        self.owner = owner
+
+
+    @property
+    def name(self):
+        return self.handle['name']
+
+
+    @property
+    def raw(self):
+        """A flat, unsigned byte memoryview of the buffer"""
+        if self.handle['backend'] == BACKEND_SHM:
+            memory = self._segment.buf
+        else:
+            memory = memoryview(self._segment[1])
+
+        return memory[:self.handle['nbytes']]
+
+
+    @property
+    def view(self):
+        """A memoryview cast to the buffer's format and shape"""
+        raw = self.raw
+        shape = self.handle.get('shape')
+        fmt = self.handle.get('format', 'B')
+        if fmt == 'B' and not shape:
+            return raw
+
+        return raw.cast(fmt, shape) if shape else raw.cast(fmt)
+
+
+    def close(self):
+        """Unmaps the buffer. Owners also free the underlying memory."""
+        if self._segment is None:
+            return
+
+        if self.handle['backend'] == BACKEND_SHM:
+            self._segment.close()
+            if self.owner:
+                self._segment.unlink()
+        else:
+            f, mapped = self._segment
+            mapped.close()
+            f.close()
+            if self.owner and os.path.exists(self.handle['key']):
+                os.remove(self.handle['key'])
+
+        self._segment = None
+
+
+    def __repr__(self):
+        return 'BulkBuffer({name} {backend} {nbytes} bytes)'.format(**self.handle)
+
+
+
+def allocate(name, nbytes, fmt='B', shape=None, backend=None):
+    """Creates a new buffer this process owns and returns it.
+
+    Fill buffer.view directly to avoid an extra copy of the source data.
+    Any existing buffer published under the same name is released first.
+
+    Args:
+        name (string) : The name the other side will look the buffer up by
+        nbytes (int) : The size of the buffer in bytes
+        fmt (string) : A struct format character for the view, eg 'f'
+        shape (list) : Optional view shape for multi-dimensional data
+        backend (string) : 'shm' or 'file'. Defaults to default_backend()
+    """
+    release(name)
+    backend = backend or default_backend()
+    size = max(int(nbytes), 1)
+
+    if backend == BACKEND_SHM:
+        segment = shared_memory.SharedMemory(create=True, size=size)
+        key = segment.name
+    else:
+        key = os.path.join(_bulk_dir(), '{}_{}.buf'.format(name, uuid.uuid4().hex))
+        f = open(key, 'w+b')
+        f.truncate(size)
+        segment = (f, mmap.mmap(f.fileno(), size))
+
+    handle = {'name': name, 'backend': backend, 'key': key, 'nbytes': int(nbytes),
+              'format': fmt, 'shape': list(shape) if shape else None}
+    buffer = BulkBuffer(handle, segment, owner=True)
+    _PUBLISHED[name] = buffer
+    return buffer
+
+
+def publish(name, data, shape=None, backend=None):
+    """Copies any buffer-protocol object (bytes, array.array, numpy) into a
+    new shared buffer and returns it."""
+    source = memoryview(data)
+    fmt = source.format if source.format else 'B'
+    if shape is None and source.ndim > 1:
+        shape = source.shape
+
+    buffer = allocate(name, source.nbytes, fmt=fmt, shape=shape, backend=backend)
+    buffer.raw[:] = source.cast('B')
+    return buffer
+
+
+def _untrack(segment_name):
+    # Before 3.13 attaching to a segment registers it with the
+    # resource_tracker, which then unlinks it when this process exits
+    # even though we don't own it.
+    if sys.version_info >= (3, 13) or os.name == 'nt':
+        return
+
+    try:
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister('/' + segment_name.lstrip('/'), 'shared_memory')
+    except Exception:
+        pass
+
+
+def attach(handle):
+    """Maps an existing buffer from its handle and returns a BulkBuffer.
+
+    The buffer is stored so get(handle['name']) returns it later.
+    """
+    detach(handle['name'])
+    size = max(handle['nbytes'], 1)
+
+    if handle['backend'] == BACKEND_SHM:
+        if sys.version_info >= (3, 13):
+            segment = shared_memory.SharedMemory(name=handle['key'], track=False)
+        else:
+            segment = shared_memory.SharedMemory(name=handle['key'])
+            _untrack(segment._name)
+    else:
+        f = open(handle['key'], 'r+b')
+        segment = (f, mmap.mmap(f.fileno(), size))
+
+    buffer = BulkBuffer(dict(handle), segment)
+    _RECEIVED[handle['name']] = buffer
+    return buffer
+
+
+def get(name):
+    """Returns the view of a buffer received (or published) under name"""
+    buffer = _RECEIVED.get(name) or _PUBLISHED.get(name)
+    if buffer is None:
+        raise KeyError("No bulk buffer named '{}'".format(name))
+
+    return buffer.view
+
+
+def detach(name):
+    """Unmaps a received buffer. Release views from get() first."""
+    buffer = _RECEIVED.pop(name, None)
+    if buffer is not None:
+        buffer.close()
+
+
+def release(name):
+    """Frees a buffer this process published."""
+    buffer = _PUBLISHED.pop(name, None)
+    if buffer is not None:
+        buffer.close()
+
+
+def names():
+    """Returns the names of all published and received buffers"""
+    return sorted(set(_PUBLISHED) | set(_RECEIVED))
@@ -1,36 +1,39 @@
 import os
 import sys
 import inspect
-import subprocess
 import platform
 
 IS_WINDOWS = 'windows' in platform.platform().lower()
 
+try:
+    import csc
+    CSC_EXISTS = True
+except ImportError:
+    CSC_EXISTS = False
+
 from .pigeon import *
+from .transport import SubprocessTransport, run_process
 
 
 class CascadeurPigeon(Pigeon):
     process_name = "cascadeur.exe"
+    process_patterns = ('cascadeur',)
+    scene_tokens = False
 
     def __init__(self, *args, **kwargs):
         super(CascadeurPigeon, self).__init__(*args, **kwargs)
         self.known_pid = None
+        self.echo_output = False
+        """Print the launcher's output live while send_python_command() runs"""
         
 
     @staticmethod
-    def run_shell_command(cmd):
-        #NOTE: don't use subprocess.check_output(cmd), because in python 3.6+ this error's with a 120 code.
-        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        stdout, stderr = proc.communicate()
-        stdout = CascadeurPigeon.decode(stdout)
-        stderr = CascadeurPigeon.decode(stderr)
-
-        #print(f"casc out:\n{stdout}")
-        #print(f"casc err:\n{stderr}")
-        if proc.returncode:
-            raise Exception('Command Failed:\nreturn code:{0}\nstderr:\n{1}\n'.format(proc.returncode, stderr))
-
-        return(stdout, stderr)
+    def run_shell_command(cmd, echo=False, max_lines=1000):
+        """Runs cmd, returning the last max_lines of (stdout, stderr)
+        
+        See transport.run_process()
+        """
+        return run_process(cmd, echo=echo, max_lines=max_lines, label='casc')
 
 
     @classmethod
@@ -52,27 +55,26 @@ class CascadeurPigeon(Pigeon):
     
     
     def get_own_process(self):
-        return self.process_id(self.process_name)
+        """Returns the pid of a running cascadeur, or None"""
+        processes = self.find_processes()
+        return processes[0].pid if processes else None
 
     
     def get_running_path(self):
         """Return the exe path of any running instance of cascadeur"""
-
-        try:
-            paths = self.find_exe_paths_by_name(self.process_name)
-            return paths[0] if paths else ''
-
-        except ImportError:     
-            if IS_WINDOWS:    
-                pid = self.get_own_process()
-                if pid is None:
-                    return ''
-
-                path = self.get_exe_path_from_pid(pid)
-                return path
-            else:
-                print("Cascadeur exe path can't be found on non-windows Operating system")
-                return ''            
+        processes = self.find_processes()
+        if not processes:
+            return ''
+        
+        if processes[0].exe:
+            return processes[0].exe
+        
+        if IS_WINDOWS:
+            #without psutil the exe has to be looked up separately
+            return self.get_exe_path_from_pid(processes[0].pid) or ''
+        
+        print("Cascadeur exe path can't be found on non-windows Operating system")
+        return ''
     
 
     def can_dispatch(self):
@@ -94,7 +96,7 @@ class CascadeurPigeon(Pigeon):
         Args:
             process (psutils.Process) : The node to remove the data from.  
         """
-        valid_process = 'cascadeur' in process.name()
+        valid_process = self in discovery.match(process.name())
         
         if valid_process:
             self.known_pid = process.pid
@@ -110,52 +112,75 @@ class CascadeurPigeon(Pigeon):
         argument is the current scene, since this is the cascadeur standard.
         """
 
-        print("Calling post module import")
+        log.debug("Calling post module import")
         if hasattr(module, 'run'):
             signature = inspect.signature(module.run)
             if signature.parameters:
                 if CSC_EXISTS:
                     scene = csc.app.get_application().get_scene_manager().current_scene()
-                    module.run(scene)
+                    cls.call_run(module, scene)
                 else:
-                    module.run(None)
+                    cls.call_run(module, None)
             else:
-                module.run()
+                cls.call_run(module)
+                
+                
+    @classmethod
+    def scene_token(cls):
+        """Scene edits can't be detected from python, so cached runs need a
+        runcache.cacheable() token of their own. Runs in Cascadeur."""
+        return None
 
 
-    def send(self, highlighted_text, module_path, file_path, doc_type):            
-        if highlighted_text:
+    def send(self, highlighted_text, module_path, file_path, doc_type, options=None):
+        """Sends through Cascadeur's command line
+        
+        Returns:
+            bool : True if the command was successfully sent.
+        """
+        options = self.resolve_options(options, file_path)
+        if highlighted_text and not options:
             command_string = highlighted_text
         else:
-            command_string = u"import wingcarrier.pigeons; wingcarrier.pigeons.CascadeurPigeon.receive(\'{}\',\'{}\')".format(module_path, file_path)
+            if highlighted_text:
+                #options need the receiver, so selections go through a temp file
+                module_path = ''
+                file_path = self.write_code_file(highlighted_text, file_path, options)
+
+            command_string = u"import wingcarrier.pigeons; wingcarrier.pigeons.CascadeurPigeon.receive(\'{}\',\'{}\'{})".format(
+                module_path, file_path, self.format_options(options))
             
-        self.send_python_command(command_string)  
+        if not self.send_python_command(command_string, options):
+            return False
+        
+        self.follow(options)
+        return True
           
     
-    def send_python_command(self, command_string):
+    def transport_addresses(self):
         exe_path = self.get_running_path()
-        if not exe_path:
-            print('No instance of cascadeur is running')
-            return False
-
-        success = False
-        try: 
-            command = '{}&--run-python-code&{}'.format(exe_path, command_string)
-            CascadeurPigeon.run_shell_command(command.split('&'))
-            success = True
-        except:
-            pass
+        return ['cli:' + exe_path] if exe_path else []
+    
+    
+    def create_transport(self, address):
+        """Cascadeur runs code through its --run-python-code flag"""
+        if not address.startswith('cli:'):
+            return super(CascadeurPigeon, self).create_transport(address)
         
-        return success
+        args = [address[len('cli:'):], '--run-python-code']
+        return SubprocessTransport(args, echo=self.echo_output, label='casc')
 
 
     @staticmethod
-    def receive(module_path, file_path):
+    def receive(module_path, file_path, options=None):
         #special case for when attempting to reload a module from the core cascadeur python library
         if module_path.startswith('python.'):
             module_path = module_path.lstrip('python.')
             
-        if not module_path:
-            CascadeurPigeon.read_file(file_path)
-        else:
-            CascadeurPigeon.import_module(module_path, file_path)
\ No newline at end of file
+        def _work():
+            if not module_path:
+                CascadeurPigeon.read_file(file_path, namespace=(options or {}).get('namespace'))
+            else:
+                CascadeurPigeon.import_module(module_path, file_path)
+                
+        CascadeurPigeon.dispatch(_work, options, module_path)
\ No newline at end of file
@@ -0,0 +1,65 @@
+"""The document details a dispatch is made from, computed on demand.
+
+Reading the selection, finding the module path (a walk up the file's
+parent folders) and normalizing the file path all cost time, and not every
+send needs all of them. A selection sent to Maya never uses the module
+path, for example. DispatchContext only computes a field the first time
+it's read, and Pigeon.context_fields() says which fields a carrier needs.
+"""
+
+from . import log
+
+
+class DispatchContext(object):
+    """Lazily computed dispatch fields.
+
+    Args:
+        loaders (dict) : {field: callable}. A callable returns the field's
+            value, or a dict of values when it computes several fields at
+            once, eg the selection and doc type together.
+        values : Fields that are already known
+    """
+    FIELDS = ('selection', 'doc_type', 'module_path', 'file_path')
+
+    def __init__(self, loaders=None, **values):
+        self._loaders = loaders or {}
+        self._values = values
+
+
+    def get(self, field):
+        if field not in self._values:
+            loader = self._loaders.get(field)
+            value = loader() if loader else ''
+            if isinstance(value, dict):
+                self._values.update(value)
+            else:
+                self._values[field] = value
+            log.debug('dispatch context: {}={!r}'.format(field, self._values.get(field, '')))
+
+        return self._values.get(field, '')
+
+
+    def values(self, fields=FIELDS):
+        """Returns {field: value} for all FIELDS, computing only fields.
+        The others are ''."""
+        return {field: self.get(field) if field in fields else '' for field in self.FIELDS}
+
+
+    @property
+    def selection(self):
+        return self.get('selection')
+
+
+    @property
+    def doc_type(self):
+        return self.get('doc_type')
+
+
+    @property
+    def module_path(self):
+        return self.get('module_path')
+
+
+    @property
+    def file_path(self):
+        return self.get('file_path')
@@ -0,0 +1,86 @@
+"""Limits Wing debugger tracing to the modules being worked on.
+
+While wingdbstub is attached, every line of python the application runs is
+traced, which makes heavy tools much slower. With a debug scope, dispatches
+of modules outside the scope run with tracing suspended and only the
+modules being iterated on are debugged.
+
+The scope is a list of module name prefixes. It comes from the
+'debug_scope' dispatch option, or from set_scope() inside the application
+for every dispatch. Selections sent without a module are always in scope.
+"""
+
+import sys
+import contextlib
+
+
+SCOPE = None
+"""Module prefixes used when a dispatch doesn't set 'debug_scope'"""
+
+
+def set_scope(prefixes):
+    """Only trace dispatches of modules starting with one of prefixes.
+
+    Args:
+        prefixes (list) : Module names, eg ['mytools']. None traces everything
+    """
+    global SCOPE
+    if isinstance(prefixes, str):
+        prefixes = [prefixes]
+    SCOPE = list(prefixes) if prefixes else None
+
+
+def find_debugger():
+    """Returns the attached wingdbstub debugger, or None"""
+    for name, module in list(sys.modules.items()):
+        if name.rpartition('.')[2] == 'wingdbstub':
+            debugger = getattr(module, 'debugger', None)
+            if debugger is not None:
+                return debugger
+
+    return None
+
+
+def in_scope(module_path, scope):
+    """True if module_path should be traced under scope"""
+    if not scope or not module_path:
+        return True
+
+    if isinstance(scope, str):
+        scope = [scope]
+
+    return any(module_path == prefix or module_path.startswith(prefix + '.') for prefix in scope)
+
+
+@contextlib.contextmanager
+def suspended(debugger=None):
+    """Suspends tracing for the block, if a debugger is attached"""
+    debugger = debugger or find_debugger()
+    if debugger is None:
+        yield
+        return
+
+    debugger.SuspendDebug()
+    try:
+        yield
+    finally:
+        debugger.ResumeDebug()
+
+
+def scope_for(module_path, scope=None):
+    """Returns a context that suspends tracing when module_path is out of scope
+
+    Args:
+        module_path (string) : The module being dispatched
+        scope (list) : Module prefixes. Defaults to SCOPE
+    """
+    scope = SCOPE if scope is None else scope
+    if in_scope(module_path, scope):
+        return contextlib.nullcontext()
+
+    debugger = find_debugger()
+    if debugger is None:
+        return contextlib.nullcontext()
+
+    print('wing-carrier: {} is outside the debug scope {}, tracing suspended'.format(module_path, scope))
+    return suspended(debugger)
@@ -0,0 +1,174 @@
+"""Finds the running processes of every carrier in one pass over the process table.
+
+Carriers used to look for their own process, each with its own walk over
+every process on the machine, and a dispatch could make several of those
+walks per carrier (can_dispatch(), finding the exe, ...). discover() walks
+the process table once and matches each process name against every
+carrier's Pigeon.process_patterns at the same time:
+
+    * All the patterns are compiled into one regular expression, so a
+      process no carrier cares about costs a single match.
+    * Matches are memoized per process name, since most names repeat.
+    * Only matching processes have their exe path looked up.
+
+snapshot() keeps the last result for SNAPSHOT_AGE seconds, so every
+carrier asking during one dispatch shares a single pass. Carriers with
+process_patterns register themselves when created.
+"""
+
+import os
+import re
+import time
+import weakref
+import subprocess
+from collections import namedtuple
+
+try:
+    import psutil
+    psutil_exists = True
+except ImportError:
+    psutil_exists = False
+
+
+DiscoveredProcess = namedtuple('DiscoveredProcess', 'pid name exe')
+
+SNAPSHOT_AGE = 0.5
+"""Seconds a snapshot() is reused before the process table is walked again"""
+
+_REGISTRY = weakref.WeakSet()
+_snapshot = (0.0, None, {})
+"""(time, matcher, result) of the last snapshot()"""
+
+
+def register(carrier):
+    """Includes carrier in snapshot() passes"""
+    if carrier.process_patterns:
+        _REGISTRY.add(carrier)
+
+
+
+class Matcher(object):
+    """Matches process names against the process_patterns of many carriers.
+
+    Patterns are regular expressions searched for in the lower case
+    process name, eg 'maya' or r'^cascadeur(\\.exe)?$'.
+
+    Args:
+        carriers (list) : The Pigeons to match for
+    """
+
+    def __init__(self, carriers):
+        self.carriers = [c for c in carriers if c.process_patterns]
+        self._patterns = [re.compile('|'.join('(?:{})'.format(p) for p in c.process_patterns))
+                          for c in self.carriers]
+        self._any = re.compile('|'.join('(?:{})'.format(p.pattern) for p in self._patterns) or r'(?!)')
+        self._memo = {}
+
+
+    def match(self, name):
+        """Returns the carriers whose patterns match a process name"""
+        name = (name or '').lower()
+        carriers = self._memo.get(name)
+        if carriers is None:
+            if self._any.search(name) is None:
+                carriers = ()
+            else:
+                carriers = tuple(c for c, p in zip(self.carriers, self._patterns) if p.search(name))
+            self._memo[name] = carriers
+
+        return carriers
+
+
+
+def _iter_processes():
+    """Yields (pid, name, process) for every running process. process is
+    the psutil.Process, or None without psutil"""
+    if psutil_exists:
+        for process in psutil.process_iter(['name']):
+            yield process.pid, process.info['name'], process
+        return
+
+    if os.name == 'nt':
+        output = subprocess.check_output(['TASKLIST', '/FO', 'CSV', '/NH'])
+        for line in output.decode('utf-8', 'replace').splitlines():
+            fields = [f.strip('"') for f in line.split('","')]
+            if len(fields) > 1 and fields[1].isdigit():
+                yield int(fields[1]), fields[0], None
+    else:
+        output = subprocess.check_output(['ps', '-A', '-o', 'pid=,comm='])
+        for line in output.decode('utf-8', 'replace').splitlines():
+            pid, _, name = line.strip().partition(' ')
+            if pid.isdigit():
+                yield int(pid), os.path.basename(name.strip()), None
+
+
+def _exe(process):
+    if process is None:
+        return ''
+    try:
+        return process.exe()
+    except Exception:
+        # psutil.AccessDenied, NoSuchProcess, ZombieProcess
+        return ''
+
+
+def discover(carriers=None, matcher=None):
+    """Walks the process table once and matches every carrier
+
+    Args:
+        carriers (list) : The Pigeons to find processes for. Defaults to
+            every registered carrier
+        matcher (Matcher) : Reused between calls to keep its memo
+
+    Returns:
+        dict : {carrier: [DiscoveredProcess]} with an entry for every carrier
+    """
+    matcher = matcher or Matcher(list(_REGISTRY) if carriers is None else carriers)
+    result = {carrier: [] for carrier in matcher.carriers}
+    try:
+        for pid, name, process in _iter_processes():
+            owners = matcher.match(name)
+            if owners:
+                found = DiscoveredProcess(pid, name, _exe(process))
+                for carrier in owners:
+                    result[carrier].append(found)
+    except (OSError, subprocess.CalledProcessError) as e:
+        print('wing-carrier: process discovery failed: {}'.format(e))
+
+    return result
+
+
+def _registry_matcher():
+    global _snapshot
+    taken, matcher, result = _snapshot
+    carriers = set(_REGISTRY)
+    if matcher is None or set(matcher.carriers) != carriers:
+        matcher = Matcher(list(carriers))
+        _snapshot = (0.0, matcher, {})
+    return matcher
+
+
+def snapshot(max_age=None):
+    """discover() for every registered carrier, reusing a result younger
+    than max_age seconds (SNAPSHOT_AGE by default)"""
+    global _snapshot
+    max_age = SNAPSHOT_AGE if max_age is None else max_age
+    matcher = _registry_matcher()
+    taken, _, result = _snapshot
+    if time.time() - taken <= max_age:
+        return result
+
+    result = discover(matcher=matcher)
+    _snapshot = (time.time(), matcher, result)
+    return result
+
+
+def processes_for(carrier, max_age=None):
+    """The carrier's running processes from the shared snapshot()"""
+    register(carrier)
+    return snapshot(max_age).get(carrier, [])
+
+
+def match(name):
+    """The registered carriers whose patterns match a process name"""
+    return _registry_matcher().match(name)
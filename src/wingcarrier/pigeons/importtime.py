@@ -0,0 +1,152 @@
+"""Import time profiling for dispatches, like python -X importtime but in process.
+
+When a reload through Pigeon.import_module() is slow it's hard to tell
+which submodule or dependency is responsible. While track_imports() is
+active, importlib's _find_and_load(), which every import statement and
+importlib.import_module() goes through for modules that aren't imported
+yet, is wrapped so each import is timed and nested under the import that
+triggered it.
+
+The report is a tree of modules with their cumulative time (the import and
+everything it imported) and self time (the module's own body), so it shows
+what is worth making a lazy import. The dispatch itself is the root, and
+its self time includes re-running the body of a reloaded module.
+
+Only imports on the dispatching thread are timed.
+"""
+
+import time
+import threading
+import contextlib
+import traceback
+import importlib._bootstrap as _bootstrap
+
+from . import replies
+
+
+def _node(name):
+    return {'name': name, 'cumulative': 0.0, 'self': 0.0, 'children': []}
+
+
+class ImportTimer(object):
+    """Times the imports made by one thread while installed.
+
+    Args:
+        root_name (string) : The label of the tree's root, eg the module
+            being dispatched
+    """
+
+    def __init__(self, root_name='<dispatch>'):
+        self.root = _node(root_name)
+        self.thread_id = threading.get_ident()
+        self._stack = [self.root]
+        self._original = None
+        self._start = 0.0
+
+
+    def _find_and_load(self, name, import_):
+        if threading.get_ident() != self.thread_id:
+            return self._original(name, import_)
+
+        node = _node(name)
+        self._stack[-1]['children'].append(node)
+        self._stack.append(node)
+        start = time.perf_counter()
+        try:
+            return self._original(name, import_)
+        finally:
+            node['cumulative'] = time.perf_counter() - start
+            self._stack.pop()
+
+
+    def install(self):
+        self._original = _bootstrap._find_and_load
+        _bootstrap._find_and_load = self._find_and_load
+        self._start = time.perf_counter()
+
+
+    def uninstall(self):
+        self.root['cumulative'] = time.perf_counter() - self._start
+        if _bootstrap._find_and_load == self._find_and_load:
+            _bootstrap._find_and_load = self._original
+        _finish(self.root)
+
+
+
+def _finish(node):
+    """Fills in self times and sorts children slowest first"""
+    for child in node['children']:
+        _finish(child)
+
+    node['children'].sort(key=lambda child: -child['cumulative'])
+    node['self'] = max(node['cumulative'] - sum(c['cumulative'] for c in node['children']), 0.0)
+
+
+def flatten(tree):
+    """Returns every imported module as a row, slowest first"""
+    rows = []
+
+    def _walk(node, depth):
+        for child in node['children']:
+            rows.append({'name': child['name'], 'cumulative': child['cumulative'],
+                         'self': child['self'], 'depth': depth})
+            _walk(child, depth + 1)
+
+    _walk(tree, 0)
+    return sorted(rows, key=lambda row: -row['cumulative'])
+
+
+@contextlib.contextmanager
+def track_imports(reply_path, module_name='', compress=None):
+    """Times the imports the block makes and writes the tree to reply_path
+
+    Args:
+        reply_path (string) : Where the IDE waits for the report
+        module_name (string) : Labels the root of the tree
+        compress (int) : See replies.write_reply()
+    """
+    timer = ImportTimer(module_name or '<dispatch>')
+    timer.install()
+    try:
+        yield timer
+    finally:
+        try:
+            timer.uninstall()
+            replies.write_reply(reply_path, {'tree': timer.root, 'count': len(flatten(timer.root))},
+                                compress=compress)
+        except Exception as e:
+            replies.write_error(reply_path, 'Import timing failed: {}'.format(e), traceback.format_exc())
+
+
+def format_report(report, min_seconds=0.001, max_depth=8):
+    """Returns the import tree as printable text
+
+    Args:
+        report (dict) : The result from track_imports()
+        min_seconds (float) : Imports faster than this are left out
+        max_depth (int) : How deep the tree is printed
+    """
+    tree = report['tree']
+    lines = ['wing-carrier import time: {} imports, {:.3f}s total'.format(report['count'], tree['cumulative']),
+             '{:>10} {:>10}  {}'.format('cumulative', 'self', 'module')]
+
+    hidden = [0]
+
+    def _walk(node, depth):
+        lines.append('{:>9.1f}ms {:>8.1f}ms  {}{}'.format(
+            node['cumulative'] * 1000.0, node['self'] * 1000.0, '  ' * depth, node['name']))
+        if depth >= max_depth:
+            hidden[0] += len(node['children'])
+            return
+
+        for child in node['children']:
+            if child['cumulative'] < min_seconds:
+                hidden[0] += 1
+                continue
+            _walk(child, depth + 1)
+
+    _walk(tree, 0)
+    if hidden[0]:
+        lines.append('({} faster or deeper imports not shown)'.format(hidden[0]))
+
+    return '\n'.join(lines)
@@ -0,0 +1,44 @@
+"""Level controlled logging for wing-carrier's dispatch path.
+
+Messages go through print() so they show up wherever the IDE or the
+application has redirected stdout (Wing's output panel, Maya's Script
+Editor). The level starts at WINGCARRIER_LOG_LEVEL, INFO by default, and
+DEBUG shows every step of a dispatch.
+"""
+
+import os
+import logging
+
+
+logger = logging.getLogger('wingcarrier')
+
+
+class _PrintHandler(logging.Handler):
+    def emit(self, record):
+        try:
+            print(self.format(record))
+        except Exception:
+            self.handleError(record)
+
+
+if not logger.handlers:
+    _handler = _PrintHandler()
+    _handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(_handler)
+    logger.propagate = False
+    try:
+        logger.setLevel(os.environ.get('WINGCARRIER_LOG_LEVEL', 'INFO').upper())
+    except (ValueError, TypeError):
+        logger.setLevel(logging.INFO)
+        logger.warning('wing-carrier: WINGCARRIER_LOG_LEVEL={!r} is not a level, using INFO'.format(
+            os.environ.get('WINGCARRIER_LOG_LEVEL')))
+
+
+def set_level(level):
+    """Sets the level, eg 'DEBUG', 'INFO' or 'WARNING'"""
+    logger.setLevel(level.upper() if isinstance(level, str) else level)
+
+
+debug = logger.debug
+info = logger.info
+warning = logger.warning
@@ -0,0 +1,219 @@
+"""A carrier whose application is a local python worker process.
+
+LoopbackPigeon starts a plain python process that listens on a local
+transport address (see transport.CommandListener) and runs the same
+receiver logic the DCC pigeons do: receive(), import_module() and
+read_file(). That exercises the whole dispatch pipeline without Maya or
+Cascadeur, so it can be tested, profiled and load tested on any machine.
+
+Unlike the DCC pigeons, send() waits for the worker to finish each
+dispatch, so benchmark() measures complete round trips.
+"""
+
+import os
+import sys
+import time
+import subprocess
+
+from .pigeon import *
+from . import transport as _transport
+
+
+class LoopbackPigeon(Pigeon):
+    local_name = 'wingcarrier_loopback'
+    reply_timeout = 60.0
+    """Seconds send() waits for the worker to finish a dispatch"""
+
+    def __init__(self, *args, **kwargs):
+        super(LoopbackPigeon, self).__init__(*args, **kwargs)
+        self.address = kwargs.get('address') or 'local:{}_{}'.format(self.local_name, os.getpid())
+        self.process = None
+
+
+    @classmethod
+    def get_temp_filename(cls):
+        return('wing_loopback_temp.txt')
+
+
+    def start(self, quiet=False, timeout=10.0):
+        """Starts the worker process and waits for it to listen.
+
+        Args:
+            quiet (bool) : Discard the worker's output, eg when benchmarking
+            timeout (float) : Seconds to wait for the worker
+
+        Returns:
+            bool : True if the worker is ready
+        """
+        if self.running:
+            return True
+
+        #the worker imports this copy of wingcarrier, installed or not
+        src_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(p for p in [src_dir, env.get('PYTHONPATH')] if p)
+        command = 'import wingcarrier.pigeons.loopback as l; l.serve({!r})'.format(self.address)
+        output = subprocess.DEVNULL if quiet else None
+        self.process = subprocess.Popen([sys.executable, '-c', command], env=env, stdin=subprocess.PIPE,
+                                        stdout=output, stderr=output)
+
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline:
+            if self.process.poll() is not None:
+                print('LoopbackPigeon worker exited with code {}'.format(self.process.returncode))
+                return False
+
+            if _transport.create_transport(self.address).health_check():
+                return True
+
+            time.sleep(0.05)
+
+        print('LoopbackPigeon worker did not start within {}s'.format(timeout))
+        self.stop()
+        return False
+
+
+    def stop(self):
+        """Stops the worker process"""
+        if self.process is None:
+            return
+
+        if self.process.poll() is None:
+            self.process.stdin.close()
+            self.process.terminate()
+            try:
+                self.process.wait(5.0)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+        self.process = None
+        kind, target = _transport.parse_address(self.address)
+        if kind == 'unix' and os.path.exists(target):
+            os.remove(target)
+
+
+    @property
+    def running(self):
+        return self.process is not None and self.process.poll() is None
+
+
+    def transport_addresses(self):
+        return [self.address]
+
+
+    def create_transport(self, address):
+        return _transport.create_transport(address, timeout=self.reply_timeout)
+
+
+    def can_dispatch(self):
+        """Check if conditions are right to send code to application
+
+        The worker is never started implicitly, so a LoopbackPigeon is only
+        picked once start() has been called.
+        """
+        return self.running and self.health_check()
+
+
+    def owns_process(self, process):
+        """Returns true if the process is this pigeon's worker"""
+        return self.process is not None and process.pid == self.process.pid
+
+
+    def send(self, highlighted_text, module_path, file_path, doc_type, options=None):
+        """Sends to the worker and waits for it to finish the dispatch
+
+        Returns:
+            bool : True if the worker ran the dispatch
+        """
+        options = self.resolve_options(options, file_path)
+        if highlighted_text:
+            module_path = ''
+            file_path = self.write_code_file(highlighted_text, file_path, options)
+
+        command = u"import wingcarrier.pigeons; wingcarrier.pigeons.LoopbackPigeon.receive(\'{}\',\'{}\'{})".format(
+            module_path, file_path, self.format_options(options))
+
+        transport = self.get_transport()
+        if transport is None:
+            print("Can't connect to the loopback worker!")
+            return False
+
+        try:
+            transport.send(self.encode_command(command, options))
+            reply = self.decode(transport.receive())
+        except TransportError as e:
+            print("{} errored:{}".format(transport, e))
+            return False
+        finally:
+            transport.close()
+
+        if reply.startswith('ERROR:'):
+            print(reply)
+            return False
+
+        self.follow(options)
+        return True
+
+
+    @classmethod
+    def receive(cls, module_path, file_path, options=None):
+        def _work():
+            if not module_path:
+                cls.read_file(file_path, namespace=(options or {}).get('namespace'))
+            else:
+                cls.import_module(module_path, file_path)
+
+        cls.dispatch(_work, options, module_path)
+
+
+    def benchmark(self, count=1000, code='pass', module_path='', file_path='', options=None):
+        """Times count complete dispatches through send()
+
+        Args:
+            count (int) : How many dispatches to send
+            code (string) : Sent as highlighted text when module_path is empty
+            module_path (string) : Import this module on every dispatch instead
+            file_path (string) : The module's file, when module_path is given
+            options (dict) : Dispatch options for every send
+
+        Returns:
+            dict : count, failures, seconds, per_second and latency
+                percentiles in milliseconds
+        """
+        latencies = []
+        failures = 0
+        start = time.perf_counter()
+        for _ in range(count):
+            sent = time.perf_counter()
+            if self.send('' if module_path else code, module_path, file_path, 'python', options=options):
+                latencies.append(time.perf_counter() - sent)
+            else:
+                failures += 1
+
+        seconds = time.perf_counter() - start
+        latencies.sort()
+
+        def percentile(fraction):
+            if not latencies:
+                return 0.0
+            return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] * 1000.0
+
+        return {'count': count, 'failures': failures, 'seconds': seconds,
+                'per_second': len(latencies) / seconds if seconds else 0.0,
+                'p50_ms': percentile(0.5), 'p95_ms': percentile(0.95),
+                'p99_ms': percentile(0.99), 'max_ms': latencies[-1] * 1000.0 if latencies else 0.0}
+
+
+
+def serve(address):
+    """Runs a loopback worker on address until stdin closes.
+
+    The parent holds the worker's stdin open, so the worker exits with it
+    instead of being left behind.
+    """
+    listener = _transport.CommandListener(address).start()
+    print('LoopbackPigeon worker listening on {}'.format(address))
+    try:
+        sys.stdin.read()
+    finally:
+        listener.stop()
@@ -1,5 +1,5 @@
 from .pigeon import *
-import socket
+from .transport import parse_address, CommandListener, run_command, LOCAL_HOSTS
 
 
 #import below are used maya side to receive commands
@@ -18,6 +18,14 @@ except:
 class MayaPigeon(Pigeon):
     command_port = 6000
     host = "127.0.0.1"
+    file_types = ('.mel',)
+    process_patterns = ('maya',)
+    scene_tokens = False
+    local_name = 'wingcarrier_maya'
+    """The local IPC port name (see open_port()). When Maya is on this
+    machine it's tried before TCP. Set to '' to always use TCP."""
+    
+    _listeners = {}
     
     def __init__(self, *args, **kwargs):
         super(MayaPigeon, self).__init__(*args, **kwargs)
@@ -26,24 +34,50 @@ class MayaPigeon(Pigeon):
     @classmethod
     def get_temp_filename(cls):
         return('wing_maya_temp.txt')
-
-
-    def get_socket(self):
-        
-        # The commandPort you opened in userSetup.py Make sure this matches!
-        m_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     
-        # Now ping Maya over the command-port
-        try:
-            m_socket.connect((self.host, self.command_port))
-
-        except Exception as e:
-            print('Connection to Maya failed: {}'.format(e))
-            m_socket.close()
-            m_socket = None
-
-        finally:
-            return m_socket
+    
+    @classmethod
+    def scene_token(cls):
+        """Maya has no change counter that sees every edit, eg setAttr from a
+        script fires no global event, and the undo queue repeats its names
+        for identical edits. So only cacheable() tools with their own token
+        reuse results in Maya. Runs in Maya."""
+        return None
+
+
+    def transport_addresses(self):
+        """The addresses to try, best first. See pigeons/transport.py"""
+        addresses = ['{}:{}'.format(self.host, self.command_port)]
+        if self.local_name and self.host in LOCAL_HOSTS:
+            addresses.insert(0, 'local:' + self.local_name)
+            
+        return addresses
+    
+    
+    @classmethod
+    def open_port(cls, address=None):
+        """Opens a port for the IDE to send commands to. Runs inside Maya.
+        
+        Call this from userSetup.py. Unix sockets and TCP use Maya's own
+        commandPort. Windows named pipes use a CommandListener that runs
+        each command on Maya's main thread.
+        
+        Args:
+            address (string) : Defaults to 'local:' + local_name
+        """
+        address = address or 'local:' + cls.local_name
+        kind, target = parse_address(address)
+        if kind == 'pipe':
+            if address not in cls._listeners:
+                import maya.utils
+                executor = lambda command: maya.utils.executeInMainThreadWithResult(run_command, command)
+                cls._listeners[address] = CommandListener(address, executor).start()
+            return
+        
+        import maya.cmds as cmds
+        name = target if kind == 'unix' else ':{}'.format(target[1])
+        if not cmds.commandPort(name, query=True):
+            cmds.commandPort(name=name, sourceType='python')
 
 
     def can_dispatch(self):
@@ -52,13 +86,7 @@ class MayaPigeon(Pigeon):
         can_dispatch() is used to determine what dispatcher wing will use
         with when there's no active dispatcher found.
         """
-        
-        m_socket = self.get_socket()
-        if m_socket is not None:
-            m_socket.close()
-            return True
-        else:
-            return False
+        return self.health_check()
         
 
     def owns_process(self, process):
@@ -71,17 +99,18 @@ class MayaPigeon(Pigeon):
         Args:
             process (psutils.Process) : The node to remove the data from.  
         """
-        return 'maya' in process.name()
+        return self in discovery.match(process.name())
       
 
     @classmethod
-    def read_file(cls, file_path, doc_type=''):
+    def read_file(cls, file_path, doc_type='', namespace=None):
         """
         Evaluate the temp file on disk, made by Wing, in Maya.
     
         Args:
             file_path (str) : The absolute path to the file to load
             doc_type (str) : Supports either 'python' or 'mel'
+            namespace (str) : Namespace key for python code, see Pigeon.read_file()
         """
         
         print_lines = False
@@ -89,10 +118,10 @@ class MayaPigeon(Pigeon):
             doc_type = 'python'
             
         if doc_type == 'python':
-            super(MayaPigeon, cls).read_file(file_path)
+            super(MayaPigeon, cls).read_file(file_path, namespace=namespace)
             #Pigeon.read_file(file_path)
         else:
-            print("MayaPigeon : Running MEL code from file {}\n".format(file_path))
+            log.debug("MayaPigeon : Running MEL code from file {}".format(file_path))
             if os.access(file_path, os.F_OK):
                 if print_lines:
                     #temp data is likely highlighted code from Wing
@@ -110,21 +139,29 @@ class MayaPigeon(Pigeon):
             
 
     @classmethod
-    def receive(cls, module_path, doc_type, file_path):
-        print("{} {} {}".format(module_path, doc_type, file_path))
-        if not module_path:
-            cls.read_file(file_path, doc_type=doc_type)
+    def receive(cls, module_path, doc_type, file_path, options=None):
+        log.debug("{} {} {}".format(module_path, doc_type, file_path))
+        def _work():
+            if not module_path:
+                cls.read_file(file_path, doc_type=doc_type, namespace=(options or {}).get('namespace'))
 
-        elif 'python' in doc_type:
-            cls.import_module(module_path, file_path)
+            elif 'python' in doc_type:
+                cls.import_module(module_path, file_path)
+                
+        cls.dispatch(_work, options, module_path)
 
 
-    def send(self, highlighted_text, module_path, file_path, doc_type):
-        """The main entry point for sending content from wing to an external app"""
-        m_socket = self.get_socket()
-        if m_socket is None:
+    def send(self, highlighted_text, module_path, file_path, doc_type, options=None):
+        """The main entry point for sending content from wing to an external app
+        
+        Returns:
+            bool : True if the command was successfully sent.
+        """
+        options = self.resolve_options(options, file_path)
+        transport = self.get_transport()
+        if transport is None:
             print("Can't communicate with Maya!")
-            return
+            return False
         
         if 'python' not in doc_type and file_path.endswith('mel'):
             doc_type = 'mel'
@@ -135,34 +172,22 @@ class MayaPigeon(Pigeon):
             if doc_type == 'mel' and not highlighted_text.endswith(';'):
                 highlighted_text += ';'
             
-            file_path = self.write_temp_file(highlighted_text)
+            if doc_type == 'mel':
+                file_path = self.write_temp_file(highlighted_text)
+            else:
+                file_path = self.write_code_file(highlighted_text, file_path, options)
 
         try:
-            command = u"import wingcarrier.pigeons; wingcarrier.pigeons.MayaPigeon.receive(\'{}\',\'{}\',\'{}\')".format(module_path, doc_type, file_path)
-            print(command)
-            m_socket.send( MayaPigeon.encode(command) )
+            command = u"import wingcarrier.pigeons; wingcarrier.pigeons.MayaPigeon.receive(\'{}\',\'{}\',\'{}\'{})".format(
+                module_path, doc_type, file_path, self.format_options(options))
+            log.debug(command)
+            transport.send(self.encode_command(command, options))
         except Exception as e:
-            print("Maya socket errored:{}".format(e))
+            print("Maya {} errored:{}".format(transport, e))
+            return False
             
         finally:
-            m_socket.close()
-            
+            transport.close()
             
-    def send_python_command(self, command_string):
-        m_socket = self.get_socket()
-        if m_socket is None:
-            print("Can't connect to Maya!")
-            return False
-        
-        success = False
-        try:
-            #command = u'python("{}")'.format(command_string)
-            m_socket.send(MayaPigeon.encode(command_string))
-            success = True
-        except Exception as e:
-            print("Maya socket errored:{}".format(e))
-        finally:
-            m_socket.close()
-              
-        return success
-
+        self.follow(options)
+        return True
@@ -0,0 +1,197 @@
+"""Memory accounting and cleanup for repeated dispatches inside a DCC.
+
+Every reload and every exec into __main__ can leave old module objects,
+classes and globals behind. track_memory() takes tracemalloc snapshots
+around a dispatch and reports the net growth and the top allocating sites.
+cleanup() purges what earlier sends left behind: the modules of the package
+being dispatched (so it is imported fresh instead of reloaded over the old
+module dict) and the __main__ globals created by earlier read_file() calls.
+"""
+
+import gc
+import sys
+import time
+import linecache
+import importlib
+import contextlib
+import tracemalloc
+import traceback
+
+import __main__
+
+from . import replies
+
+
+_MAIN_GLOBALS = {}
+"""{source: set of names} that read_file() executions added to __main__"""
+
+
+@contextlib.contextmanager
+def track_main_globals(source):
+    """Records which __main__ globals the block adds, keyed by source"""
+    before = set(__main__.__dict__)
+    try:
+        yield
+    finally:
+        added = set(__main__.__dict__) - before
+        if added:
+            _MAIN_GLOBALS.setdefault(source, set()).update(added)
+
+
+def main_globals():
+    """Returns {source: sorted names} of tracked __main__ globals"""
+    return {source: sorted(names) for source, names in _MAIN_GLOBALS.items()}
+
+
+def purge_main_globals(source=None):
+    """Removes tracked __main__ globals from one source, or all of them.
+
+    Returns:
+        int : The number of names removed
+    """
+    sources = [source] if source else list(_MAIN_GLOBALS)
+    removed = 0
+    for key in sources:
+        for name in _MAIN_GLOBALS.pop(key, ()):
+            if name in __main__.__dict__:
+                del __main__.__dict__[name]
+                removed += 1
+
+    return removed
+
+
+def module_scope(module_name):
+    """The package purge_modules() removes for a dispatched module by default.
+
+    A package is its own scope, a module is scoped to the package it is in,
+    eg studio.tools.rig for studio.tools.rig.build. Sibling packages and the
+    rest of studio stay loaded.
+    """
+    if hasattr(sys.modules.get(module_name), '__path__'):
+        return module_name
+    return module_name.rpartition('.')[0] or module_name
+
+
+def purge_modules(package):
+    """Removes a package and all its submodules.
+
+    The next import then builds new module objects instead of reloading
+    into the old ones, which keeps attributes removed from the source
+    from living on.
+
+    Args:
+        package (string) : The dotted name to purge, eg module_scope()
+
+    Returns:
+        int : The number of modules removed
+    """
+    prefix = package + '.'
+    names = [n for n in sys.modules if n == package or n.startswith(prefix)]
+    for name in names:
+        del sys.modules[name]
+
+    return len(names)
+
+
+def cleanup(module_name='', package=None):
+    """Purges stale modules and __main__ globals from earlier sends.
+
+    Args:
+        module_name (string) : The module being dispatched
+        package (string) : What to purge. Defaults to module_scope(module_name)
+
+    Returns:
+        dict : {'modules': removed module count, 'globals': removed names}
+    """
+    package = package or (module_scope(module_name) if module_name else '')
+    result = {'modules': purge_modules(package) if package else 0,
+              'globals': purge_main_globals()}
+    linecache.clearcache()
+    importlib.invalidate_caches()
+    gc.collect()
+    return result
+
+
+def _site(stat):
+    frame = stat.traceback[0]
+    return '{}:{}'.format(frame.filename, frame.lineno)
+
+
+@contextlib.contextmanager
+def track_memory(reply_path, top=10, module_name='', clean=False, keep_tracing=False, compress=None):
+    """Reports the memory a dispatch leaves behind to reply_path.
+
+    Args:
+        reply_path (string) : The reply file the IDE is waiting on
+        top (int) : How many allocating sites to report
+        module_name (string) : The module being dispatched, used by clean
+        clean (bool) : Run cleanup() before the dispatch. A string is the
+            package to purge instead of the module's own
+        keep_tracing (bool) : Leave tracemalloc running afterwards, so
+            allocations made between dispatches are also traced
+        compress (int) : Compress the report if it is at least this many bytes
+    """
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+
+    gc.collect()
+    modules_before = len(sys.modules)
+    objects_before = len(gc.get_objects())
+    if hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.reset_peak()
+    before = tracemalloc.take_snapshot()
+    start = time.perf_counter()
+
+    cleaned = cleanup(module_name, clean if isinstance(clean, str) else None) if clean else None
+    try:
+        yield
+    finally:
+        try:
+            gc.collect()
+            after = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            filters = [tracemalloc.Filter(False, tracemalloc.__file__),
+                       tracemalloc.Filter(False, __file__)]
+            diff = after.filter_traces(filters).compare_to(before.filter_traces(filters), 'lineno')
+            report = {
+                'duration': time.perf_counter() - start,
+                'net_bytes': sum(stat.size_diff for stat in diff),
+                'peak_bytes': peak,
+                'modules_delta': len(sys.modules) - modules_before,
+                'objects_delta': len(gc.get_objects()) - objects_before,
+                'main_globals': sum(len(names) for names in _MAIN_GLOBALS.values()),
+                'cleanup': cleaned,
+                'top': [{'site': _site(stat), 'size_diff': stat.size_diff, 'count_diff': stat.count_diff}
+                        for stat in diff[:top] if stat.size_diff],
+            }
+            replies.write_reply(reply_path, report, compress=compress)
+        except Exception as e:
+            replies.write_error(reply_path, 'Memory tracking failed: {}'.format(e), traceback.format_exc())
+        finally:
+            if started and not keep_tracing:
+                tracemalloc.stop()
+
+
+def _format_bytes(size):
+    for unit in ('B', 'KB', 'MB'):
+        if abs(size) < 1024:
+            return '{:.1f}{}'.format(size, unit)
+        size /= 1024.0
+
+    return '{:.1f}GB'.format(size)
+
+
+def format_report(report):
+    """Returns a memory report as printable text"""
+    lines = ['wing-carrier memory: net {} peak {} modules {:+d} objects {:+d} tracked __main__ globals {}'.format(
+        _format_bytes(report['net_bytes']), _format_bytes(report['peak_bytes']),
+        report['modules_delta'], report['objects_delta'], report['main_globals'])]
+    if report['cleanup']:
+        lines.append('cleanup removed {modules} modules and {globals} __main__ globals'.format(**report['cleanup']))
+
+    for stat in report['top']:
+        lines.append('{:>12} {:>+8d} blocks  {}'.format(
+            _format_bytes(stat['size_diff']), stat['count_diff'], stat['site']))
+
+    return '\n'.join(lines)
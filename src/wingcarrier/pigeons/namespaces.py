@@ -0,0 +1,108 @@
+"""Reusable execution namespaces for code run by Pigeon.read_file().
+
+By default read_file() runs code in __main__.__dict__, so every snippet
+adds globals to the DCC's main namespace for good. With the 'namespace'
+dispatch option the code runs in a namespace owned by this module instead.
+Sends with the same key reuse it, so earlier state stays warm, and
+discard() throws it away again.
+"""
+
+import sys
+import time
+import builtins
+
+
+_NAMESPACES = {}
+"""{key: Namespace}"""
+
+
+class Namespace(object):
+    """A globals dict plus some bookkeeping about how it's used"""
+
+    def __init__(self, key):
+        self.key = key
+        self.globals = {'__name__': '__main__', '__builtins__': builtins, '__doc__': None}
+        self.created = time.time()
+        self.last_used = self.created
+        self.runs = 0
+
+
+    def touch(self, file_path=''):
+        self.runs += 1
+        self.last_used = time.time()
+        if file_path:
+            self.globals['__file__'] = file_path
+
+
+    def size(self, max_objects=100000):
+        """Estimates the bytes held by the namespace's values.
+
+        Containers are followed recursively, modules and classes are not,
+        and each object is only counted once.
+        """
+        seen = {id(self.globals), id(builtins)}
+        total = sys.getsizeof(self.globals)
+        pending = list(self.globals.values())
+        while pending and len(seen) < max_objects:
+            obj = pending.pop()
+            if id(obj) in seen or isinstance(obj, (type, type(sys))):
+                continue
+
+            seen.add(id(obj))
+            total += sys.getsizeof(obj, 0)
+            if isinstance(obj, dict):
+                pending.extend(obj.keys())
+                pending.extend(obj.values())
+            elif isinstance(obj, (list, tuple, set, frozenset)):
+                pending.extend(obj)
+            elif hasattr(obj, '__dict__') and not callable(obj):
+                pending.append(obj.__dict__)
+
+        return total
+
+
+    def info(self):
+        return {'key': self.key, 'names': len(self.globals), 'bytes': self.size(),
+                'runs': self.runs, 'created': self.created, 'last_used': self.last_used}
+
+
+
+def get(key, create=True):
+    """Returns the globals dict for key, creating it if needed"""
+    namespace = _NAMESPACES.get(key)
+    if namespace is None:
+        if not create:
+            return None
+        namespace = _NAMESPACES[key] = Namespace(key)
+
+    return namespace.globals
+
+
+def use(key, file_path=''):
+    """Returns the globals dict for key and records that it was used"""
+    globals_dict = get(key)
+    _NAMESPACES[key].touch(file_path)
+    return globals_dict
+
+
+def discard(key=None):
+    """Throws away one namespace, or all of them when key is None.
+
+    Returns:
+        int : The number of namespaces removed
+    """
+    if key is None:
+        count = len(_NAMESPACES)
+        _NAMESPACES.clear()
+        return count
+
+    return 1 if _NAMESPACES.pop(key, None) is not None else 0
+
+
+def keys():
+    return sorted(_NAMESPACES)
+
+
+def report():
+    """Returns [info dict] for every namespace, largest first"""
+    return sorted((ns.info() for ns in _NAMESPACES.values()), key=lambda info: -info['bytes'])
@@ -0,0 +1,205 @@
+"""Framing for the temp file payloads that Pigeon.read_file() executes.
+
+A payload is either plain source text (what write_temp_file() has always
+written) or a framed block starting with a 4 byte tag. Framed code payloads
+carry marshalled bytecode compiled IDE side plus the original source, so
+the receiver can skip compiling when its bytecode magic number matches and
+still fall back to the source when it doesn't.
+
+Any payload over a size threshold can also be zlib compressed, which wraps
+it in a ZLIB_TAG frame. Small interactive sends stay uncompressed.
+
+Commands sent over a transport have to stay python source, since the
+receiving end (eg Maya's commandPort) executes what it reads. pack_command()
+replaces a large command with a short one that base64 decodes, inflates and
+executes the original.
+
+Code payload layout:
+    CODE_TAG | magic (4 bytes) | code size (uint32) | marshal data | source
+
+Compressed payload layout:
+    ZLIB_TAG | raw size (uint32) | zlib data
+"""
+
+import sys
+import time
+import base64
+import struct
+import marshal
+import threading
+import importlib.util
+
+ZLIB_EXISTS = False
+try:
+    import zlib
+    ZLIB_EXISTS = True
+except ImportError:
+    pass
+
+
+CODE_TAG = b'WCB1'
+ZLIB_TAG = b'WCZ1'
+_SIZE = struct.Struct('<I')
+
+COMPRESS_THRESHOLD = 16 * 1024
+"""Payloads smaller than this many bytes are sent as is by default. Large
+selections reach it, receive() commands only do for inline code, eg
+query() and send_python_command() calls"""
+
+COMPRESS_LEVEL = 1
+"""zlib level. Low levels get most of the ratio on source and float data
+for a fraction of the time of the higher ones"""
+
+MAGIC_NUMBER = importlib.util.MAGIC_NUMBER
+
+
+def capabilities():
+    """Describes this interpreter so the other side knows what it can send.
+
+    Returns:
+        dict : json-compatible interpreter details
+    """
+    return {
+        'python': list(sys.version_info[:3]),
+        'implementation': sys.implementation.name,
+        'magic': MAGIC_NUMBER.hex(),
+        'payloads': ['code', 'zlib'] if ZLIB_EXISTS else ['code'],
+    }
+
+
+def can_compress(remote_capabilities):
+    """True if the remote interpreter can read zlib payloads"""
+    return ZLIB_EXISTS and 'zlib' in (remote_capabilities or {}).get('payloads', ())
+
+
+def can_send_code(remote_capabilities):
+    """True if bytecode compiled here will load on the remote interpreter"""
+    if not remote_capabilities:
+        return False
+
+    return (remote_capabilities.get('magic') == MAGIC_NUMBER.hex()
+            and remote_capabilities.get('implementation') == sys.implementation.name)
+
+
+def pack_code(source, filename='<wing>'):
+    """Compiles source and returns a framed code payload.
+
+    Raises:
+        SyntaxError : The source doesn't compile. The caller should send the
+        plain source instead so the error is raised in the application.
+    """
+    code = compile(source, filename, 'exec', dont_inherit=True)
+    data = marshal.dumps(code)
+    return b''.join([CODE_TAG, MAGIC_NUMBER, _SIZE.pack(len(data)), data, source.encode('utf-8')])
+
+
+def is_code(data):
+    return data[:4] == CODE_TAG
+
+
+def load_code(data):
+    """Returns (code object or None, source text) from a code payload.
+
+    The code object is None when the payload was compiled by an interpreter
+    with a different bytecode magic number.
+    """
+    magic = data[4:8]
+    size = _SIZE.unpack_from(data, 8)[0]
+    start = 8 + _SIZE.size
+    source = data[start + size:].decode('utf-8')
+    if magic != MAGIC_NUMBER:
+        return None, source
+
+    return marshal.loads(data[start:start + size]), source
+
+
+class CompressionStats(object):
+    """Running totals of how well compression is doing in one direction"""
+
+    def __init__(self):
+        self.count = 0
+        self.raw_bytes = 0
+        self.packed_bytes = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+
+    def record(self, raw_size, packed_size, seconds):
+        with self._lock:
+            self.count += 1
+            self.raw_bytes += raw_size
+            self.packed_bytes += packed_size
+            self.seconds += seconds
+
+
+    @property
+    def ratio(self):
+        """raw / packed. Higher is better, 1.0 means no gain"""
+        return (self.raw_bytes / float(self.packed_bytes)) if self.packed_bytes else 1.0
+
+
+    def summary(self):
+        return {'count': self.count, 'raw_bytes': self.raw_bytes, 'packed_bytes': self.packed_bytes,
+                'ratio': self.ratio, 'seconds': self.seconds}
+
+
+
+STATS = {'send': CompressionStats(), 'reply': CompressionStats()}
+"""Compression totals for payloads this process sent and replies it read"""
+
+
+def compress(data, threshold=COMPRESS_THRESHOLD, level=COMPRESS_LEVEL, stats=None):
+    """Returns data wrapped in a zlib frame if it is at least threshold bytes.
+
+    Data that doesn't get smaller is returned unchanged.
+    """
+    if not ZLIB_EXISTS or threshold is None or len(data) < threshold:
+        return data
+
+    start = time.perf_counter()
+    packed = zlib.compress(data, level)
+    seconds = time.perf_counter() - start
+    if len(packed) + 8 >= len(data):
+        return data
+
+    if stats is not None:
+        stats.record(len(data), len(packed) + 8, seconds)
+
+    return b''.join([ZLIB_TAG, _SIZE.pack(len(data)), packed])
+
+
+def pack_command(command, threshold=COMPRESS_THRESHOLD, level=COMPRESS_LEVEL, stats=None):
+    """Returns a command that runs command from a compressed copy, if that is
+    shorter. Commands under threshold characters are returned unchanged."""
+    if threshold is None or len(command) < threshold:
+        return command
+
+    data = compress(command.encode('utf-8'), threshold, level, stats)
+    if not is_compressed(data):
+        return command
+
+    packed = ("exec(__import__('wingcarrier.pigeons.payload', fromlist=['unpack_command'])"
+              ".unpack_command({!r}))".format(base64.b64encode(data).decode('ascii')))
+    return packed if len(packed) < len(command) else command
+
+
+def unpack_command(encoded):
+    """Returns the source of a pack_command() command. Runs in the application."""
+    return decompress(base64.b64decode(encoded)).decode('utf-8')
+
+
+def is_compressed(data):
+    return data[:4] == ZLIB_TAG
+
+
+def decompress(data, stats=None):
+    """Unwraps a zlib frame. Anything else is returned unchanged."""
+    if not is_compressed(data):
+        return data
+
+    start = time.perf_counter()
+    raw = zlib.decompress(data[8:])
+    if stats is not None:
+        stats.record(len(raw), len(data), time.perf_counter() - start)
+
+    return raw
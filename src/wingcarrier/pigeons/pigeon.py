@@ -1,10 +1,36 @@
 import sys
 import os
+import ast
 import importlib
+import threading
+import contextlib
 import subprocess
+import warnings
+import traceback
 
 import __main__
 
+from .sync import PackageSync, find_package_root
+from . import bulk
+from . import replies
+from .replies import QueryError
+from . import stream
+from . import profiling
+from . import memory
+from . import importtime
+from . import runcache
+from . import tasks
+from . import discovery
+from . import namespaces
+from . import payload
+from . import recorder
+from . import debugging
+from . import log
+from . import tempstore
+from . import prewarm as _prewarm
+from . import transport as _transport
+from .transport import TransportError
+
 
 psutil_exists = False
 try:
@@ -15,8 +41,45 @@ except:
 
 
 class Pigeon(object):
+    LOCAL_OPTIONS = ('follow', 'follow_timeout', 'bytecode', 'bytecode_threshold')
+    """Dispatch options that only matter IDE side and aren't sent"""
+    
+    THREAD_UNSAFE_OPTIONS = ('profile', 'memory', 'import_time')
+    """Options that hook process wide state, so worker dispatches, which
+    can run alongside other code, don't support them"""
+    
+    file_types = ()
+    """File extensions this pigeon is preferred for when choosing a carrier,
+    eg ('.mel',). See pigeons/selection.py"""
+    
+    process_patterns = ()
+    """Regular expressions searched for in lower case process names to find
+    the application, eg ('maya',). See pigeons/discovery.py"""
+    
+    scene_tokens = True
+    """False when scene_token() returns None, so the 'run_cache' option
+    only caches runcache.cacheable() runs that have their own token"""
+    
+    prewarm_modules = ()
+    """Modules imported in the application as soon as it's found, eg
+    ('numpy', 'PySide2.QtWidgets'). See prewarm()"""
+    
+    transport_address = ''
+    """Overrides the addresses from transport_addresses(), eg 'loopback:'.
+    See pigeons/transport.py for the address formats."""
+    
     def __init__(self, *args, **kwargs):
-        pass
+        self.dispatch_options = {}
+        """Default options merged into every send(). See resolve_options()"""
+        self._capabilities = None
+        self._handshake_thread = None
+        self._last_address = None
+        if kwargs.get('transport_address'):
+            self.transport_address = kwargs['transport_address']
+        if kwargs.get('prewarm_modules'):
+            self.prewarm_modules = tuple(kwargs['prewarm_modules'])
+        self._prewarmed = False
+        discovery.register(self)
     
     
     @staticmethod
@@ -35,10 +98,21 @@ class Pigeon(object):
             return output.encode('latin-1')        
         
     
+    def encode_command(self, command_string, options=None):
+        """Encodes a command for transport.send(), zlib compressed when the
+        resolved options have 'compress' and it's at least that many bytes"""
+        compress = (options or {}).get('compress')
+        if compress:
+            command_string = payload.pack_command(command_string, compress, stats=payload.STATS['send'])
+        return self.encode(command_string)
+    
+    
     @classmethod
     def get_temp_filename(cls):
         """the name of the temporary file wing will use in write_temp_file()
         
+        write_temp_file() adds a content hash before the extension.
+        
         Sub-classes can override this is they want a unique name for their
         Pigeon.
         """
@@ -46,46 +120,112 @@ class Pigeon(object):
     
 
     @classmethod
-    def get_temp_filepath(cls):
-        """Returns the full path of the temp file on the local system."""
-        return os.path.join(os.environ['TMP'], cls.get_temp_filename())
+    def get_temp_filepath(cls, txt=None):
+        """Returns the path write_temp_file() uses for txt.
+        
+        The temp store names files by content, so without txt there is no
+        single temp file any more. That form is deprecated and only returns
+        get_temp_filename() inside the store directory.
+        
+        Args:
+            txt (string or bytes) : The text that is or will be written
+        
+        Returns:
+            string : The file path, with forward slashes
+        """
+        if txt is None:
+            warnings.warn('{}.get_temp_filepath() without txt is deprecated, write_temp_file() names '
+                          'files by content'.format(cls.__name__), DeprecationWarning, stacklevel=2)
+            return os.path.join(tempstore.get_store_dir(), cls.get_temp_filename()).replace('\\', '/')
+        
+        data = txt if isinstance(txt, bytes) else Pigeon.encode(txt)
+        prefix, suffix = os.path.splitext(cls.get_temp_filename())
+        return tempstore.content_path(data, prefix, suffix or '.txt')
 
 
     @classmethod
     def write_temp_file(cls, txt):
-        """writes the input text to the get_temp_filepath()"""
-    
-        # Save the text to a temp file. If we're dealing with mel, make sure it
-        # ends with a semicolon, or Maya could become angered!
-        #txt = get_wing_text()
-        temp_path = cls.get_temp_filepath()
-        f = open(temp_path, "wb")
+        """writes the input text (or payload bytes) to the temp store
+        
+        Files are named by content (see pigeons/tempstore.py), so concurrent
+        sends never overwrite each other and re-sending the same text
+        reuses the file that's already there.
+        
+        Returns:
+            string : The file path, with forward slashes
+        """
+        data = txt if isinstance(txt, bytes) else Pigeon.encode(txt)
+        prefix, suffix = os.path.splitext(cls.get_temp_filename())
+        temp_path = tempstore.store(data, prefix, suffix or '.txt')
+        log.debug('writing temp file:{}'.format(temp_path))
+        return temp_path
     
-        print('writing temp file:{}'.format(temp_path))
-        f.write(Pigeon.encode(txt))
     
-        f.close()
-
-        temp_path = temp_path.replace("\\", "/")
-        return temp_path
+    def write_code_file(self, source, file_path='', options=None):
+        """Writes python source to the temp file, precompiled when possible.
+        
+        When options has 'bytecode' set, the source is at least
+        'bytecode_threshold' characters (default 4096) and the handshake()
+        shows the application's bytecode matches ours, the code is compiled
+        here so the application only has to unmarshal it. Sends made before
+        the handshake has answered go as source. See known_capabilities()
+        
+        With 'compress' the stored payload, the bytes the application reads
+        back, is zlib compressed once it's at least that many bytes.
+        
+        Args:
+            source (string) : The python code to send
+            file_path (string) : The file the code came from, used in tracebacks
+            options (dict) : The resolved send options
+        """
+        options = options or {}
+        data = None
+        threshold = options.get('bytecode_threshold', 4096)
+        if options.get('bytecode') and len(source) >= threshold:
+            if payload.can_send_code(self.known_capabilities()):
+                try:
+                    data = payload.pack_code(source, file_path or '<wing>')
+                except SyntaxError:
+                    pass
+                
+        if data is None:
+            data = Pigeon.encode(source)
+            
+        if options.get('compress'):
+            data = payload.compress(data, options['compress'], stats=payload.STATS['send'])
+            
+        return self.write_temp_file(data)
     
     
     @staticmethod
-    def read_file(file_path):
+    def read_file(file_path, namespace=None):
         """Executes the python code stored in the file path.
         
         Args:
             file_path (string) : The absolute file path of the py file to read
-        
+            namespace (string) : Run in the pigeons.namespaces namespace with
+            this key instead of __main__. 
         """
         
-        print("WING: executing code from file {}\n".format(file_path))
+        log.debug("WING: executing code from file {}".format(file_path))
         if os.access(file_path, os.F_OK):
             # execute the file contents in Maya:
             with open(file_path, "rb") as f:
-                data = f.read()
+                data = payload.decompress(f.read())
+                
+            if payload.is_code(data):
+                code, data = payload.load_code(data)
+                if code is not None:
+                    data = code
+            else:
                 data = Pigeon.decode(data)
-                exec(data, __main__.__dict__, __main__.__dict__) 
+                
+            if namespace:
+                globals_dict = namespaces.use(namespace, file_path)
+                exec(data, globals_dict, globals_dict)
+            else:
+                with memory.track_main_globals(file_path):
+                    exec(data, __main__.__dict__, __main__.__dict__)
 
         else:
             print("No Wing-generated temp file exists: " + file_path)
@@ -104,7 +244,26 @@ class Pigeon(object):
             module : The module that was imported/reloaded from import_module()
         """
         if hasattr(module, 'run'):
-            module.run()
+            cls.call_run(module)
+            
+            
+    @classmethod
+    def scene_token(cls):
+        """Returns a value that changes whenever the application's scene does.
+        Runs in the application.
+        
+        Used to key cached run() results (see pigeons/runcache.py). The
+        default '' suits applications without a scene. Return None when
+        scene changes can't be detected, so results aren't reused.
+        """
+        return ''
+    
+    
+    @classmethod
+    def call_run(cls, module, *args):
+        """Calls module.run(*args), reusing the last result when the run is
+        cached and neither the module's source nor the scene changed"""
+        return runcache.call(module, args, cls.scene_token)
             
             
     @classmethod
@@ -121,14 +280,13 @@ class Pigeon(object):
             file_path (string) : The absolute file path to the py file.
         """
         
-        print('\n')
         imported = module_name in sys.modules
         if imported:
-            print('reloading module:{0}'.format(module_name))
+            log.debug('reloading module:{0}'.format(module_name))
             importlib.reload(sys.modules[module_name])
         else:
             try:
-                print('Attempting module import of:{0}'.format(module_name))
+                log.debug('Attempting module import of:{0}'.format(module_name))
                 importlib.import_module(module_name)
             except ModuleNotFoundError as e:
                 print(f"module import failed:  reading file instead.  Error:{e}")
@@ -149,6 +307,16 @@ class Pigeon(object):
         raise NotImplementedError
     
     
+    def find_processes(self, max_age=None):
+        """Returns the application's running processes as
+        discovery.DiscoveredProcess (pid, name, exe) tuples
+        
+        Every registered carrier is found in the same walk over the process
+        table, which is shared for discovery.SNAPSHOT_AGE seconds.
+        """
+        return discovery.processes_for(self, max_age)
+    
+    
     def owns_process(self, process):
         """Returns true if the process is the pigeon's target application
         
@@ -162,22 +330,698 @@ class Pigeon(object):
         raise NotImplementedError
     
 
-    def send(self, highlighted_text, module_path, file_path, doc_type):
+    def context_fields(self, selection=''):
+        """The DispatchContext fields send() needs. See pigeons/context.py
+        
+        The default skips the module path for selections, since they're
+        sent as code rather than imported.
+        
+        Args:
+            selection (string) : The highlighted text, if any
+        """
+        if selection:
+            return ('selection', 'doc_type', 'file_path')
+        
+        return ('selection', 'doc_type', 'file_path', 'module_path')
+    
+
+    def send(self, highlighted_text, module_path, file_path, doc_type, options=None):
         """The main entry point for sending content from wing to an external app
         
         sub-classes should override this with application specfic logic for how
-        the data is sent to an external application.        
+        the data is sent to an external application. options are passed
+        through resolve_options() and on to the receiver's dispatch_scope().
+        
+        Returns:
+            bool : True if the command was successfully sent.
         """
         raise NotImplementedError
     
     
-    def send_python_command(self, command_string):
+    def transport_addresses(self):
+        """The addresses to try when connecting, best first.
+        
+        sub-classes should override this with the application's addresses.
+        A configured transport_address replaces them.
+        """
+        return []
+    
+    
+    def create_transport(self, address):
+        """Returns an unconnected Transport for one of transport_addresses()
+        
+        sub-classes can override this to configure the transport further.
+        """
+        return _transport.create_transport(address)
+    
+    
+    def get_transport(self):
+        """Returns a connected Transport to the application, or None"""
+        addresses = [self.transport_address] if self.transport_address else self.transport_addresses()
+        
+        #whatever worked last time is tried first
+        if self._last_address in addresses:
+            addresses.remove(self._last_address)
+            addresses.insert(0, self._last_address)
+        
+        errors = []
+        for address in addresses:
+            transport = self.create_transport(address)
+            try:
+                transport.connect()
+            except TransportError as e:
+                errors.append(str(e))
+                continue
+            
+            self._last_address = address
+            return transport
+        
+        print('Connection to {} failed: {}'.format(self.__class__.__name__, ' | '.join(errors) or 'no address'))
+        return None
+    
+    
+    def health_check(self):
+        """Returns True if any transport to the application works right now"""
+        transport = self.get_transport()
+        if transport is None:
+            return False
+        
+        transport.close()
+        return True
+    
+    
+    def send_python_command(self, command_string, options=None):
         """Send a custom python command to the target application
         
+        Args:
+            command_string (string) : The python code to run
+            options (dict) : Resolved send options, see encode_command()
+        
         Returns:
             bool : True if the command was successfully sent.        
         """
-        raise NotImplementedError
+        transport = self.get_transport()
+        if transport is None:
+            print("Can't connect to {}!".format(self.__class__.__name__))
+            return False
+        
+        success = False
+        try:
+            transport.send(self.encode_command(command_string, options))
+            success = True
+        except TransportError as e:
+            print("{} errored:{}".format(transport, e))
+        finally:
+            transport.close()
+        
+        return success
+    
+    
+    def sync_package(self, package_dir, archive=False, sync_root=None, force=False):
+        """Mirror a package tree into a location the application can import.
+        
+        Only files whose content hash changed since the last sync are
+        written. The synced location is then added to the application's
+        sys.path and the package's modules are purged, so the next
+        import_module() loads the whole package from the synced sources.
+        
+        Args:
+            package_dir (string) : The absolute path of the package (or any
+            file inside it).
+            archive (bool) : Sync into a zipimport archive instead of a folder
+            sync_root (string) : Overrides the default sync directory
+            force (bool) : Write every file regardless of the last sync
+        
+        Returns:
+            SyncResult : What was written, or None if the package wasn't found.
+        """
+        if os.path.isfile(package_dir):
+            package_dir = find_package_root(package_dir)
+            
+        if not package_dir:
+            print('wing-carrier: nothing to sync, file is not part of a package')
+            return None
+        
+        result = PackageSync(package_dir, sync_root=sync_root, archive=archive).sync(force=force)
+        print('wing-carrier: synced {}'.format(result))
+        
+        command = "import wingcarrier.pigeons.sync; wingcarrier.pigeons.sync.register_sync_location({!r}, {!r}, purge={})".format(
+            result.location.replace('\\', '/'), result.package, result.dirty)
+        
+        if not self.send_python_command(command):
+            print("wing-carrier: couldn't register the sync location")
+            
+        return result
+    
+    
+    def resolve_options(self, options=None, file_path=''):
+        """Merges per-send options over dispatch_options. Runs IDE side.
+        
+        Supported options:
+            stream (bool) : Stream the application's stdout/stderr back
+            profile (string) : Run under 'cprofile' or 'sample' profiling
+            and report the result. True is the same as 'cprofile'.
+            profile_top (int) : How many functions the profile report lists
+            memory (bool) : Report the memory the dispatch leaves behind
+            memory_top (int) : How many allocating sites the report lists
+            run_cache (bool) : Reuse the last result of the module's run()
+            when its source and the scene are unchanged. False turns off
+            caching of runcache.cacheable() runs too. Pigeons without
+            scene_tokens only cache runs with a cacheable() token, and
+            say so. See pigeons/runcache.py
+            worker (bool) : Run the dispatch on the application's task pool
+            instead of the thread it arrives on, printing its progress. Only
+            for code that doesn't touch the UI. See pigeons/tasks.py
+            task_timeout (float) : Seconds before a worker dispatch is
+            cancelled
+            import_time (bool) : Report a tree of how long each module the
+            dispatch imported took. See pigeons/importtime.py
+            timing (bool) : Report how long the dispatch ran in the
+            application. Turned on while a session is recorded
+            debug_scope (list) : Module prefixes to keep the Wing debugger
+            tracing. Dispatches of other modules run with tracing
+            suspended. See pigeons/debugging.py
+            cleanup (bool) : Purge the dispatched module's own package (see
+            memory.module_scope()) and the __main__ globals left by earlier
+            sends before running. A string names the package to purge
+            instead, eg 'studio.tools'
+            namespace (string) : Run read_file() code in a reusable namespace
+            instead of __main__. 'file' (or True) keys it by file_path,
+            any other string is used as the key, eg a session name.
+            bytecode (bool) : Send selections precompiled when possible. See
+            write_code_file()
+            compress (int) : zlib compress selection payloads, commands sent
+            over the transport and replies of at least this many bytes. True
+            uses payload.COMPRESS_THRESHOLD. Dropped until the handshake() shows
+            the application can read them. See known_capabilities()
+            follow (string) : 'background' (default) or 'block' to wait
+            for streamed output and reports before send() returns.
+            follow_timeout (float) : Seconds to wait for the streamed output
+            and each report before giving up. Defaults to an hour
+        
+        Returns:
+            dict : The options, with values the receiver needs filled in.
+        """
+        replies.prune_stale()
+        resolved = dict(self.dispatch_options)
+        resolved.update(options or {})
+        if resolved.get('worker'):
+            for key in self.THREAD_UNSAFE_OPTIONS:
+                if resolved.pop(key, None):
+                    print("wing-carrier: '{}' isn't supported by worker dispatches, ignored".format(key))
+                    
+        if resolved.get('stream') is True:
+            resolved['stream'] = replies.new_reply_path('.stream')
+            
+        if resolved.get('profile'):
+            if resolved['profile'] is True:
+                resolved['profile'] = 'cprofile'
+            resolved['profile_reply'] = replies.new_reply_path('.profile')
+            
+        if resolved.get('memory'):
+            resolved['memory_reply'] = replies.new_reply_path('.memory')
+            
+        if resolved.get('worker'):
+            resolved['task_status'] = replies.new_reply_path('.task')
+            resolved['task_id'] = os.path.splitext(os.path.basename(resolved['task_status']))[0]
+            
+        if resolved.get('import_time'):
+            resolved['import_time_reply'] = replies.new_reply_path('.imports')
+            
+        if resolved.get('timing'):
+            resolved['timing_reply'] = replies.new_reply_path('.timing')
+            
+        if resolved.get('compress'):
+            if not payload.can_compress(self.known_capabilities()):
+                resolved.pop('compress')
+            elif resolved['compress'] is True:
+                resolved['compress'] = payload.COMPRESS_THRESHOLD
+                
+        if resolved.get('run_cache') and not self.scene_tokens:
+            log.info("wing-carrier: {} can't tell when its scene changes, 'run_cache' only caches "
+                     "runcache.cacheable(token=...) runs".format(self.__class__.__name__))
+            
+        if resolved.get('namespace') in (True, 'file'):
+            resolved['namespace'] = 'file:' + file_path.replace('\\', '/')
+            
+        return resolved
+    
+    
+    @classmethod
+    def format_options(cls, options):
+        """Returns the options argument to add to a receive() command string"""
+        sent = {k: v for k, v in options.items() if k not in cls.LOCAL_OPTIONS}
+        if not sent:
+            return ''
+        
+        return ', options={!r}'.format(sent)
+    
+    
+    def collect(self, options, timeout=None):
+        """Shows the streamed output and reports requested by options
+        
+        Args:
+            options (dict) : The options from resolve_options()
+            timeout (float) : Seconds to wait for each of them. Defaults to
+            the 'follow_timeout' option, or an hour
+        """
+        if timeout is None:
+            timeout = options.get('follow_timeout') or 3600.0
+            
+        task_thread = None
+        if options.get('task_status'):
+            task_thread = threading.Thread(target=self.report_task, args=(options['task_status'], timeout))
+            task_thread.daemon = True
+            task_thread.start()
+            
+        if options.get('stream'):
+            prefix = '{}> '.format(self.__class__.__name__)
+            stream.follow_output(options['stream'], prefix=prefix, timeout=timeout)
+            
+        if options.get('profile_reply'):
+            self.report_profile(options['profile_reply'], options.get('profile_top', 25), timeout)
+            
+        if options.get('memory_reply'):
+            self.report_memory(options['memory_reply'], timeout)
+            
+        if options.get('import_time_reply'):
+            self.report_import_time(options['import_time_reply'], timeout)
+            
+        if options.get('timing_reply'):
+            self.report_timing(options['timing_reply'], timeout)
+            
+        if task_thread is not None:
+            task_thread.join()
+    
+    
+    def report_profile(self, reply_path, top=25, timeout=3600.0):
+        """Prints a profile result and saves its collapsed stacks next to it
+        
+        Returns:
+            dict : The profile result. See pigeons/profiling.py
+        """
+        try:
+            result = replies.wait_for_reply(reply_path, timeout)
+        except (QueryError, TimeoutError) as e:
+            print('wing-carrier: no profile result: {}'.format(e))
+            return None
+        
+        collapsed_path = profiling.save_collapsed(result, os.path.splitext(reply_path)[0] + '.collapsed')
+        print(profiling.format_report(result, top))
+        print('collapsed stacks ({}): {}'.format(result['collapsed_units'], collapsed_path))
+        if result['stats_path']:
+            print('pstats file: {}'.format(result['stats_path']))
+            
+        return result
+    
+    
+    def report_memory(self, reply_path, timeout=3600.0):
+        """Prints a memory report. See pigeons/memory.py"""
+        try:
+            report = replies.wait_for_reply(reply_path, timeout)
+        except (QueryError, TimeoutError) as e:
+            print('wing-carrier: no memory report: {}'.format(e))
+            return None
+        
+        print(memory.format_report(report))
+        return report
+    
+    
+    def report_import_time(self, reply_path, timeout=3600.0):
+        """Prints an import time tree. See pigeons/importtime.py"""
+        try:
+            report = replies.wait_for_reply(reply_path, timeout)
+        except (QueryError, TimeoutError) as e:
+            print('wing-carrier: no import time report: {}'.format(e))
+            return None
+        
+        print(importtime.format_report(report))
+        return report
+    
+    
+    def report_task(self, status_path, timeout=3600.0):
+        """Prints a worker dispatch's progress until it finishes
+        
+        Returns:
+            dict : The task's final status. See pigeons/tasks.py
+        """
+        return tasks.follow_status(status_path, '{} task: '.format(self.__class__.__name__), timeout)
+    
+    
+    def cancel_tasks(self, task_id=None, force=False):
+        """Cancels a worker dispatch, or all of them, in the application
+        
+        Args:
+            task_id (string) : The 'task_id' from resolve_options(). None
+            cancels every unfinished task
+            force (bool) : Raise TaskCancelled in tasks that don't reach a
+            checkpoint()
+        """
+        command = 'import wingcarrier.pigeons.tasks; wingcarrier.pigeons.tasks.cancel({!r}, {!r})'.format(task_id, force)
+        return self.send_python_command(command)
+    
+    
+    def report_timing(self, reply_path, timeout=3600.0):
+        """Prints how long a dispatch took in the application and records it
+        when a session is being recorded. See pigeons/recorder.py"""
+        try:
+            report = replies.wait_for_reply(reply_path, timeout)
+        except (QueryError, TimeoutError) as e:
+            print('wing-carrier: no timing report: {}'.format(e))
+            return None
+        
+        print('wing-carrier: dispatch ran for {:.1f}ms in {}'.format(report['seconds'] * 1000.0, self.__class__.__name__))
+        recorder.record_timing(self, report)
+        return report
+    
+    
+    def follow(self, options):
+        """Collects any output or reports for a send() that was just made.
+        
+        Returns:
+            Thread : The background collector, or None if it ran in place.
+        """
+        if not any(options.get(key) for key in ('stream', 'profile_reply', 'memory_reply', 'import_time_reply', 'timing_reply',
+                                               'task_status')):
+            return None
+        
+        if options.get('follow') == 'block':
+            self.collect(options)
+            return None
+        
+        thread = threading.Thread(target=self.collect, args=(options,))
+        thread.daemon = True
+        thread.start()
+        return thread
+    
+    
+    @classmethod
+    @contextlib.contextmanager
+    def dispatch_scope(cls, options=None, module_path=''):
+        """Wraps the work done by a receive() call. Runs in the application.
+        
+        Every receiver side dispatch option is applied here, so sub-classes
+        only need to run their receive logic inside this context.
+        
+        Args:
+            options (dict) : The options from resolve_options()
+            module_path (string) : The module being dispatched, if any
+        """
+        options = options or {}
+        with contextlib.ExitStack() as stack:
+            stack.enter_context(debugging.scope_for(module_path, options.get('debug_scope')))
+            stack.enter_context(runcache.dispatch_option(options.get('run_cache')))
+            
+            if options.get('timing_reply'):
+                stack.enter_context(recorder.time_to(options['timing_reply'], module_path))
+                
+            if options.get('stream'):
+                stack.enter_context(stream.capture_output(options['stream'],
+                                                          catch_all=not options.get('task_status')))
+                
+            if options.get('memory_reply'):
+                stack.enter_context(memory.track_memory(
+                    options['memory_reply'], options.get('memory_top', 10),
+                    module_name=module_path, clean=options.get('cleanup', False),
+                    compress=options.get('compress')))
+            elif options.get('cleanup'):
+                package = options['cleanup'] if isinstance(options['cleanup'], str) else None
+                print('wing-carrier cleanup: {}'.format(memory.cleanup(module_path, package)))
+                
+            if options.get('import_time_reply'):
+                stack.enter_context(importtime.track_imports(
+                    options['import_time_reply'], module_path, compress=options.get('compress')))
+                
+            if options.get('profile_reply'):
+                stack.enter_context(profiling.profile_to(
+                    options['profile_reply'], options.get('profile', 'cprofile'), options.get('profile_top', 25),
+                    compress=options.get('compress')))
+                
+            yield stack
+            
+            
+    @classmethod
+    def dispatch(cls, work, options=None, module_path=''):
+        """Runs work inside dispatch_scope(). Runs in the application.
+        
+        With the 'worker' option it's queued on the task pool and this
+        returns right away, otherwise it runs on the calling thread.
+        
+        Args:
+            work (callable) : The receive logic, called with no arguments
+            options (dict) : The options from resolve_options()
+            module_path (string) : The module being dispatched, if any
+        """
+        options = options or {}
+        
+        def _run():
+            with cls.dispatch_scope(options, module_path):
+                work()
+                
+        if options.get('task_status'):
+            return tasks.submit(_run, options['task_id'], options.get('task_timeout'),
+                                options['task_status'], module_path or 'selection')
+        
+        _run()
+        
+        
+    @classmethod
+    def capabilities(cls):
+        """Describes the application's interpreter. Runs in the application."""
+        return payload.capabilities()
+    
+    
+    def handshake(self, timeout=2.0, refresh=False):
+        """Returns the application's capabilities(), asking only once
+        
+        The answer is cached on the pigeon. A failed handshake is cached as
+        an empty dict so later sends don't wait on it again; call
+        reset_handshake() when the application is restarted.
+        """
+        if self._capabilities is None or refresh:
+            try:
+                self._capabilities = self.query(
+                    'import wingcarrier.pigeons; wingcarrier.pigeons.{}.capabilities()'.format(
+                        self.__class__.__name__), timeout, compress=False)
+            except (QueryError, TimeoutError, ConnectionError) as e:
+                print('wing-carrier: handshake with {} failed: {}'.format(self.__class__.__name__, e))
+                self._capabilities = {}
+                
+        return self._capabilities
+    
+    
+    def handshake_async(self):
+        """Runs handshake() on a background thread unless it already answered
+        
+        Returns:
+            Thread : The thread making the handshake, or None if it's cached
+        """
+        if self._capabilities is not None:
+            return None
+        
+        if self._handshake_thread is None or not self._handshake_thread.is_alive():
+            self._handshake_thread = threading.Thread(target=self.handshake)
+            self._handshake_thread.daemon = True
+            self._handshake_thread.start()
+            
+        return self._handshake_thread
+    
+    
+    def known_capabilities(self):
+        """The cached handshake() answer without waiting for it
+        
+        The first call starts the handshake in the background and returns
+        None, so options that depend on it are skipped for that send rather
+        than blocking it for up to the handshake's timeout.
+        """
+        if self._capabilities is None:
+            self.handshake_async()
+        return self._capabilities
+    
+    
+    def cache_state(self):
+        """The IDE side state this pigeon keeps between sends. See pigeons/status.py"""
+        return {'address': self._last_address, 'handshake': self._capabilities is not None,
+                'prewarmed': self._prewarmed}
+    
+    
+    def reset_handshake(self):
+        self._capabilities = None
+        self._prewarmed = False
+        
+        
+    @classmethod
+    def warm(cls, modules, reply_path='', threaded=True):
+        """Imports modules in the background. Runs in the application.
+        See pigeons/prewarm.py"""
+        _prewarm.warm(modules, reply_path, threaded)
+        
+        
+    def prewarm(self, modules=None, threaded=True, timeout=600.0):
+        """Imports modules in the application and reports how long each took
+        
+        The report is printed from a background thread once the application
+        finishes, so this returns right away.
+        
+        Args:
+            modules (list) : Defaults to prewarm_modules
+            threaded (bool) : Import on a background thread in the application
+            timeout (float) : Seconds to wait for the report
+        
+        Returns:
+            Thread : The thread waiting on the report, or None if nothing was sent
+        """
+        modules = list(modules or self.prewarm_modules)
+        if not modules:
+            return None
+        
+        reply_path = replies.new_reply_path('.prewarm')
+        command = 'import wingcarrier.pigeons; wingcarrier.pigeons.{}.warm({!r}, {!r}, {!r})'.format(
+            self.__class__.__name__, modules, reply_path, threaded)
+        if not self.send_python_command(command):
+            return None
+        
+        def _report():
+            try:
+                report = replies.wait_for_reply(reply_path, timeout)
+            except (QueryError, TimeoutError) as e:
+                print('wing-carrier: no prewarm report: {}'.format(e))
+                return
+            print(_prewarm.format_report(report, self.__class__.__name__))
+            
+        thread = threading.Thread(target=_report)
+        thread.daemon = True
+        thread.start()
+        return thread
+    
+    
+    def ensure_prewarmed(self):
+        """Runs prewarm() once per application session. Dispatchers call
+        this when they find the application. reset_handshake() re-arms it."""
+        if self._prewarmed or not self.prewarm_modules:
+            return None
+        
+        thread = self.prewarm()
+        self._prewarmed = thread is not None
+        return thread
+        
+        
+    def compression_report(self):
+        """Returns compression totals for sent payloads and read replies"""
+        return {direction: stats.summary() for direction, stats in payload.STATS.items()}
+    
+    
+    @classmethod
+    def evaluate(cls, code):
+        """Runs code in __main__ and returns the value of its last expression
+        
+        Any statements before a trailing expression are executed first, so
+        'import maya.cmds as mc; mc.ls()' returns the ls() result.
+        """
+        tree = ast.parse(code, mode='exec')
+        namespace = __main__.__dict__
+        if not tree.body or not isinstance(tree.body[-1], ast.Expr):
+            exec(compile(tree, '<wing-query>', 'exec'), namespace, namespace)
+            return None
+        
+        last = ast.Expression(tree.body.pop().value)
+        if tree.body:
+            exec(compile(tree, '<wing-query>', 'exec'), namespace, namespace)
+            
+        return eval(compile(last, '<wing-query>', 'eval'), namespace, namespace)
+    
+    
+    @classmethod
+    def answer(cls, code, reply_path, compress=None):
+        """Evaluates code and writes the result to reply_path. Runs in the app.
+        
+        Args:
+            code (string) : The expression (or statements ending in one) to run
+            reply_path (string) : The file the IDE is waiting on
+            compress (int) : Compress results of at least this many bytes
+        """
+        try:
+            value = cls.evaluate(code)
+        except Exception as e:
+            replies.write_error(reply_path, '{}: {}'.format(type(e).__name__, e), traceback.format_exc())
+            return
+            
+        replies.write_reply(reply_path, value, compress=compress)
+    
+    
+    def query(self, code, timeout=30.0, compress=None):
+        """Evaluates code in the target application and returns the result
+        
+        The result is pickled inside the application and read back through
+        a reply file (see pigeons/replies.py), so anything picklable can be
+        returned, eg query('mc.xform("pCube1", q=True, ws=True, t=True)').
+        
+        Args:
+            code (string) : An expression, or statements ending in one
+            timeout (float) : Seconds to wait for the application to answer
+            compress (int) : Have results of at least this many bytes
+            compressed. Defaults to the 'compress' of dispatch_options.
+        
+        Raises:
+            QueryError : The code raised inside the application
+            TimeoutError : No answer arrived within timeout
+            ConnectionError : The command couldn't be sent
+        """
+        if compress is None and self.dispatch_options.get('compress'):
+            compress = self.resolve_options({'compress': self.dispatch_options['compress']}).get('compress')
+            
+        reply_path = replies.new_reply_path()
+        command = "import wingcarrier.pigeons; wingcarrier.pigeons.{}.answer({!r}, {!r}{})".format(
+            self.__class__.__name__, code, reply_path, ', compress={!r}'.format(compress) if compress else '')
+        
+        if not self.send_python_command(command):
+            raise ConnectionError("Couldn't send the query to {}".format(self.__class__.__name__))
+        
+        return replies.wait_for_reply(reply_path, timeout)
+    
+    
+    def namespace_report(self, timeout=30.0):
+        """Returns the application's execution namespaces, largest first
+        
+        Returns:
+            list : [{'key', 'names', 'bytes', 'runs', 'created', 'last_used'}]
+        """
+        return self.query('import wingcarrier.pigeons.namespaces; wingcarrier.pigeons.namespaces.report()', timeout)
+    
+    
+    def discard_namespace(self, key=None):
+        """Throws away one of the application's namespaces, or all of them"""
+        command = "import wingcarrier.pigeons.namespaces; wingcarrier.pigeons.namespaces.discard({!r})".format(key)
+        return self.send_python_command(command)
+    
+    
+    def send_buffer(self, name, data, shape=None, backend=None):
+        """Share a large buffer with the application without serializing it.
+        
+        The data is copied once into shared memory and only its handle is
+        sent. Application side code reads it with
+        wingcarrier.pigeons.bulk.get(name).
+        
+        Args:
+            name (string) : The name the application looks the buffer up by
+            data : Any buffer-protocol object (bytes, array.array, numpy)
+            shape (list) : Optional view shape for multi-dimensional data
+            backend (string) : 'shm' or 'file'. See bulk.default_backend()
+        
+        Returns:
+            bool : True if the handle was successfully sent.
+        """
+        buffer = bulk.publish(name, data, shape=shape, backend=backend)
+        command = "import wingcarrier.pigeons.bulk; wingcarrier.pigeons.bulk.attach({!r})".format(buffer.handle)
+        return self.send_python_command(command)
+    
+    
+    def release_buffer(self, name):
+        """Detach a buffer on the application side and free it locally"""
+        command = "import wingcarrier.pigeons.bulk; wingcarrier.pigeons.bulk.detach({!r})".format(name)
+        success = self.send_python_command(command)
+        bulk.release(name)
+        return success
     
     
     @staticmethod
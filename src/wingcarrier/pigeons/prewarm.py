@@ -0,0 +1,84 @@
+"""Imports a carrier's heavy modules in the application ahead of dispatches.
+
+The first dispatch of a tool that pulls in numpy, PySide or a large
+in-house library pays for those imports while the user waits. A pigeon's
+prewarm_modules are imported as soon as the application is found instead,
+on a background thread inside the application, and the time each one took
+is reported back to the IDE. Later dispatches only pay for the user's own
+code.
+"""
+
+import sys
+import time
+import importlib
+import threading
+import traceback
+
+from . import replies
+
+
+def import_modules(modules):
+    """Imports modules in order and returns [(name, seconds, error)]
+
+    Modules that are already imported take no time and are reported as such.
+    """
+    results = []
+    for name in modules:
+        if name in sys.modules:
+            results.append((name, 0.0, ''))
+            continue
+
+        start = time.perf_counter()
+        try:
+            importlib.import_module(name)
+            error = ''
+        except Exception as e:
+            error = '{}: {}'.format(e.__class__.__name__, e)
+        results.append((name, time.perf_counter() - start, error))
+
+    return results
+
+
+def warm(modules, reply_path='', threaded=True):
+    """Imports modules and writes the timings to reply_path. Runs in the application.
+
+    Args:
+        modules (list) : Module names to import
+        reply_path (string) : Where the IDE waits for the report, if anywhere
+        threaded (bool) : Import on a background thread so the application
+            stays responsive. Use False for modules that must be imported
+            on the main thread.
+    """
+    def _warm():
+        try:
+            start = time.perf_counter()
+            results = import_modules(modules)
+            report = {'seconds': time.perf_counter() - start, 'modules': results}
+            if reply_path:
+                replies.write_reply(reply_path, report)
+        except Exception as e:
+            if reply_path:
+                replies.write_error(reply_path, 'Prewarm failed: {}'.format(e), traceback.format_exc())
+
+    if not threaded:
+        _warm()
+        return
+
+    thread = threading.Thread(target=_warm, name='wing-carrier-prewarm')
+    thread.daemon = True
+    thread.start()
+
+
+def format_report(report, carrier=''):
+    """Returns a prewarm report as printable text"""
+    lines = ['wing-carrier prewarm{}: {} modules in {:.2f}s'.format(
+        ' ' + carrier if carrier else '', len(report['modules']), report['seconds'])]
+    for name, seconds, error in sorted(report['modules'], key=lambda r: -r[1]):
+        if error:
+            lines.append('{:>9} {}  FAILED {}'.format('', name, error))
+        elif seconds:
+            lines.append('{:>8.3f}s {}'.format(seconds, name))
+        else:
+            lines.append('{:>9} {}  (already imported)'.format('', name))
+
+    return '\n'.join(lines)
@@ -0,0 +1,218 @@
+"""Profiles dispatched code inside the DCC and reports back to the IDE.
+
+Two modes are supported:
+    cprofile : Deterministic profiling with cProfile. Gives exact call
+        counts and times. The collapsed stacks are estimated from the
+        caller/callee graph.
+    sample : A background thread samples the dispatching thread's stack
+        every interval seconds. Lower overhead and exact stacks, but no
+        call counts.
+
+Either way the receiver writes a result dict through replies.write_reply()
+with the aggregated stats, the top functions and a collapsed stack text
+that flamegraph.pl, speedscope and similar tools load directly.
+"""
+
+import os
+import sys
+import time
+import pstats
+import cProfile
+import threading
+import contextlib
+import traceback
+from collections import Counter, defaultdict
+
+from . import replies
+
+
+MODES = ('cprofile', 'sample')
+
+
+def _label(filename, lineno, name):
+    # collapsed stacks use ';' between frames and ' ' before the count
+    base = os.path.splitext(os.path.basename(filename))[0] if filename else ''
+    label = '{}:{}'.format(base, name) if base and base != '~' else name
+    return label.replace(';', ':').replace(' ', '_')
+
+
+class SamplingProfiler(object):
+    """Samples one thread's stack from a background thread.
+
+    Args:
+        interval (float) : Seconds between samples
+        thread_id (int) : The thread to sample. Defaults to the caller's
+    """
+
+    def __init__(self, interval=0.005, thread_id=None):
+        self.interval = interval
+        self.thread_id = thread_id or threading.get_ident()
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+
+    def _run(self):
+        own_file = __file__.rstrip('c')
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                if code.co_filename.rstrip('c') != own_file:
+                    stack.append(_label(code.co_filename, frame.f_lineno, code.co_name))
+                frame = frame.f_back
+
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='wing-carrier-sampler')
+        self._thread.daemon = True
+        self._thread.start()
+
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+    def collapsed(self):
+        return '\n'.join('{} {}'.format(stack, count) for stack, count in self.samples.most_common())
+
+
+    def rows(self):
+        """Per function self/total sample counts converted to seconds"""
+        own = Counter()
+        total = Counter()
+        for stack, count in self.samples.items():
+            frames = stack.split(';')
+            own[frames[-1]] += count
+            for name in set(frames):
+                total[name] += count
+
+        return [{'function': name, 'ncalls': None,
+                 'tottime': own[name] * self.interval,
+                 'cumtime': total[name] * self.interval} for name in total]
+
+
+
+def _cprofile_rows(stats):
+    rows = []
+    for (filename, lineno, name), (cc, nc, tt, ct, callers) in stats.stats.items():
+        rows.append({'function': _label(filename, lineno, name),
+                     'location': '{}:{}'.format(filename, lineno) if filename != '~' else '',
+                     'ncalls': nc, 'tottime': tt, 'cumtime': ct})
+
+    return rows
+
+
+def _cprofile_collapsed(stats, max_depth=64, min_share=1e-6):
+    """Estimates collapsed stacks from cProfile's caller graph.
+
+    Each function's own time is split between its callers in proportion
+    to the time each caller spent in it, then walked up to the roots.
+    Shares smaller than min_share seconds are dropped to bound the walk.
+    """
+    entries = stats.stats
+    weights = defaultdict(float)
+
+    def _walk(func, path, share, depth):
+        if share < min_share:
+            return
+
+        cc, nc, tt, ct, callers = entries[func]
+        path = path + (func,)
+        callers = {c: v for c, v in callers.items() if c in entries and c not in path}
+        if not callers or depth >= max_depth:
+            weights[tuple(reversed(path))] += share
+            return
+
+        # caller values are (cc, nc, tt, ct) of this function under that caller
+        total = sum(v[3] for v in callers.values()) or float(len(callers))
+        for caller, values in callers.items():
+            part = (values[3] / total) if total else 1.0 / len(callers)
+            _walk(caller, path, share * part, depth + 1)
+
+    for func, (cc, nc, tt, ct, callers) in entries.items():
+        if tt > 0:
+            _walk(func, (), tt, 0)
+
+    lines = []
+    for path, seconds in sorted(weights.items(), key=lambda item: -item[1]):
+        micros = int(seconds * 1e6)
+        if micros:
+            lines.append('{} {}'.format(';'.join(_label(*func) for func in path), micros))
+
+    return '\n'.join(lines)
+
+
+def top_functions(rows, top=25, sort='cumtime'):
+    return sorted(rows, key=lambda row: row[sort] or 0, reverse=True)[:top]
+
+
+@contextlib.contextmanager
+def profile_to(reply_path, mode='cprofile', top=25, interval=0.005, compress=None):
+    """Profiles the block and writes the result to reply_path.
+
+    A pstats file is also written next to the reply when using cprofile,
+    for anyone that wants to load it in snakeviz or pstats directly.
+    """
+    if mode not in MODES:
+        mode = 'cprofile'
+
+    profiler = cProfile.Profile() if mode == 'cprofile' else SamplingProfiler(interval)
+    start = time.perf_counter()
+    if mode == 'cprofile':
+        profiler.enable()
+    else:
+        profiler.start()
+
+    try:
+        yield profiler
+    finally:
+        duration = time.perf_counter() - start
+        try:
+            if mode == 'cprofile':
+                profiler.disable()
+                stats = pstats.Stats(profiler)
+                stats_path = reply_path + '.prof'
+                stats.dump_stats(stats_path)
+                rows = _cprofile_rows(stats)
+                collapsed = _cprofile_collapsed(stats)
+                units = 'microseconds'
+            else:
+                profiler.stop()
+                stats_path = ''
+                rows = profiler.rows()
+                collapsed = profiler.collapsed()
+                units = 'samples'
+
+            replies.write_reply(reply_path, {
+                'mode': mode, 'duration': duration, 'stats_path': stats_path,
+                'stats': rows, 'top': top_functions(rows, top),
+                'collapsed': collapsed, 'collapsed_units': units}, compress=compress)
+        except Exception as e:
+            replies.write_error(reply_path, 'Profiling failed: {}'.format(e), traceback.format_exc())
+
+
+def format_report(result, top=25):
+    """Returns the top functions of a profile result as a printable table"""
+    lines = ['wing-carrier profile ({mode}) total {duration:.3f}s'.format(**result),
+             '{:>10} {:>10} {:>10}  {}'.format('ncalls', 'tottime', 'cumtime', 'function')]
+    for row in result['top'][:top]:
+        ncalls = '' if row['ncalls'] is None else row['ncalls']
+        lines.append('{:>10} {:>10.4f} {:>10.4f}  {}  {}'.format(
+            ncalls, row['tottime'], row['cumtime'], row['function'], row.get('location', '')).rstrip())
+
+    return '\n'.join(lines)
+
+
+def save_collapsed(result, path):
+    """Writes the collapsed stacks of a profile result to path"""
+    with open(path, 'w') as f:
+        f.write(result['collapsed'])
+        f.write('\n')
+
+    return path
@@ -0,0 +1,305 @@
+"""Records dispatch sessions and replays them against a carrier.
+
+While recording, every dispatch made by the IDE dispatchers is appended to
+a json lines log with its wall clock time, carrier, module path, document
+type, options and payload. Payload text is stored once per unique content
+and referenced by hash, so a session that re-sends the same selection many
+times stays small. Logs ending in .gz are gzip compressed.
+
+The log stays open while recording and is flushed after every event, so
+it can be read while the session is still running.
+
+Recording also turns on the 'timing' dispatch option, so the receiver
+reports how long each dispatch took inside the application and that is
+logged next to the dispatch.
+
+replay() drives any carrier, a real DCC or a LoopbackPigeon, with the
+recorded dispatches at the original pace or as fast as possible. Module
+dispatches import the module as it is on disk at replay time.
+
+    python -m wingcarrier.pigeons.recorder session.jsonl.gz --carrier loopback --fast
+"""
+
+import os
+import sys
+import zlib
+import gzip
+import json
+import atexit
+import time
+import hashlib
+import threading
+import contextlib
+
+from . import log
+from . import replies
+
+
+_ACTIVE = None
+"""The Recorder dispatches are logged to, if any"""
+
+
+def _open(path, mode):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+
+    return open(path, mode, encoding='utf-8')
+
+
+def _carrier_name(carrier):
+    return carrier if isinstance(carrier, str) else carrier.__class__.__name__
+
+
+class Recorder(object):
+    """Appends dispatch events to a log file.
+
+    Args:
+        path (string) : The log file. Appended to if it already exists
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+        self._payloads = set()
+        if os.path.exists(path):
+            for event in load(path):
+                if event['event'] == 'payload':
+                    self._payloads.add(event['hash'])
+
+
+    def _write(self, event):
+        with self._lock:
+            if self._file is None:
+                self._file = _open(self.path, 'a')
+            self._file.write(json.dumps(event, separators=(',', ':')) + '\n')
+            self._file.flush()
+
+
+    def close(self):
+        """Closes the log. Writing another event opens it again"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+    def _payload_hash(self, text):
+        if not text:
+            return ''
+
+        digest = hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+        if digest not in self._payloads:
+            self._payloads.add(digest)
+            self._write({'event': 'payload', 'hash': digest, 'text': text})
+
+        return digest
+
+
+    def record_dispatch(self, carrier, highlighted_text, module_path, file_path, doc_type, options=None):
+        """Logs one dispatch, before it is sent"""
+        self._write({'event': 'dispatch', 'time': time.time(), 'carrier': _carrier_name(carrier),
+                     'module_path': module_path, 'file_path': file_path, 'doc_type': doc_type,
+                     'payload': self._payload_hash(highlighted_text), 'options': options or {}})
+
+
+    def record_timing(self, carrier, report):
+        """Logs the receiver's timing report for a dispatch"""
+        event = {'event': 'timing', 'time': time.time(), 'carrier': _carrier_name(carrier)}
+        event.update(report)
+        self._write(event)
+
+
+
+def start_recording(path):
+    """Starts logging dispatches to path. Returns the Recorder"""
+    global _ACTIVE
+    if _ACTIVE is not None:
+        _ACTIVE.close()
+    _ACTIVE = Recorder(path)
+    print('wing-carrier: recording dispatches to {}'.format(path))
+    return _ACTIVE
+
+
+def stop_recording():
+    """Stops logging dispatches. Returns the log path, or '' if not recording"""
+    global _ACTIVE
+    path = _ACTIVE.path if _ACTIVE else ''
+    if _ACTIVE is not None:
+        _ACTIVE.close()
+    _ACTIVE = None
+    if path:
+        print('wing-carrier: recording saved to {}'.format(path))
+    return path
+
+
+def active():
+    return _ACTIVE
+
+
+def record_dispatch(carrier, highlighted_text, module_path, file_path, doc_type, options=None):
+    """Logs a dispatch if recording. Returns options, with 'timing' added
+    while recording so the receiver's timing is logged too."""
+    if _ACTIVE is None:
+        return options
+
+    _ACTIVE.record_dispatch(carrier, highlighted_text, module_path, file_path, doc_type, options)
+    options = dict(options or {})
+    options['timing'] = True
+    return options
+
+
+def record_timing(carrier, report):
+    if _ACTIVE is not None:
+        _ACTIVE.record_timing(carrier, report)
+
+
+@contextlib.contextmanager
+def time_to(reply_path, module_path=''):
+    """Reports how long the block took to reply_path. Runs in the application."""
+    started = time.time()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        replies.write_reply(reply_path, {'seconds': time.perf_counter() - start, 'started': started,
+                                         'module_path': module_path})
+
+
+def load(path):
+    """Returns the list of events in a log"""
+    events = []
+    with _open(path, 'r') as f:
+        try:
+            for line in f:
+                if line.strip():
+                    events.append(json.loads(line))
+        except (EOFError, OSError, zlib.error):
+            # a gzip log that is still being written, or whose process died
+            # while recording, has no end marker. Every event before it was
+            # flushed whole.
+            log.debug('wing-carrier: {} has no gzip end marker, read {} events'.format(path, len(events)))
+
+    return events
+
+
+def _close_active():
+    if _ACTIVE is not None:
+        _ACTIVE.close()
+
+
+atexit.register(_close_active)
+
+
+def dispatches(events):
+    """Yields the dispatch events of a log with their payload text filled in"""
+    payloads = {}
+    for event in events:
+        if event['event'] == 'payload':
+            payloads[event['hash']] = event['text']
+        elif event['event'] == 'dispatch':
+            event = dict(event)
+            event['text'] = payloads.get(event['payload'], '')
+            yield event
+
+
+def replay(path, carrier, speed=1.0, options=None):
+    """Sends every dispatch in a log to carrier.
+
+    Args:
+        path (string) : The log file
+        carrier (Pigeon) : Where to send, regardless of the recorded carrier
+        speed (float) : 1.0 keeps the recorded pace, 2.0 is twice as fast.
+            0 sends as fast as possible
+        options (dict) : Merged over each dispatch's recorded options, eg
+            {'follow': 'block'} to wait for each dispatch's output
+
+    Returns:
+        dict : count, failures, seconds and the send time of each dispatch
+    """
+    send_times = []
+    failures = 0
+    start = time.perf_counter()
+    first_time = None
+    for event in dispatches(load(path)):
+        if first_time is None:
+            first_time = event['time']
+
+        if speed:
+            delay = (event['time'] - first_time) / speed - (time.perf_counter() - start)
+            if delay > 0:
+                time.sleep(delay)
+
+        send_options = dict(event['options'])
+        send_options.update(options or {})
+        sent = time.perf_counter()
+        try:
+            result = carrier.send(event['text'], event['module_path'], event['file_path'],
+                                  event['doc_type'], options=send_options)
+        except Exception as e:
+            print('wing-carrier replay: dispatch failed: {}'.format(e))
+            result = False
+
+        send_times.append(time.perf_counter() - sent)
+        if result is False:
+            failures += 1
+
+    return {'count': len(send_times), 'failures': failures,
+            'seconds': time.perf_counter() - start, 'send_times': send_times}
+
+
+def summary(path):
+    """Returns per carrier dispatch counts and receiver timing totals for a log"""
+    result = {}
+    for event in load(path):
+        if event['event'] not in ('dispatch', 'timing'):
+            continue
+
+        stats = result.setdefault(event['carrier'], {'dispatches': 0, 'timed': 0, 'seconds': 0.0, 'max': 0.0})
+        if event['event'] == 'dispatch':
+            stats['dispatches'] += 1
+        else:
+            stats['timed'] += 1
+            stats['seconds'] += event['seconds']
+            stats['max'] = max(stats['max'], event['seconds'])
+
+    return result
+
+
+def main(args=None):
+    import argparse
+    from . import maya, cascadeur, loopback
+
+    parser = argparse.ArgumentParser(description='Replay a recorded wing-carrier dispatch session')
+    parser.add_argument('log', help='The recorded .jsonl or .jsonl.gz file')
+    parser.add_argument('--carrier', default='loopback', choices=['loopback', 'maya', 'cascadeur'])
+    parser.add_argument('--speed', type=float, default=1.0, help='Pace multiplier. Ignored with --fast')
+    parser.add_argument('--fast', action='store_true', help='Send as fast as possible')
+    parsed = parser.parse_args(args)
+
+    if parsed.carrier == 'loopback':
+        carrier = loopback.LoopbackPigeon()
+        if not carrier.start(quiet=True):
+            return 1
+    elif parsed.carrier == 'maya':
+        carrier = maya.MayaPigeon()
+    else:
+        carrier = cascadeur.CascadeurPigeon()
+
+    try:
+        result = replay(parsed.log, carrier, 0 if parsed.fast else parsed.speed, {'follow': 'block'})
+    finally:
+        if parsed.carrier == 'loopback':
+            carrier.stop()
+
+    times = sorted(result['send_times']) or [0.0]
+    print('replayed {count} dispatches ({failures} failed) in {seconds:.3f}s'.format(**result))
+    print('send time: median {:.1f}ms max {:.1f}ms'.format(times[len(times) // 2] * 1000.0, times[-1] * 1000.0))
+    for name, stats in summary(parsed.log).items():
+        print('recorded {}: {} dispatches, {} timed, {:.3f}s in the application'.format(
+            name, stats['dispatches'], stats['timed'], stats['seconds']))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,236 @@
+"""Reply files used to send results from a DCC back to the IDE.
+
+Every Pigeon transport only goes one way, so results travel back through a
+reply file the IDE names up front. The receiver pickles the result with
+protocol 5 and writes out-of-band buffers (numpy arrays, bytearrays, ...)
+straight to the file after the pickle stream. The IDE maps the file and
+hands memoryview slices of it to pickle.loads(), so large buffers are never
+copied into intermediate bytes objects.
+
+When the IDE negotiated compression, replies over the threshold have the
+pickle stream and each buffer zlib compressed instead. That costs the
+zero-copy read but is far cheaper over slow links.
+
+File layout:
+    MAGIC | header size (uint32) | json header | pickle stream | buffers...
+"""
+
+import os
+import json
+import mmap
+import time
+import uuid
+import pickle
+import struct
+import tempfile
+
+from . import payload as _payload
+
+MAGIC = b'WCR1'
+_SIZE = struct.Struct('<I')
+
+PROTOCOL = min(5, pickle.HIGHEST_PROTOCOL)
+"""Protocol 5 adds out-of-band buffers. Older DCC pythons fall back in-band"""
+
+PRUNE_INTERVAL = 600.0
+"""Minimum seconds between the prune_replies() calls made by prune_stale()"""
+
+_last_prune = 0.0
+
+
+class QueryError(Exception):
+    """Raised IDE side when the expression failed inside the application"""
+
+    def __init__(self, message, remote_traceback=''):
+        super(QueryError, self).__init__(message)
+        self.remote_traceback = remote_traceback
+
+
+def get_reply_dir():
+    path = os.path.join(tempfile.gettempdir(), 'wingcarrier_replies')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def new_reply_path(suffix='.reply'):
+    """Returns a unique reply file path for a new request"""
+    return os.path.join(get_reply_dir(), uuid.uuid4().hex + suffix).replace('\\', '/')
+
+
+def _write(reply_path, header, payload=b'', buffers=()):
+    header['buffers'] = [memoryview(b).nbytes for b in buffers]
+    header['payload'] = len(payload)
+    header_bytes = json.dumps(header).encode('utf-8')
+
+    # write next to the target and rename so the IDE never sees a partial file
+    temp_path = reply_path + '.part'
+    with open(temp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(_SIZE.pack(len(header_bytes)))
+        f.write(header_bytes)
+        f.write(payload)
+        for buffer in buffers:
+            f.write(buffer)
+
+    os.replace(temp_path, reply_path)
+
+
+def write_reply(reply_path, value, compress=None, **extra):
+    """Pickles value into reply_path. Runs inside the application.
+
+    Args:
+        reply_path (string) : The file path the IDE is waiting on
+        value : Any picklable object
+        compress (int) : zlib compress replies of at least this many bytes.
+            None never compresses
+        extra : Additional json-compatible header fields, eg timings
+    """
+    buffers = []
+    try:
+        if PROTOCOL >= 5:
+            payload = pickle.dumps(value, protocol=PROTOCOL,
+                                   buffer_callback=lambda b: buffers.append(b.raw()))
+        else:
+            payload = pickle.dumps(value, protocol=PROTOCOL)
+    except Exception as e:
+        write_error(reply_path, 'Result could not be pickled: {}'.format(e))
+        return
+
+    header = {'status': 'ok', 'protocol': PROTOCOL}
+    header.update(extra)
+    raw_sizes = [len(payload)] + [memoryview(b).nbytes for b in buffers]
+    if compress is not None and _payload.ZLIB_EXISTS and sum(raw_sizes) >= compress:
+        start = time.perf_counter()
+        payload = _payload.zlib.compress(payload, _payload.COMPRESS_LEVEL)
+        buffers = [_payload.zlib.compress(b, _payload.COMPRESS_LEVEL) for b in buffers]
+        header['compressed'] = {'raw_sizes': raw_sizes, 'seconds': time.perf_counter() - start}
+
+    _write(reply_path, header, payload, buffers)
+
+
+def write_error(reply_path, message, remote_traceback=''):
+    """Sends an error back to the IDE. Runs inside the application."""
+    _write(reply_path, {'status': 'error', 'message': message,
+                        'traceback': remote_traceback})
+
+
+def read_header(reply_path):
+    """Returns (header, mmap, payload offset) for a finished reply file"""
+    with open(reply_path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if mapped[:4] != MAGIC:
+        mapped.close()
+        raise ValueError('{} is not a wing-carrier reply'.format(reply_path))
+
+    header_size = _SIZE.unpack_from(mapped, 4)[0]
+    start = 4 + _SIZE.size
+    header = json.loads(mapped[start:start + header_size].decode('utf-8'))
+    return header, mapped, start + header_size
+
+
+def read_reply(reply_path, remove=True):
+    """Unpickles a finished reply. Raises QueryError for remote failures.
+
+    Out-of-band buffers are memoryview slices of the mapped file, so results
+    such as numpy arrays share memory with it rather than being copied.
+    """
+    header, mapped, offset = read_header(reply_path)
+    try:
+        if header['status'] != 'ok':
+            mapped.close()
+            raise QueryError(header.get('message', 'Query failed'), header.get('traceback', ''))
+
+        view = memoryview(mapped)
+        payload = view[offset:offset + header['payload']]
+        offset += header['payload']
+
+        buffers = []
+        for size in header['buffers']:
+            buffers.append(view[offset:offset + size])
+            offset += size
+
+        compressed = header.get('compressed')
+        if compressed:
+            start = time.perf_counter()
+            packed = [payload] + buffers
+            raw = [_payload.zlib.decompress(part) for part in packed]
+            _payload.STATS['reply'].record(sum(compressed['raw_sizes']), sum(part.nbytes for part in packed),
+                                           compressed['seconds'] + time.perf_counter() - start)
+            for part in packed:
+                part.release()
+            payload, buffers = raw[0], raw[1:]
+
+        value = pickle.loads(payload, buffers=buffers) if buffers else pickle.loads(payload)
+        if compressed or not buffers:
+            # nothing references the mapping, so it can be closed now
+            if isinstance(payload, memoryview):
+                payload.release()
+            view.release()
+            mapped.close()
+    finally:
+        if remove:
+            _remove(reply_path)
+
+    return value
+
+
+def _remove(reply_path):
+    # Windows won't delete a file that is still mapped. Leave it for
+    # prune_replies() to collect later.
+    try:
+        os.remove(reply_path)
+    except OSError:
+        pass
+
+
+def wait_for_file(reply_path, timeout=30.0):
+    """Blocks until reply_path exists. Returns False if timeout expires."""
+    deadline = time.perf_counter() + timeout
+    delay = 0.001
+    while not os.path.exists(reply_path):
+        if time.perf_counter() > deadline:
+            return False
+
+        time.sleep(delay)
+        delay = min(delay * 2, 0.05)
+
+    return True
+
+
+def wait_for_reply(reply_path, timeout=30.0):
+    """Waits on a reply file and returns the unpickled result."""
+    if not wait_for_file(reply_path, timeout):
+        raise TimeoutError('No reply from the application after {}s'.format(timeout))
+
+    return read_reply(reply_path)
+
+
+def prune_replies(max_age=3600.0):
+    """Removes reply files older than max_age seconds
+
+    Replies are removed as soon as they're read, so this collects what was
+    never read or couldn't be removed: streams and reports that timed out,
+    replies still mapped on Windows, and .prof/.collapsed profile files.
+    """
+    now = time.time()
+    reply_dir = get_reply_dir()
+    for name in os.listdir(reply_dir):
+        path = os.path.join(reply_dir, name)
+        try:
+            if now - os.path.getmtime(path) > max_age:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+def prune_stale(max_age=3600.0):
+    """prune_replies(), at most once every PRUNE_INTERVAL seconds. Called
+    for every send, so the reply folder never grows without bound."""
+    global _last_prune
+    now = time.time()
+    if now - _last_prune < PRUNE_INTERVAL:
+        return
+
+    _last_prune = now
+    prune_replies(max_age)
@@ -0,0 +1,203 @@
+"""Memoizes module run() calls made after a dispatch reloads a module.
+
+Pigeon.post_module_import() calls module.run() after every reload, even
+when nothing changed. For expensive, deterministic run() entry points,
+like analysis tools over large scenes, the result of the last run can be
+returned instead when:
+    the module's source is unchanged : A hash of the module's file and
+        the files of its loaded submodules
+    the scene is unchanged : Pigeon.scene_token(), a value the pigeon
+        derives from the application's scene state
+
+Caching is opt-in, either per tool:
+
+    @runcache.cacheable
+    def run(scene):
+        ...
+
+or per dispatch with the 'run_cache' option. A token callable can be given
+to cacheable() for tools that know better what their result depends on,
+and is required when the pigeon can't tell if the scene changed (its
+scene_token() returns None).
+
+Entries are evicted least recently used first once there are more than
+MAX_ENTRIES, and when older than MAX_AGE seconds. See configure().
+"""
+
+import sys
+import time
+import hashlib
+import threading
+import contextlib
+from collections import OrderedDict
+
+from . import log
+
+
+MAX_ENTRIES = 16
+"""How many run() results are kept"""
+
+MAX_AGE = None
+"""Seconds a result is reused for. None keeps it until evicted"""
+
+_CACHE = OrderedDict()
+"""{(module name, source hash, scene token, tool token): (time, result)}"""
+
+_lock = threading.Lock()
+"""Guards _CACHE and _stats, which worker dispatches use from pool threads.
+Never held while run() runs"""
+
+_dispatch = threading.local()
+"""The 'run_cache' option of the dispatch running on each thread"""
+
+_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+
+def configure(max_entries=None, max_age=None):
+    """Changes the eviction limits and applies them right away
+
+    Args:
+        max_entries (int) : How many results are kept
+        max_age (float) : Seconds a result is reused for. 0 removes the limit
+    """
+    global MAX_ENTRIES, MAX_AGE
+    if max_entries is not None:
+        MAX_ENTRIES = max_entries
+    if max_age is not None:
+        MAX_AGE = max_age or None
+    with _lock:
+        _evict()
+
+
+def cacheable(func=None, token=None):
+    """Marks a run() function as safe to memoize. Usable with or without arguments.
+
+    Args:
+        token (callable) : Called with run()'s arguments. Returns a value
+            that changes whenever the result would, eg a scene's change
+            counter
+    """
+    def _mark(function):
+        function.wingcarrier_cacheable = True
+        function.wingcarrier_cache_token = token
+        return function
+
+    return _mark(func) if func is not None else _mark
+
+
+@contextlib.contextmanager
+def dispatch_option(value):
+    """Applies the 'run_cache' dispatch option to run() calls in the block
+
+    True caches every run(), False none of them, None only cacheable() ones.
+    """
+    previous = getattr(_dispatch, 'value', None)
+    _dispatch.value = value
+    try:
+        yield
+    finally:
+        _dispatch.value = previous
+
+
+def wanted(run):
+    value = getattr(_dispatch, 'value', None)
+    if value is not None:
+        return bool(value)
+    return getattr(run, 'wingcarrier_cacheable', False)
+
+
+def source_hash(module):
+    """Hashes the source of module and its loaded submodules"""
+    prefix = module.__name__ + '.'
+    names = [module.__name__] + sorted(name for name in sys.modules if name.startswith(prefix))
+    digest = hashlib.blake2b(digest_size=16)
+    for name in names:
+        path = getattr(sys.modules.get(name), '__file__', None)
+        if not path:
+            continue
+        digest.update(name.encode('utf-8'))
+        try:
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+        except OSError:
+            # no source to compare, so never treat it as unchanged
+            digest.update(str(time.time()).encode('utf-8'))
+
+    return digest.hexdigest()
+
+
+def _evict():
+    """Drops expired and least recently used entries. Call with _lock held"""
+    now = time.time()
+    if MAX_AGE is not None:
+        for key in [key for key, (stored, _) in _CACHE.items() if now - stored > MAX_AGE]:
+            del _CACHE[key]
+            _stats['evictions'] += 1
+
+    while len(_CACHE) > max(MAX_ENTRIES, 0):
+        _CACHE.popitem(last=False)
+        _stats['evictions'] += 1
+
+
+def call(module, args=(), scene_token=None):
+    """Calls module.run(*args), or returns its cached result
+
+    Args:
+        module : The module that was just imported or reloaded
+        args (tuple) : run()'s arguments
+        scene_token (callable) : Pigeon.scene_token(), only called when
+            the run is cached. Its None means the scene state is unknown,
+            and only tools with a cacheable() token are cached then
+    """
+    run = module.run
+    if not wanted(run):
+        return run(*args)
+
+    token = getattr(run, 'wingcarrier_cache_token', None)
+    tool_token = token(*args) if token is not None else None
+    scene_token = scene_token() if scene_token is not None else ''
+    if scene_token is None and token is None:
+        if getattr(_dispatch, 'value', None):
+            log.info("wing-carrier run cache: can't tell if the scene changed, running {}. "
+                     "Give runcache.cacheable() a token to cache it".format(module.__name__))
+        else:
+            log.debug("wing-carrier run cache: can't tell if the scene changed, running {}".format(module.__name__))
+        return run(*args)
+
+    key = (module.__name__, source_hash(module), scene_token, tool_token)
+    with _lock:
+        _evict()
+        cached = _CACHE.get(key)
+        if cached is not None:
+            _CACHE.move_to_end(key)
+            _stats['hits'] += 1
+        else:
+            _stats['misses'] += 1
+
+    if cached is not None:
+        print('wing-carrier run cache: {} unchanged, skipped run()'.format(module.__name__))
+        return cached[1]
+
+    result = run(*args)
+    with _lock:
+        _CACHE[key] = (time.time(), result)
+        _evict()
+    return result
+
+
+def clear(module_name=None):
+    """Drops the cached results of one module, or all of them. Returns how many"""
+    with _lock:
+        keys = [key for key in _CACHE if module_name is None or key[0] == module_name]
+        for key in keys:
+            del _CACHE[key]
+    return len(keys)
+
+
+def report():
+    """Returns the cache's size, limits and hit counts"""
+    with _lock:
+        result = dict(_stats)
+        result.update({'entries': len(_CACHE), 'modules': sorted({key[0] for key in _CACHE}),
+                       'max_entries': MAX_ENTRIES, 'max_age': MAX_AGE})
+    return result
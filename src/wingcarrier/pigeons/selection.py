@@ -0,0 +1,308 @@
+"""Policies the IDE dispatchers use to choose which carrier gets a dispatch.
+
+The dispatchers used to take the first carrier in CARRIERS whose
+can_dispatch() was True. A SelectionPolicy makes that choice instead and
+prints why it made it.
+
+LatencyPolicy, the default, keeps using the current carrier while it is
+healthy and suits the file. Otherwise it probes the other carriers and
+ranks them by:
+    file type affinity : Pigeon.file_types, eg .mel files go to Maya
+    measured latency : moving averages of can_dispatch() probes and sends
+    recent failures : carriers that keep failing are skipped for a
+        cool down that doubles with each further failure
+
+Dispatchers that run as a new process for every dispatch, like the
+Antigravity one, keep that history between runs with save() and load().
+"""
+
+import os
+import json
+import time
+from collections import deque
+
+from . import log
+
+
+class CarrierStats(object):
+    """Latency and failure history for one carrier
+
+    Probe and send failures are counted separately, so a carrier that
+    answers can_dispatch() but keeps failing its sends still opens the
+    circuit:
+
+    >>> stats = CarrierStats()
+    >>> for _ in range(3):
+    ...     stats.record_probe(0.001, True)
+    ...     stats.record_send(0.01, False)
+    >>> stats.failures, stats.available
+    (3, False)
+    """
+
+    def __init__(self, smoothing=0.3, history=20, threshold=3, cooldown=5.0, max_cooldown=60.0):
+        self.smoothing = smoothing
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.recent = deque(maxlen=history)
+        """(time, seconds, ok) of the latest sends"""
+        self.probe_seconds = None
+        self.send_seconds = None
+        self.failures = 0
+        """Consecutive send failures. Only reset by a successful send"""
+        self.probe_failures = 0
+        """Consecutive probe failures. Reset by any success"""
+        self.total_failures = 0
+        self.last_failure = 0.0
+        self.open_until = 0.0
+        """Until this time the carrier is skipped. See _failed()"""
+
+
+    def _average(self, current, seconds):
+        if current is None:
+            return seconds
+        return current + self.smoothing * (seconds - current)
+
+
+    def record_probe(self, seconds, ok):
+        self.probe_seconds = self._average(self.probe_seconds, seconds)
+        if ok:
+            self.probe_failures = 0
+            if self.failures < self.threshold:
+                self.open_until = 0.0
+        else:
+            self.probe_failures = self._failed(self.probe_failures)
+
+
+    def record_send(self, seconds, ok):
+        self.recent.append((time.time(), seconds, ok))
+        if ok:
+            self.send_seconds = self._average(self.send_seconds, seconds)
+            self.failures = 0
+            self.probe_failures = 0
+            self.open_until = 0.0
+        else:
+            self.failures = self._failed(self.failures)
+
+
+    def _failed(self, count):
+        """Counts a failure and returns the new count. After threshold in a
+        row the carrier is skipped for cooldown seconds, doubling for each
+        failure after that"""
+        count += 1
+        self.total_failures += 1
+        self.last_failure = time.time()
+        if count >= self.threshold:
+            delay = min(self.cooldown * 2 ** (count - self.threshold), self.max_cooldown)
+            self.open_until = max(self.open_until, self.last_failure + delay)
+        return count
+
+
+    SAVED = ('probe_seconds', 'send_seconds', 'failures', 'probe_failures', 'total_failures',
+             'last_failure', 'open_until')
+
+
+    def to_dict(self):
+        data = {name: getattr(self, name) for name in self.SAVED}
+        data['recent'] = list(self.recent)
+        return data
+
+
+    def update(self, data):
+        """Restores what to_dict() returned"""
+        for name in self.SAVED:
+            if name in data:
+                setattr(self, name, data[name])
+        self.recent.extend(tuple(sent) for sent in data.get('recent', ()))
+
+
+    @property
+    def available(self):
+        return time.time() >= self.open_until
+
+
+    def latency(self):
+        """The expected seconds to probe and send, or None if never measured"""
+        known = [s for s in (self.probe_seconds, self.send_seconds) if s is not None]
+        return sum(known) if known else None
+
+
+    def describe(self):
+        def ms(seconds):
+            return '-' if seconds is None else '{:.1f}ms'.format(seconds * 1000.0)
+
+        text = 'probe {} send {}'.format(ms(self.probe_seconds), ms(self.send_seconds))
+        if self.failures:
+            text += ' failures {}'.format(self.failures)
+        if self.probe_failures:
+            text += ' probe failures {}'.format(self.probe_failures)
+        if not self.available:
+            text += ' skipped for {:.0f}s'.format(self.open_until - time.time())
+        return text
+
+
+
+class SelectionPolicy(object):
+    """Chooses a carrier for a dispatch.
+
+    Sub-classes implement select(). Dispatchers report how sends went with
+    record_send() so policies can learn from them.
+    """
+
+    def __init__(self):
+        self.stats = {}
+        """{carrier name: CarrierStats}"""
+
+
+    def stats_for(self, carrier):
+        name = carrier.__class__.__name__
+        if name not in self.stats:
+            self.stats[name] = CarrierStats()
+        return self.stats[name]
+
+
+    def probe(self, carrier):
+        """Times carrier.can_dispatch() and records the result"""
+        start = time.perf_counter()
+        try:
+            ok = bool(carrier.can_dispatch())
+        except Exception as e:
+            print('wing-carrier select: {} probe failed: {}'.format(carrier.__class__.__name__, e))
+            ok = False
+
+        self.stats_for(carrier).record_probe(time.perf_counter() - start, ok)
+        return ok
+
+
+    def record_send(self, carrier, seconds, ok=True):
+        self.stats_for(carrier).record_send(seconds, ok)
+
+
+    def save(self, path):
+        """Writes every carrier's stats to a json file"""
+        temp_path = path + '.part'
+        with open(temp_path, 'w') as f:
+            json.dump({name: stats.to_dict() for name, stats in self.stats.items()}, f)
+        os.replace(temp_path, path)
+
+
+    def load(self, path):
+        """Restores stats written by save(). A missing or unreadable file
+        leaves the policy as it is. Returns True if anything was loaded"""
+        try:
+            with open(path) as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return False
+
+        for name, data in saved.items():
+            stats = self.stats.setdefault(name, CarrierStats())
+            stats.update(data)
+        return True
+
+
+    def log(self, message, level='info'):
+        getattr(log, level)('wing-carrier select: {}'.format(message))
+
+
+    def select(self, carriers, file_path='', doc_type='', current=None):
+        """Returns the carrier to dispatch to, or None
+
+        Args:
+            carriers (list) : The Pigeons to choose from
+            file_path (string) : The file being dispatched
+            doc_type (string) : The document's mime or doc type
+            current (Pigeon) : The carrier used last, if any
+        """
+        raise NotImplementedError
+
+
+
+class FirstAvailablePolicy(SelectionPolicy):
+    """The current carrier if it can dispatch, else the first in the list
+    that can. This is how carriers were chosen before policies existed."""
+
+    def select(self, carriers, file_path='', doc_type='', current=None):
+        ordered = ([current] if current else []) + [c for c in carriers if c is not current]
+        for carrier in ordered:
+            if self.probe(carrier):
+                self.log('{} (first available)'.format(carrier.__class__.__name__))
+                return carrier
+
+        self.log('no carrier can dispatch')
+        return None
+
+
+
+def file_type(file_path, doc_type=''):
+    """Returns the extension used for affinity, eg '.mel'"""
+    ext = os.path.splitext(file_path)[1].lower()
+    if not ext and doc_type:
+        ext = '.' + doc_type.rsplit('-', 1)[-1].rsplit('/', 1)[-1]
+    return ext
+
+
+def has_affinity(carrier, file_path, doc_type=''):
+    return file_type(file_path, doc_type) in getattr(carrier, 'file_types', ())
+
+
+
+class LatencyPolicy(SelectionPolicy):
+    """Prefers file type affinity, then the lowest measured latency.
+
+    Args:
+        sticky (bool) : Keep the current carrier without probing the others
+            while it can dispatch and no other carrier has affinity for the
+            file. Saves a probe of every carrier on each dispatch.
+        unmeasured_seconds (float) : Latency assumed for a carrier that has
+            never been measured
+    """
+
+    def __init__(self, sticky=True, unmeasured_seconds=0.05):
+        super(LatencyPolicy, self).__init__()
+        self.sticky = sticky
+        self.unmeasured_seconds = unmeasured_seconds
+
+
+    def score(self, carrier, file_path='', doc_type=''):
+        """Lower is better. Affinity always beats latency."""
+        stats = self.stats_for(carrier)
+        latency = stats.latency()
+        if latency is None:
+            latency = self.unmeasured_seconds
+
+        return (0 if has_affinity(carrier, file_path, doc_type) else 1, latency)
+
+
+    def select(self, carriers, file_path='', doc_type='', current=None):
+        affine = [c for c in carriers if has_affinity(c, file_path, doc_type)]
+        probed = None
+        if (self.sticky and current is not None and (not affine or current in affine)
+                and self.stats_for(current).available):
+            if self.probe(current):
+                self.log('{} (current, {})'.format(current.__class__.__name__, self.stats_for(current).describe()),
+                         'debug')
+                return current
+            probed = current
+
+        candidates = []
+        for carrier in carriers:
+            if carrier is probed or not self.stats_for(carrier).available:
+                continue
+            if self.probe(carrier):
+                candidates.append(carrier)
+
+        if not candidates:
+            self.log('no carrier can dispatch ({})'.format(', '.join(
+                '{} {}'.format(c.__class__.__name__, self.stats_for(c).describe()) for c in carriers)))
+            return None
+
+        candidates.sort(key=lambda c: self.score(c, file_path, doc_type))
+        chosen = candidates[0]
+        reasons = [self.stats_for(chosen).describe()]
+        if has_affinity(chosen, file_path, doc_type):
+            reasons.insert(0, 'affinity {}'.format(file_type(file_path, doc_type)))
+        others = ', '.join('{} {}'.format(c.__class__.__name__, self.stats_for(c).describe()) for c in candidates[1:])
+        self.log('{} ({}){}'.format(chosen.__class__.__name__, ', '.join(reasons),
+                                    ' over ' + others if others else ''))
+        return chosen
@@ -0,0 +1,215 @@
+"""Reports the health and latency of each carrier.
+
+For every carrier this gathers:
+    reachability : can_dispatch(), through the selection policy when given
+        so the probe also counts towards its latency averages
+    connect : How long opening a transport to the application takes
+    round trip : How long a query() takes, from sending it to reading the
+        pickled reply. The same query returns the application's pid,
+        python version, run cache, worker tasks and namespaces
+    processes : pid and exe from pigeons/discovery.py
+    IDE side caches : the handshake, the last working transport address
+        and whether the carrier was pre-warmed
+    circuit : The policy's failure count and cool-down (pigeons/selection.py)
+    recent dispatches : The last send times the policy recorded
+
+benchmark() times a number of query() round trips on demand.
+
+    python -m wingcarrier.pigeons.status [--carrier maya] [--bench 20]
+"""
+
+import os
+import sys
+import time
+
+
+def application_status():
+    """Describes the receiver's state. Runs in the application."""
+    from . import runcache, tasks, namespaces
+    states = {}
+    for task in tasks.POOL.tasks():
+        states[task['state']] = states.get(task['state'], 0) + 1
+
+    return {'pid': os.getpid(), 'python': sys.version.split()[0], 'executable': sys.executable,
+            'run_cache': runcache.report(), 'tasks': states,
+            'namespaces': len(namespaces._NAMESPACES)}
+
+
+def _ms(seconds):
+    return None if seconds is None else seconds * 1000.0
+
+
+def carrier_status(carrier, policy=None, timeout=5.0):
+    """Returns a dict describing one carrier. See the module docs
+
+    Args:
+        carrier (Pigeon) : The carrier to check
+        policy (SelectionPolicy) : The dispatcher's policy, for the circuit
+            state and recent dispatches
+        timeout (float) : Seconds to wait for the round trip query
+    """
+    status = {'name': carrier.__class__.__name__, 'reachable': False, 'connect_ms': None,
+              'round_trip_ms': None, 'application': None, 'error': ''}
+    status.update(carrier.cache_state())
+
+    try:
+        processes = carrier.find_processes(max_age=0)
+    except Exception as e:
+        processes = []
+        status['error'] = 'discovery failed: {}'.format(e)
+    status['processes'] = [{'pid': p.pid, 'exe': p.exe} for p in processes]
+
+    try:
+        status['reachable'] = policy.probe(carrier) if policy is not None else bool(carrier.can_dispatch())
+    except Exception as e:
+        status['error'] = 'probe failed: {}'.format(e)
+
+    if status['reachable']:
+        start = time.perf_counter()
+        transport = carrier.get_transport()
+        if transport is not None:
+            status['connect_ms'] = _ms(time.perf_counter() - start)
+            status['address'] = transport.address
+            transport.close()
+
+        start = time.perf_counter()
+        try:
+            status['application'] = carrier.query(
+                'import wingcarrier.pigeons.status; wingcarrier.pigeons.status.application_status()',
+                timeout, compress=False)
+            status['round_trip_ms'] = _ms(time.perf_counter() - start)
+        except Exception as e:
+            status['error'] = 'query failed: {}'.format(e)
+
+    if policy is not None:
+        stats = policy.stats_for(carrier)
+        status['circuit'] = {'failures': stats.failures, 'probe_failures': stats.probe_failures,
+                             'total_failures': stats.total_failures,
+                             'open': not stats.available,
+                             'retry_in': max(stats.open_until - time.time(), 0.0)}
+        status['probe_ms'] = _ms(stats.probe_seconds)
+        status['send_ms'] = _ms(stats.send_seconds)
+        status['recent'] = [{'time': sent, 'ms': seconds * 1000.0, 'ok': ok} for sent, seconds, ok in stats.recent]
+
+    return status
+
+
+def benchmark(carrier, count=10, timeout=10.0):
+    """Times count query() round trips to carrier
+
+    Returns:
+        dict : count, failures and the median, p95 and max in milliseconds
+    """
+    times = []
+    failures = 0
+    for _ in range(count):
+        start = time.perf_counter()
+        try:
+            carrier.query('None', timeout, compress=False)
+            times.append(time.perf_counter() - start)
+        except Exception:
+            failures += 1
+
+    times.sort()
+    result = {'count': count, 'failures': failures}
+    if times:
+        result.update({'median_ms': _ms(times[len(times) // 2]),
+                       'p95_ms': _ms(times[min(int(len(times) * 0.95), len(times) - 1)]),
+                       'max_ms': _ms(times[-1])})
+    return result
+
+
+def report(carriers, policy=None, bench=0, timeout=5.0):
+    """Returns carrier_status() for each carrier, with a benchmark() of
+    bench round trips for the reachable ones"""
+    statuses = []
+    for carrier in carriers:
+        status = carrier_status(carrier, policy, timeout)
+        if bench and status['reachable']:
+            status['benchmark'] = benchmark(carrier, bench, timeout)
+        statuses.append(status)
+
+    return statuses
+
+
+def format_report(statuses):
+    """Returns report() as printable text"""
+    def ms(value):
+        return '-' if value is None else '{:.1f}ms'.format(value)
+
+    lines = []
+    for status in statuses:
+        lines.append('{name}: {state}'.format(name=status['name'],
+                                              state='reachable' if status['reachable'] else 'unreachable'))
+        if status['error']:
+            lines.append('    error: {}'.format(status['error']))
+        for process in status['processes']:
+            lines.append('    process: pid {} {}'.format(process['pid'], process['exe'] or ''))
+        lines.append('    connect {} round trip {} via {}'.format(
+            ms(status['connect_ms']), ms(status['round_trip_ms']), status['address'] or '-'))
+        lines.append('    handshake {} prewarmed {}'.format(
+            'cached' if status['handshake'] else 'not cached', 'yes' if status['prewarmed'] else 'no'))
+
+        application = status['application']
+        if application:
+            cache = application['run_cache']
+            lines.append('    application: pid {} python {}'.format(application['pid'], application['python']))
+            lines.append('    run cache: {} entries, {} hits, {} misses, {} evictions'.format(
+                cache['entries'], cache['hits'], cache['misses'], cache['evictions']))
+            if application['tasks']:
+                lines.append('    tasks: {}'.format(', '.join(
+                    '{} {}'.format(count, state) for state, count in sorted(application['tasks'].items()))))
+            lines.append('    namespaces: {}'.format(application['namespaces']))
+
+        if 'circuit' in status:
+            circuit = status['circuit']
+            state = 'open, retry in {:.0f}s'.format(circuit['retry_in']) if circuit['open'] else 'closed'
+            lines.append('    circuit {} ({} send and {} probe failures in a row, {} total)'.format(
+                state, circuit['failures'], circuit['probe_failures'], circuit['total_failures']))
+            lines.append('    average probe {} send {}'.format(ms(status['probe_ms']), ms(status['send_ms'])))
+            if status['recent']:
+                lines.append('    recent sends: {}'.format(' '.join(
+                    '{:.0f}ms{}'.format(sent['ms'], '' if sent['ok'] else '!') for sent in status['recent'])))
+
+        if 'benchmark' in status:
+            bench = status['benchmark']
+            lines.append('    benchmark: {} round trips, {} failed, median {} p95 {} max {}'.format(
+                bench['count'], bench['failures'], ms(bench.get('median_ms')), ms(bench.get('p95_ms')),
+                ms(bench.get('max_ms'))))
+
+    return '\n'.join(lines)
+
+
+def main(args=None):
+    import argparse
+    from . import maya, cascadeur, loopback
+
+    parser = argparse.ArgumentParser(description='Report the health and latency of wing-carrier carriers')
+    parser.add_argument('--carrier', action='append', choices=['maya', 'cascadeur', 'loopback'],
+                        help='Only report these carriers. Defaults to maya and cascadeur')
+    parser.add_argument('--bench', type=int, default=0, help='Time this many round trips per carrier')
+    parsed = parser.parse_args(args)
+
+    names = parsed.carrier or ['maya', 'cascadeur']
+    carriers = []
+    worker = None
+    for name in names:
+        if name == 'maya':
+            carriers.append(maya.MayaPigeon())
+        elif name == 'cascadeur':
+            carriers.append(cascadeur.CascadeurPigeon())
+        else:
+            worker = loopback.LoopbackPigeon()
+            if worker.start(quiet=True):
+                carriers.append(worker)
+
+    try:
+        print(format_report(report(carriers, bench=parsed.bench)))
+    finally:
+        if worker is not None:
+            worker.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
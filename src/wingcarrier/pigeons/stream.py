@@ -0,0 +1,325 @@
+"""Streams stdout/stderr from code running in a DCC back to the IDE.
+
+capture_output() runs application side. It tees sys.stdout and sys.stderr
+into an OutputStream, which keeps pending text in a bounded RingBuffer and
+has a background thread append it to a stream file in small chunks while
+the code runs. follow_output() runs IDE side and tails that file until the
+receiver marks it done.
+
+Stream file records:
+    channel (1 byte, b'o' or b'e') | size (uint32) | utf-8 text
+"""
+
+import os
+import sys
+import json
+import time
+import struct
+import threading
+import contextlib
+from collections import deque
+
+
+_RECORD = struct.Struct('<cI')
+
+STDOUT = b'o'
+STDERR = b'e'
+
+
+def done_path(stream_path):
+    """The marker file written once the stream is complete"""
+    return stream_path + '.done'
+
+
+class RingBuffer(object):
+    """A bounded FIFO of text chunks.
+
+    When more than max_chars are pending the oldest chunks are dropped and
+    counted in dropped, so a runaway script can't grow memory without bound
+    while the reader falls behind.
+    """
+
+    def __init__(self, max_chars=1 << 20):
+        self.max_chars = max_chars
+        self.size = 0
+        self.dropped = 0
+        self._chunks = deque()
+        self._lock = threading.Lock()
+
+
+    def __len__(self):
+        return self.size
+
+
+    def append(self, channel, text):
+        if not text:
+            return
+
+        with self._lock:
+            self._chunks.append((channel, text))
+            self.size += len(text)
+            while self.size > self.max_chars and len(self._chunks) > 1:
+                _, old = self._chunks.popleft()
+                self.size -= len(old)
+                self.dropped += len(old)
+
+
+    def drain(self):
+        """Removes and returns all pending (channel, text) chunks"""
+        with self._lock:
+            chunks = list(self._chunks)
+            self._chunks.clear()
+            self.size = 0
+
+        return chunks
+
+
+
+class OutputStream(object):
+    """Flushes RingBuffer chunks to a stream file from a background thread.
+
+    Args:
+        stream_path (string) : The file the IDE is tailing
+        max_chars (int) : The most unflushed text to hold in memory
+        flush_interval (float) : Seconds between background flushes
+    """
+
+    def __init__(self, stream_path, max_chars=1 << 20, flush_interval=0.1):
+        self.stream_path = stream_path
+        self.buffer = RingBuffer(max_chars)
+        self.flush_interval = flush_interval
+        self._file = open(stream_path, 'ab')
+        self._file_lock = threading.Lock()
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='wing-carrier-stream')
+        self._thread.daemon = True
+        self._thread.start()
+
+
+    def write(self, channel, text):
+        self.buffer.append(channel, text)
+
+
+    def flush(self):
+        chunks = self.buffer.drain()
+        if not chunks:
+            return
+
+        with self._file_lock:
+            for channel, text in chunks:
+                data = text.encode('utf-8', 'replace')
+                self._file.write(_RECORD.pack(channel, len(data)))
+                self._file.write(data)
+
+            self._file.flush()
+
+
+    def _run(self):
+        while not self._closed.wait(self.flush_interval):
+            self.flush()
+
+
+    def close(self, status='ok'):
+        """Flushes what's left and writes the done marker"""
+        if self._closed.is_set():
+            return
+
+        self._closed.set()
+        self._thread.join()
+        self.flush()
+        self._file.close()
+
+        with open(done_path(self.stream_path), 'w') as f:
+            json.dump({'status': status, 'dropped': self.buffer.dropped}, f)
+
+
+
+class TeeWriter(object):
+    """A sys.stdout/sys.stderr stand-in that also writes to OutputStreams.
+
+    Everything still reaches the original stream, so the DCC's script
+    editor keeps showing output as it did before. Text is copied to the
+    stream captured for the writing thread, or to the newest catch all
+    capture for threads without one, so worker tasks running at the same
+    time as the main thread each stream only their own output.
+    """
+
+    def __init__(self, original, channel):
+        self._original = original
+        self._channel = channel
+
+
+    def write(self, text):
+        stream = _ROUTES.get(threading.get_ident())
+        if stream is None and _CATCH_ALL:
+            stream = _CATCH_ALL[-1]
+        if stream is not None:
+            stream.write(self._channel, text)
+
+        if self._original is not None:
+            return self._original.write(text)
+
+        return len(text)
+
+
+    def flush(self):
+        if self._original is not None:
+            self._original.flush()
+
+
+    def __getattr__(self, name):
+        return getattr(self._original, name)
+
+
+
+_ROUTES = {}
+"""{thread id: OutputStream} of the captures running now"""
+
+_CATCH_ALL = []
+"""Captures that also take output from threads without their own"""
+
+_route_lock = threading.Lock()
+_installed = None
+"""(stdout, stderr) TeeWriters while any capture is running"""
+
+
+def _install():
+    global _installed
+    if _installed is None:
+        _installed = (TeeWriter(sys.stdout, STDOUT), TeeWriter(sys.stderr, STDERR))
+        sys.stdout, sys.stderr = _installed
+
+
+def _uninstall():
+    global _installed
+    if _installed is None or _ROUTES or _CATCH_ALL:
+        return
+
+    stdout, stderr = _installed
+    _installed = None
+    # leave anything installed over the tees alone
+    if sys.stdout is stdout:
+        sys.stdout = stdout._original
+    if sys.stderr is stderr:
+        sys.stderr = stderr._original
+
+
+@contextlib.contextmanager
+def capture_output(stream_path, max_chars=1 << 20, flush_interval=0.1, catch_all=True):
+    """Streams the calling thread's sys.stdout and sys.stderr to stream_path
+    while the block runs
+
+    Args:
+        catch_all (bool) : Also stream output from threads that aren't
+            capturing their own, eg threads the dispatched code started.
+            Worker tasks pass False so they don't take the main thread's
+            output.
+    """
+    stream = OutputStream(stream_path, max_chars=max_chars, flush_interval=flush_interval)
+    thread_id = threading.get_ident()
+    with _route_lock:
+        _install()
+        previous = _ROUTES.get(thread_id)
+        _ROUTES[thread_id] = stream
+        if catch_all:
+            _CATCH_ALL.append(stream)
+
+    status = 'error'
+    try:
+        yield stream
+        status = 'ok'
+    finally:
+        with _route_lock:
+            if previous is not None:
+                _ROUTES[thread_id] = previous
+            elif _ROUTES.get(thread_id) is stream:
+                del _ROUTES[thread_id]
+            if stream in _CATCH_ALL:
+                _CATCH_ALL.remove(stream)
+            _uninstall()
+        stream.close(status)
+
+
+
+def _read_records(f, pending):
+    """Parses complete records from f, returns the [(channel, text)] found
+    and the bytes of any trailing partial record."""
+    pending += f.read()
+    records = []
+    offset = 0
+    while len(pending) - offset >= _RECORD.size:
+        channel, size = _RECORD.unpack_from(pending, offset)
+        end = offset + _RECORD.size + size
+        if end > len(pending):
+            break
+
+        records.append((channel, pending[offset + _RECORD.size:end].decode('utf-8', 'replace')))
+        offset = end
+
+    return records, pending[offset:]
+
+
+def follow_output(stream_path, out=None, err=None, timeout=None, poll=0.05, prefix=''):
+    """Prints a stream file as it grows until the receiver marks it done.
+
+    Args:
+        stream_path (string) : The stream file passed to the receiver
+        out / err : Where to write stdout and stderr text. Default sys.stdout
+            and sys.stderr
+        timeout (float) : Give up after this many seconds. None waits forever
+        poll (float) : Seconds between checks for new output
+        prefix (string) : Prepended to each line of output, eg 'maya> '
+
+    Returns:
+        dict : The done marker ({'status', 'dropped'}) or None on timeout
+    """
+    out = out or sys.stdout
+    err = err or sys.stderr
+    deadline = None if timeout is None else time.perf_counter() + timeout
+
+    while not os.path.exists(stream_path) and not os.path.exists(done_path(stream_path)):
+        if deadline is not None and time.perf_counter() > deadline:
+            return None
+        time.sleep(poll)
+
+    marker = None
+    pending = b''
+    line_start = {STDOUT: True, STDERR: True}
+    with open(stream_path, 'rb') as f:
+        while True:
+            finished = os.path.exists(done_path(stream_path))
+            records, pending = _read_records(f, pending)
+            for channel, text in records:
+                target = err if channel == STDERR else out
+                if prefix:
+                    lines = text.split('\n')
+                    text = '\n'.join((prefix + line) if line else line for line in lines)
+                    if not line_start[channel] and lines[0]:
+                        text = text[len(prefix):]
+                    line_start[channel] = text.endswith('\n')
+                target.write(text)
+
+            if records:
+                out.flush()
+
+            if finished:
+                with open(done_path(stream_path), 'r') as marker_file:
+                    marker = json.load(marker_file)
+                break
+
+            if deadline is not None and time.perf_counter() > deadline:
+                break
+
+            time.sleep(poll)
+
+    if marker is not None:
+        if marker.get('dropped'):
+            err.write('wing-carrier: {} characters of output were dropped\n'.format(marker['dropped']))
+
+        for path in (stream_path, done_path(stream_path)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    return marker
@@ -0,0 +1,263 @@
+"""Mirror a package tree into a DCC-visible location using content-hash deltas.
+
+Pigeon.import_module() only works when the DCC can already import the
+package. PackageSync copies a package tree into a cache directory (or a
+zipimport archive) that the DCC can see, only touching files whose content
+hash changed since the last sync. register_sync_location() is then run
+DCC side to put that location on sys.path and drop the stale modules, so
+the whole package re-imports as a unit.
+"""
+
+import os
+import sys
+import json
+import shutil
+import hashlib
+import zipfile
+import tempfile
+import importlib
+
+
+SYNC_ROOT_ENV = 'WINGCARRIER_SYNC_ROOT'
+"""Environment variable that overrides the default sync cache directory"""
+
+_IGNORED_DIRS = {'__pycache__', '.git', '.hg', '.svn', '.mypy_cache', '.pytest_cache'}
+_IGNORED_SUFFIXES = ('.pyc', '.pyo')
+
+
+def default_sync_root():
+    """Returns the directory synced packages are written to by default."""
+    return os.environ.get(SYNC_ROOT_ENV,
+                          os.path.join(tempfile.gettempdir(), 'wingcarrier_sync'))
+
+
+def find_package_root(file_path):
+    """Returns the top-most package directory that contains file_path.
+
+    The walk matches _get_module_info() in the dispatchers, stopping at the
+    first parent directory without an __init__.py. An empty string is
+    returned when file_path isn't part of a package.
+    """
+    path = os.path.dirname(os.path.abspath(file_path))
+    root = ''
+    count = 0
+    while count < 20 and os.path.exists(os.path.join(path, '__init__.py')):
+        count += 1
+        root = path
+        path = os.path.dirname(path)
+
+    return root
+
+
+def _file_hash(file_path):
+    digest = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+class SyncResult(object):
+    """What a PackageSync.sync() call changed.
+
+    Attributes:
+        package (str) : The top level package name
+        location (str) : The path to add to the DCC's sys.path
+        changed (list) : Relative paths that were written
+        removed (list) : Relative paths that were deleted
+        bytes_sent (int) : Total bytes written for this sync
+    """
+
+    def __init__(self, package, location):
+        self.package = package
+        self.location = location
+        self.changed = []
+        self.removed = []
+        self.bytes_sent = 0
+
+
+    @property
+    def dirty(self):
+        return bool(self.changed or self.removed)
+
+
+    def __repr__(self):
+        return 'SyncResult({} changed:{} removed:{} bytes:{})'.format(
+            self.package, len(self.changed), len(self.removed), self.bytes_sent)
+
+
+
+class PackageSync(object):
+    """Pushes a package tree into a cache directory or zip archive.
+
+    A manifest of {relative path: [size, mtime_ns, sha1]} is kept next to
+    the synced output. Files whose size and mtime match the manifest reuse
+    the stored hash, so only edited files are read and hashed.
+
+    Args:
+        package_dir (str) : The absolute path of the package directory
+        sync_root (str) : The directory to write to. Defaults to
+            default_sync_root()
+        archive (bool) : Write a zipimport archive instead of a directory
+    """
+
+    def __init__(self, package_dir, sync_root=None, archive=False):
+        self.package_dir = os.path.abspath(package_dir)
+        self.package = os.path.basename(self.package_dir)
+        self.sync_root = sync_root or default_sync_root()
+        self.archive = archive
+
+
+    @property
+    def manifest_path(self):
+        suffix = '.zip' if self.archive else ''
+        return os.path.join(self.sync_root, '.manifests', self.package + suffix + '.json')
+
+
+    @property
+    def location(self):
+        """The path the DCC needs on sys.path to import the synced package"""
+        if self.archive:
+            return os.path.join(self.sync_root, self.package + '.zip')
+
+        return self.sync_root
+
+
+    def load_manifest(self):
+        try:
+            with open(self.manifest_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+
+    def save_manifest(self, manifest):
+        os.makedirs(os.path.dirname(self.manifest_path), exist_ok=True)
+        temp_path = self.manifest_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(manifest, f)
+
+        os.replace(temp_path, self.manifest_path)
+
+
+    def iter_files(self):
+        """Yields the (relative path, absolute path) of every synced file"""
+        for root, dirs, files in os.walk(self.package_dir):
+            dirs[:] = [d for d in dirs if d not in _IGNORED_DIRS and not d.startswith('.')]
+            for name in files:
+                if name.endswith(_IGNORED_SUFFIXES):
+                    continue
+
+                full_path = os.path.join(root, name)
+                rel_path = os.path.relpath(full_path, os.path.dirname(self.package_dir))
+                yield rel_path.replace('\\', '/'), full_path
+
+
+    def scan(self, previous=None):
+        """Returns the current manifest, re-hashing only files that changed on disk"""
+        previous = previous or {}
+        manifest = {}
+        for rel_path, full_path in self.iter_files():
+            stat = os.stat(full_path)
+            old = previous.get(rel_path)
+            if old and old[0] == stat.st_size and old[1] == stat.st_mtime_ns:
+                manifest[rel_path] = old
+            else:
+                manifest[rel_path] = [stat.st_size, stat.st_mtime_ns, _file_hash(full_path)]
+
+        return manifest
+
+
+    def sync(self, force=False):
+        """Writes any changed files and returns a SyncResult.
+
+        Args:
+            force (bool) : Ignore the previous manifest and write every file
+        """
+        previous = {} if force else self.load_manifest()
+        manifest = self.scan(previous)
+        result = SyncResult(self.package, self.location)
+
+        for rel_path, entry in manifest.items():
+            old = previous.get(rel_path)
+            if old is None or old[2] != entry[2]:
+                result.changed.append(rel_path)
+
+        result.removed = [rel_path for rel_path in previous if rel_path not in manifest]
+        if not result.dirty and os.path.exists(self.location):
+            return result
+
+        if self.archive:
+            self._write_archive(manifest, result)
+        else:
+            self._write_directory(result)
+
+        self.save_manifest(manifest)
+        return result
+
+
+    def _write_directory(self, result):
+        base_dir = os.path.dirname(self.package_dir)
+        for rel_path in result.changed:
+            source = os.path.join(base_dir, rel_path)
+            target = os.path.join(self.sync_root, rel_path)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+
+            temp_path = target + '.wing_tmp'
+            shutil.copyfile(source, temp_path)
+            os.replace(temp_path, target)
+            result.bytes_sent += os.path.getsize(target)
+
+        for rel_path in result.removed:
+            target = os.path.join(self.sync_root, rel_path)
+            if os.path.exists(target):
+                os.remove(target)
+
+
+    def _write_archive(self, manifest, result):
+        # A zip can't be patched in place, so any change rewrites the
+        # archive. It is still a single file for the DCC to pick up.
+        base_dir = os.path.dirname(self.package_dir)
+        os.makedirs(self.sync_root, exist_ok=True)
+        temp_path = self.location + '.wing_tmp'
+        with zipfile.ZipFile(temp_path, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for rel_path in sorted(manifest):
+                archive.write(os.path.join(base_dir, rel_path), rel_path)
+
+        os.replace(temp_path, self.location)
+        result.bytes_sent = os.path.getsize(self.location)
+
+
+
+def register_sync_location(location, package, purge=True):
+    """Puts a synced location on sys.path. Runs inside the DCC.
+
+    Any modules from the package are removed from sys.modules so the next
+    Pigeon.import_module() imports the whole package fresh from the synced
+    sources rather than reloading a single module.
+
+    Args:
+        location (str) : The synced directory or zip archive
+        package (str) : The top level package name
+        purge (bool) : Remove the package's modules from sys.modules
+    """
+    if location in sys.path:
+        sys.path.remove(location)
+    sys.path.insert(0, location)
+
+    if location.endswith('.zip'):
+        # zipimport caches the archive's table of contents
+        sys.path_importer_cache.pop(location, None)
+        try:
+            import zipimport
+            zipimport._zip_directory_cache.pop(location, None)
+        except AttributeError:
+            pass
+
+    if purge:
+        prefix = package + '.'
+        for name in [n for n in sys.modules if n == package or n.startswith(prefix)]:
+            del sys.modules[name]
+
+    importlib.invalidate_caches()
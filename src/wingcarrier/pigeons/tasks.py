@@ -0,0 +1,352 @@
+"""Runs UI free dispatches on a bounded pool of worker threads.
+
+A receive() normally runs on the thread the command arrives on, usually
+the application's main thread, so a long data processing job locks the
+application until it finishes and a runaway script can't be stopped.
+
+With the 'worker' dispatch option the dispatch runs as a Task on the pool
+instead and the receive() returns right away. Only code that doesn't touch
+the application's UI may run this way.
+
+Tasks are cancelled cooperatively: the code calls checkpoint() in its
+loops, which raises TaskCancelled once the IDE has called cancel() or the
+task's timeout has passed. A timed out task that never reaches a
+checkpoint gets TaskCancelled raised inside its thread after TIMEOUT_GRACE
+seconds. progress() reports how far along a task is.
+
+The task's state and progress are written to a small json status file,
+renamed into place on every update, which the IDE polls with
+follow_status():
+
+    def run():
+        for i, item in enumerate(items):
+            tasks.checkpoint()
+            tasks.progress(i / len(items), item.name)
+            process(item)
+"""
+
+import os
+import json
+import time
+import ctypes
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+
+MAX_WORKERS = 2
+"""Threads in the pool. Tasks past this wait for a free thread"""
+
+TIMEOUT_GRACE = 5.0
+"""Seconds a timed out task has to reach a checkpoint() before TaskCancelled
+is raised inside its thread"""
+
+PROGRESS_INTERVAL = 0.1
+"""Minimum seconds between progress writes to a status file"""
+
+FINISHED = ('done', 'failed', 'cancelled', 'timeout')
+
+_local = threading.local()
+
+
+def _set_async_exc(thread_id, exception):
+    """Raises exception inside another thread, or clears the one pending
+    there when exception is None. Returns how many threads were changed"""
+    return ctypes.pythonapi.PyThreadState_SetAsyncExc(
+        ctypes.c_ulong(thread_id), ctypes.py_object(exception) if exception is not None else None)
+
+
+class TaskCancelled(Exception):
+    """Raised inside a task by checkpoint() once it's cancelled"""
+
+
+
+class Task(object):
+    """A dispatch running on the pool.
+
+    Args:
+        work (callable) : Called with no arguments on a pool thread
+        task_id (string) : How the IDE refers to the task
+        timeout (float) : Seconds before the task is cancelled, or None
+        status_path (string) : Where state and progress are written, if anywhere
+        label (string) : Shown in reports, eg the module being dispatched
+    """
+
+    def __init__(self, work, task_id, timeout=None, status_path='', label=''):
+        self.work = work
+        self.task_id = task_id
+        self.timeout = timeout
+        self.status_path = status_path
+        self.label = label
+        self.state = 'queued'
+        self.reason = ''
+        self.fraction = None
+        self.message = ''
+        self.error = ''
+        self.started = None
+        self.finished = None
+        self.thread_id = None
+        self._cancel = threading.Event()
+        self._thread_lock = threading.Lock()
+        """Held while thread_id is checked and raised into, and while it's cleared"""
+        self._last_write = 0.0
+        self._timers = []
+        self._write_status()
+
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+
+    def cancel(self, reason='cancelled', force=False):
+        """Asks the task to stop at its next checkpoint()
+
+        Args:
+            reason (string) : 'cancelled' or 'timeout'
+            force (bool) : Also raise TaskCancelled inside the task's thread
+                right away, for code that never calls checkpoint()
+        """
+        if self.state in FINISHED:
+            return False
+
+        if not self._cancel.is_set():
+            self.reason = reason
+            self._cancel.set()
+
+        if force:
+            # the pool thread moves on to the next task once this one
+            # finishes, so only raise while it is still running this one
+            with self._thread_lock:
+                thread_id = self.thread_id
+                if self.state == 'running' and thread_id is not None:
+                    if _set_async_exc(thread_id, TaskCancelled) > 1:
+                        _set_async_exc(thread_id, None)
+        return True
+
+
+    def _timed_out(self):
+        if self.cancel('timeout'):
+            timer = threading.Timer(TIMEOUT_GRACE, self.cancel, ('timeout', True))
+            timer.daemon = True
+            timer.start()
+            self._timers.append(timer)
+
+
+    def checkpoint(self):
+        if self._cancel.is_set():
+            raise TaskCancelled(self.reason)
+
+
+    def report_progress(self, fraction=None, message=''):
+        self.fraction = fraction
+        self.message = message
+        now = time.perf_counter()
+        if now - self._last_write >= PROGRESS_INTERVAL:
+            self._write_status()
+
+
+    def status(self):
+        end = self.finished or time.time()
+        return {'id': self.task_id, 'label': self.label, 'state': self.state,
+                'progress': self.fraction, 'message': self.message, 'error': self.error,
+                'seconds': end - self.started if self.started else 0.0}
+
+
+    def _write_status(self):
+        self._last_write = time.perf_counter()
+        if not self.status_path:
+            return
+
+        temp_path = self.status_path + '.part'
+        with open(temp_path, 'w') as f:
+            json.dump(self.status(), f)
+        os.replace(temp_path, self.status_path)
+
+
+    def run(self):
+        if self._cancel.is_set():
+            self.state = self.reason
+            self._write_status()
+            return
+
+        self.thread_id = threading.get_ident()
+        self.started = time.time()
+        self.state = 'running'
+        if self.timeout:
+            timer = threading.Timer(self.timeout, self._timed_out)
+            timer.daemon = True
+            timer.start()
+            self._timers.append(timer)
+
+        self._write_status()
+        _local.task = self
+        try:
+            self.work()
+            self.state = 'done'
+        except TaskCancelled:
+            self.state = self.reason or 'cancelled'
+        except Exception as e:
+            traceback.print_exc()
+            self.state = 'failed'
+            self.error = '{}: {}'.format(e.__class__.__name__, e)
+        finally:
+            _local.task = None
+            while True:
+                try:
+                    with self._thread_lock:
+                        self.thread_id = None
+                    # a forced cancel raised just before can still be
+                    # pending, and would land in the next task on this thread
+                    _set_async_exc(threading.get_ident(), None)
+                    break
+                except TaskCancelled:
+                    continue
+
+            self.finished = time.time()
+            for timer in self._timers:
+                timer.cancel()
+            self._write_status()
+
+
+
+class TaskPool(object):
+    """A bounded thread pool that keeps track of its tasks"""
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or MAX_WORKERS
+        self._executor = None
+        self._tasks = {}
+        self._lock = threading.Lock()
+
+
+    def submit(self, work, task_id, timeout=None, status_path='', label=''):
+        """Queues work as a Task and returns it"""
+        task = Task(work, task_id, timeout, status_path, label)
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='wing-carrier-task')
+            self._prune()
+            self._tasks[task_id] = task
+            self._executor.submit(task.run)
+
+        return task
+
+
+    def _prune(self, keep=50):
+        finished = [task_id for task_id, task in self._tasks.items() if task.state in FINISHED]
+        for task_id in finished[:max(len(finished) - keep, 0)]:
+            del self._tasks[task_id]
+
+
+    def get(self, task_id):
+        return self._tasks.get(task_id)
+
+
+    def cancel(self, task_id=None, force=False):
+        """Cancels one task, or every unfinished one. Returns how many"""
+        tasks = [self._tasks[task_id]] if task_id in self._tasks else [] if task_id else list(self._tasks.values())
+        return sum(1 for task in tasks if task.cancel(force=force))
+
+
+    def tasks(self):
+        """Returns the status of every task the pool knows about"""
+        return [task.status() for task in list(self._tasks.values())]
+
+
+
+POOL = TaskPool()
+
+
+def submit(work, task_id, timeout=None, status_path='', label=''):
+    """See TaskPool.submit()"""
+    return POOL.submit(work, task_id, timeout, status_path, label)
+
+
+def cancel(task_id=None, force=False):
+    """Cancels a task, or all of them when task_id is None. Runs in the application."""
+    count = POOL.cancel(task_id, force)
+    print('wing-carrier: cancelled {} task{}'.format(count, '' if count == 1 else 's'))
+    return count
+
+
+def current():
+    """The Task running on this thread, or None"""
+    return getattr(_local, 'task', None)
+
+
+def checkpoint():
+    """Raises TaskCancelled if the running task was cancelled. Does
+    nothing outside a task, so the same code runs on the main thread."""
+    task = current()
+    if task is not None:
+        task.checkpoint()
+
+
+def cancelled():
+    task = current()
+    return task is not None and task.cancelled
+
+
+def progress(fraction=None, message=''):
+    """Reports the running task's progress to the IDE
+
+    Args:
+        fraction (float) : 0.0 to 1.0, or None if unknown
+        message (string) : What it's working on
+    """
+    task = current()
+    if task is not None:
+        task.report_progress(fraction, message)
+
+
+def read_status(status_path):
+    try:
+        with open(status_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def format_status(status):
+    text = '{} {}'.format(status['label'] or status['id'], status['state'])
+    if status['progress'] is not None:
+        text += ' {:.0%}'.format(status['progress'])
+    if status['message']:
+        text += ' {}'.format(status['message'])
+    if status['state'] in FINISHED:
+        text += ' after {:.1f}s'.format(status['seconds'])
+    if status['error']:
+        text += ' ({})'.format(status['error'])
+    return text
+
+
+def follow_status(status_path, prefix='', timeout=None, poll=0.1, interval=0.5):
+    """Prints a task's progress until it finishes. Runs IDE side.
+
+    Args:
+        interval (float) : Minimum seconds between progress lines. State
+            changes are always printed
+
+    Returns:
+        dict : The final status, or None if the task never finished
+    """
+    deadline = time.perf_counter() + timeout if timeout else None
+    last_state = None
+    last_print = 0.0
+    while deadline is None or time.perf_counter() < deadline:
+        status = read_status(status_path)
+        if status is not None and (status['state'] != last_state or time.perf_counter() - last_print >= interval):
+            if status['state'] != last_state or status['progress'] is not None or status['message']:
+                print('{}{}'.format(prefix, format_status(status)))
+                last_print = time.perf_counter()
+            last_state = status['state']
+            if status['state'] in FINISHED:
+                try:
+                    os.remove(status_path)
+                except OSError:
+                    pass
+                return status
+        time.sleep(poll)
+
+    return None
@@ -0,0 +1,132 @@
+"""Content addressed store for the temp files Pigeon.write_temp_file() sends.
+
+Every payload is named by a hash of its bytes, so concurrent dispatches and
+several IDE instances never overwrite a file another application is about
+to read. Files are written next to their final name and renamed into place,
+so a reader never sees a partial file, and sending content that is already
+in the store skips the write completely.
+
+Old payloads are removed by collect_garbage(), which store() runs at most
+once every GC_INTERVAL seconds.
+"""
+
+import os
+import time
+import uuid
+import hashlib
+import tempfile
+import threading
+
+
+MAX_AGE = 3600.0
+"""Seconds a payload is kept after it was last sent"""
+
+MAX_BYTES = 256 * 1024 * 1024
+"""The store is trimmed to this size, oldest payloads first"""
+
+GC_INTERVAL = 60.0
+
+_last_gc = 0.0
+_gc_lock = threading.Lock()
+
+
+def get_store_dir():
+    path = os.path.join(tempfile.gettempdir(), 'wingcarrier_payloads')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def content_name(data, prefix='', suffix='.txt'):
+    """Returns the file name data is stored under"""
+    digest = hashlib.blake2b(data, digest_size=12).hexdigest()
+    return '{}{}{}'.format(prefix + '_' if prefix else '', digest, suffix)
+
+
+def content_path(data, prefix='', suffix='.txt', directory=None):
+    """Returns the path store() writes data to, with forward slashes"""
+    directory = directory or get_store_dir()
+    return os.path.join(directory, content_name(data, prefix, suffix)).replace('\\', '/')
+
+
+def store(data, prefix='', suffix='.txt', directory=None):
+    """Writes data to the store, unless it's already there, and returns its path.
+
+    Args:
+        data (bytes) : The payload
+        prefix (string) : Starts the file name, eg the pigeon's temp file name
+        suffix (string) : The file extension
+        directory (string) : Defaults to get_store_dir()
+
+    Returns:
+        string : The payload's path, with forward slashes
+    """
+    directory = directory or get_store_dir()
+    path = content_path(data, prefix, suffix, directory)
+    try:
+        if os.path.getsize(path) == len(data):
+            # already stored. Touch it so garbage collection keeps it
+            os.utime(path, None)
+            return path
+    except OSError:
+        pass
+
+    temp_path = '{}.{}.part'.format(path, uuid.uuid4().hex)
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+    maybe_collect_garbage(directory)
+    return path
+
+
+def maybe_collect_garbage(directory=None):
+    """Runs collect_garbage() if it hasn't run in the last GC_INTERVAL seconds"""
+    global _last_gc
+    now = time.time()
+    if now - _last_gc < GC_INTERVAL or not _gc_lock.acquire(False):
+        return 0
+
+    try:
+        _last_gc = now
+        return collect_garbage(directory=directory)
+    finally:
+        _gc_lock.release()
+
+
+def collect_garbage(max_age=None, max_bytes=None, directory=None, min_age=60.0):
+    """Removes payloads older than max_age, then the oldest until the store
+    is under max_bytes. Payloads newer than min_age seconds are always kept,
+    since the application may not have read them yet.
+
+    Returns:
+        int : The number of files removed
+    """
+    max_age = MAX_AGE if max_age is None else max_age
+    max_bytes = MAX_BYTES if max_bytes is None else max_bytes
+    directory = directory or get_store_dir()
+    now = time.time()
+
+    entries = []
+    for entry in os.scandir(directory):
+        try:
+            stat = entry.stat()
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    entries.sort()
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for mtime, size, path in entries:
+        if now - mtime < min_age or (now - mtime <= max_age and total <= max_bytes):
+            break
+
+        try:
+            os.remove(path)
+        except OSError:
+            # still open somewhere (Windows), try again next time
+            continue
+        total -= size
+        removed += 1
+
+    return removed
@@ -0,0 +1,608 @@
+"""Transports that carry command strings from the IDE to a DCC.
+
+Every Pigeon talks to its application through a Transport, so connection
+handling, error reporting and any framing or pooling live here once
+instead of in each Pigeon sub-class.
+
+TCP is what Maya's commandPort has always used. For the common case of the
+DCC running on the same machine, a local IPC transport avoids the TCP stack
+and doesn't depend on a fixed port being free:
+    posix : a Unix domain socket (Maya's commandPort can listen on one too)
+    windows : a named pipe
+
+CommandListener is the receiving side of the same transports, for
+applications that don't have a command port of their own.
+
+Addresses are strings:
+    'host:port'          TCP
+    'unix:/path/to.sock' Unix domain socket
+    'pipe:name'          Windows named pipe
+    'local:name'         Whichever local IPC transport the OS supports
+    'cli:/path/to/exe'   Run the exe with the command as its last argument
+    'loopback:'          Run the command in this process
+"""
+
+import os
+import sys
+import socket
+import shutil
+import subprocess
+import tempfile
+import threading
+import traceback
+import time
+from collections import deque
+
+import __main__
+
+IS_WINDOWS = sys.platform.startswith('win')
+UNIX_SOCKETS_EXIST = hasattr(socket, 'AF_UNIX')
+
+LOCAL_HOSTS = ('127.0.0.1', 'localhost', '::1')
+
+
+class TransportError(Exception):
+    """Raised when a transport can't connect or loses its connection"""
+
+
+def local_address(name):
+    """Returns the local IPC address for name on this OS"""
+    if IS_WINDOWS or not UNIX_SOCKETS_EXIST:
+        return 'pipe:' + name
+
+    return 'unix:' + os.path.join(tempfile.gettempdir(), name + '.sock')
+
+
+def parse_address(address):
+    """Returns (kind, target) for an address string. See the module docs."""
+    if address.startswith('local:'):
+        address = local_address(address[len('local:'):])
+
+    if address.startswith('unix:'):
+        return 'unix', address[len('unix:'):]
+
+    for kind in ('cli', 'loopback'):
+        if address.startswith(kind + ':'):
+            return kind, address[len(kind) + 1:]
+
+    if address.startswith('pipe:'):
+        name = address[len('pipe:'):]
+        if not name.startswith('\\\\'):
+            name = r'\\.\pipe\{}'.format(name)
+        return 'pipe', name
+
+    host, _, port = address.rpartition(':')
+    return 'tcp', (host or '127.0.0.1', int(port))
+
+
+
+class Transport(object):
+    """Sends command bytes to a receiver and reads back any reply.
+
+    Sub-classes implement connect(), send(), receive() and close().
+    Transports are context managers that close on exit.
+
+    Sends are one-way by default: callers that don't need the receiver's
+    reply just close() after send().
+
+    Args:
+        timeout (float) : Seconds to wait when connecting and receiving
+    """
+    kind = ''
+
+    def __init__(self, timeout=2.0):
+        self.timeout = timeout
+
+
+    def connect(self):
+        """Opens the connection. Raises TransportError on failure"""
+        raise NotImplementedError
+
+
+    def send(self, data):
+        """Sends bytes (or text, which is utf-8 encoded)"""
+        raise NotImplementedError
+
+
+    def receive(self):
+        """Returns the reply bytes, or b'' if the receiver sent none.
+        Raises TransportError if the reply didn't finish within timeout"""
+        raise NotImplementedError
+
+
+    def close(self):
+        raise NotImplementedError
+
+
+    def health_check(self):
+        """Returns True if the receiver can be reached right now.
+
+        The default opens and closes a connection.
+        """
+        try:
+            self.connect()
+        except TransportError:
+            return False
+
+        self.close()
+        return True
+
+
+    @property
+    def address(self):
+        raise NotImplementedError
+
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+    def __repr__(self):
+        return '{}({})'.format(self.__class__.__name__, self.address)
+
+
+
+class SocketTransport(Transport):
+    """A stream socket transport. This is the protocol Maya's commandPort
+    speaks: raw command text in, the result text back."""
+
+    family = socket.AF_INET
+
+    def __init__(self, target, timeout=2.0):
+        super(SocketTransport, self).__init__(timeout)
+        self.target = target
+        self._socket = None
+
+
+    def connect(self):
+        sock = socket.socket(self.family, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.target)
+        except (OSError, socket.timeout) as e:
+            sock.close()
+            raise TransportError('Connection to {} failed: {}'.format(self.address, e))
+
+        self._socket = sock
+
+
+    @property
+    def connected(self):
+        return self._socket is not None
+
+
+    def send(self, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+
+        try:
+            self._socket.sendall(data)
+        except OSError as e:
+            raise TransportError('Sending to {} failed: {}'.format(self.address, e))
+
+
+    def receive(self):
+        # tell the receiver we're done so it can answer
+        try:
+            self._socket.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+
+        chunks = []
+        try:
+            for chunk in iter(lambda: self._socket.recv(65536), b''):
+                chunks.append(chunk)
+        except socket.timeout:
+            # the receiver hasn't closed its side, so the reply may be cut off
+            raise TransportError('No complete reply from {} after {}s ({} bytes read)'.format(
+                self.address, self.timeout, sum(len(c) for c in chunks)))
+        except OSError as e:
+            raise TransportError('Receiving from {} failed: {}'.format(self.address, e))
+
+        return b''.join(chunks)
+
+
+    def close(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+
+
+class TcpTransport(SocketTransport):
+    kind = 'tcp'
+    family = socket.AF_INET
+
+    def __init__(self, host='127.0.0.1', port=6000, timeout=2.0):
+        super(TcpTransport, self).__init__((host, int(port)), timeout)
+
+
+    @property
+    def address(self):
+        return '{}:{}'.format(*self.target)
+
+
+
+class UnixSocketTransport(SocketTransport):
+    kind = 'unix'
+    family = getattr(socket, 'AF_UNIX', None)
+
+    def __init__(self, path, timeout=2.0):
+        super(UnixSocketTransport, self).__init__(path, timeout)
+
+
+    @property
+    def address(self):
+        return 'unix:' + self.target
+
+
+
+class NamedPipeTransport(Transport):
+    """A Windows named pipe, using multiprocessing's message framing
+
+    Args:
+        path (string) : The full pipe path, eg \\\\.\\pipe\\name
+    """
+    kind = 'pipe'
+
+    def __init__(self, path, timeout=2.0):
+        super(NamedPipeTransport, self).__init__(timeout)
+        self.path = path
+        self._connection = None
+
+
+    @property
+    def address(self):
+        return 'pipe:' + self.path.rsplit('\\', 1)[-1]
+
+
+    @property
+    def connected(self):
+        return self._connection is not None
+
+
+    def connect(self):
+        """Opens the pipe the way multiprocessing's Client() does, but waits
+        on a busy pipe for self.timeout instead of Client()'s fixed 20s"""
+        import _winapi
+        from multiprocessing.connection import PipeConnection
+
+        deadline = time.perf_counter() + self.timeout
+        while True:
+            remaining = max(int((deadline - time.perf_counter()) * 1000), 1)
+            try:
+                _winapi.WaitNamedPipe(self.path, min(remaining, 1000))
+                handle = _winapi.CreateFile(
+                    self.path, _winapi.GENERIC_READ | _winapi.GENERIC_WRITE, 0, _winapi.NULL,
+                    _winapi.OPEN_EXISTING, _winapi.FILE_FLAG_OVERLAPPED, _winapi.NULL)
+            except OSError as e:
+                busy = e.winerror in (_winapi.ERROR_SEM_TIMEOUT, _winapi.ERROR_PIPE_BUSY)
+                if not busy or time.perf_counter() > deadline:
+                    raise TransportError('Connection to {} failed: {}'.format(self.address, e))
+            else:
+                break
+
+        _winapi.SetNamedPipeHandleState(handle, _winapi.PIPE_READMODE_MESSAGE, None, None)
+        self._connection = PipeConnection(handle)
+
+
+    def send(self, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+
+        try:
+            self._connection.send_bytes(data)
+        except OSError as e:
+            raise TransportError('Sending to {} failed: {}'.format(self.address, e))
+
+
+    def receive(self):
+        if not self._connection.poll(self.timeout):
+            return b''
+
+        try:
+            return self._connection.recv_bytes()
+        except EOFError:
+            return b''
+
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+
+class SubprocessTransport(Transport):
+    """Runs an executable once per command, eg an application's command line
+    python flag. The command is appended as the last argument.
+
+    Output is read as it arrives instead of being collected at the end, so
+    echo=True prints it live and long running commands only keep a bounded
+    tail of their output in memory.
+
+    Args:
+        args (list) : The executable and any arguments before the command
+        echo (bool) : Print the process output while it runs
+        max_lines (int) : Lines of stdout and stderr to keep
+        label (string) : Prefix for echoed lines
+    """
+    kind = 'cli'
+
+    def __init__(self, args, timeout=2.0, echo=False, max_lines=1000, label='cli'):
+        super(SubprocessTransport, self).__init__(timeout)
+        if isinstance(args, str):
+            args = [args]
+        self.args = list(args)
+        self.echo = echo
+        self.max_lines = max_lines
+        self.label = label
+        self.stdout = ''
+        self.stderr = ''
+
+
+    @property
+    def address(self):
+        return 'cli:' + self.args[0]
+
+
+    def connect(self):
+        if not self.health_check():
+            raise TransportError('{} is not an executable'.format(self.args[0]))
+
+
+    def health_check(self):
+        exe = self.args[0]
+        return bool(exe) and (os.path.isfile(exe) or shutil.which(exe) is not None)
+
+
+    def send(self, data):
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+
+        self.stdout, self.stderr = run_process(self.args + [data], self.echo, self.max_lines, self.label)
+
+
+    def receive(self):
+        return self.stdout.encode('utf-8')
+
+
+    def close(self):
+        pass
+
+
+
+def _decode(raw):
+    try:
+        return raw.decode('utf-8')
+    except UnicodeDecodeError:
+        return raw.decode('latin-1')
+
+
+def run_process(args, echo=False, max_lines=1000, label='cli'):
+    """Runs args, returning the last max_lines of (stdout, stderr).
+
+    Raises:
+        TransportError : The process couldn't start or returned non-zero
+    """
+    #NOTE: don't use subprocess.check_output(cmd), because in python 3.6+ this error's with a 120 code.
+    try:
+        proc = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except OSError as e:
+        raise TransportError('Running {} failed: {}'.format(args[0], e))
+
+    stdout_lines = deque(maxlen=max_lines)
+    stderr_lines = deque(maxlen=max_lines)
+
+    def _pump(pipe, lines, prefix):
+        for raw in iter(pipe.readline, b''):
+            line = _decode(raw)
+            lines.append(line)
+            if echo:
+                print('{}{}'.format(prefix, line.rstrip()))
+        pipe.close()
+
+    err_thread = threading.Thread(target=_pump, args=(proc.stderr, stderr_lines, label + ' err> '))
+    err_thread.daemon = True
+    err_thread.start()
+    _pump(proc.stdout, stdout_lines, label + '> ')
+    err_thread.join()
+    proc.wait()
+
+    stdout = ''.join(stdout_lines)
+    stderr = ''.join(stderr_lines)
+    if proc.returncode:
+        raise TransportError('Command Failed:\nreturn code:{0}\nstderr:\n{1}\n'.format(proc.returncode, stderr))
+
+    return stdout, stderr
+
+
+
+class LoopbackTransport(Transport):
+    """Runs commands in this process, for tests and benchmarks that need
+    the dispatch path without an application on the other end.
+
+    Args:
+        executor (callable) : Called with the command text. Defaults to
+            run_command()
+    """
+    kind = 'loopback'
+
+    def __init__(self, executor=None, timeout=2.0):
+        super(LoopbackTransport, self).__init__(timeout)
+        self.executor = executor or run_command
+        self._reply = b''
+
+
+    @property
+    def address(self):
+        return 'loopback:'
+
+
+    def connect(self):
+        pass
+
+
+    def health_check(self):
+        return True
+
+
+    def send(self, data):
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+
+        try:
+            self._reply = (self.executor(data) or '').encode('utf-8')
+        except Exception as e:
+            raise TransportError('Loopback command failed: {}'.format(e))
+
+
+    def receive(self):
+        reply, self._reply = self._reply, b''
+        return reply
+
+
+    def close(self):
+        self._reply = b''
+
+
+
+def create_transport(address, timeout=2.0):
+    """Returns an unconnected Transport for an address string"""
+    kind, target = parse_address(address)
+    if kind == 'cli':
+        return SubprocessTransport(target, timeout)
+
+    if kind == 'loopback':
+        return LoopbackTransport(timeout=timeout)
+
+    if kind == 'unix':
+        return UnixSocketTransport(target, timeout)
+
+    if kind == 'pipe':
+        return NamedPipeTransport(target, timeout)
+
+    return TcpTransport(target[0], target[1], timeout)
+
+
+
+def run_command(command):
+    """The default CommandListener executor. Evaluates the command in
+    __main__ and returns the repr of an expression's value, if any."""
+    namespace = __main__.__dict__
+    try:
+        code = compile(command, '<wing-carrier>', 'eval')
+    except SyntaxError:
+        exec(compile(command, '<wing-carrier>', 'exec'), namespace, namespace)
+        return ''
+
+    result = eval(code, namespace, namespace)
+    return '' if result is None else repr(result)
+
+
+class CommandListener(object):
+    """Receives commands on any transport address and runs them.
+
+    Each connection carries one command. The executor's return value is
+    sent back as the reply, like Maya's commandPort does.
+
+    Args:
+        address (string) : Where to listen. See the module docs
+        executor (callable) : Called with the command text. Defaults to
+            run_command(). DCCs should pass one that runs on their main
+            thread, eg maya.utils.executeInMainThreadWithResult
+    """
+
+    def __init__(self, address, executor=None):
+        self.address = address
+        self.kind, self.target = parse_address(address)
+        self.executor = executor or run_command
+        self._server = None
+        self._thread = None
+        self._stopping = threading.Event()
+
+
+    def _execute(self, data):
+        try:
+            result = self.executor(data.decode('utf-8'))
+            return (result or '').encode('utf-8')
+        except Exception:
+            traceback.print_exc()
+            return ('ERROR: ' + traceback.format_exc()).encode('utf-8')
+
+
+    def start(self):
+        """Starts listening on a background thread"""
+        if self.kind == 'pipe':
+            from multiprocessing.connection import Listener
+            self._server = Listener(self.target, family='AF_PIPE')
+            serve = self._serve_pipe
+        else:
+            family = socket.AF_INET if self.kind == 'tcp' else socket.AF_UNIX
+            if self.kind == 'unix' and os.path.exists(self.target):
+                os.remove(self.target)
+            self._server = socket.socket(family, socket.SOCK_STREAM)
+            if self.kind == 'tcp':
+                self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self._server.bind(self.target)
+            self._server.listen(16)
+            serve = self._serve_socket
+
+        self._thread = threading.Thread(target=serve, name='wing-carrier-listener')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+
+    def _serve_socket(self):
+        while not self._stopping.is_set():
+            try:
+                connection, _ = self._server.accept()
+            except OSError:
+                break
+
+            with connection:
+                chunks = []
+                for chunk in iter(lambda: connection.recv(65536), b''):
+                    chunks.append(chunk)
+
+                reply = self._execute(b''.join(chunks))
+                try:
+                    connection.sendall(reply)
+                except OSError:
+                    pass
+
+
+    def _serve_pipe(self):
+        while not self._stopping.is_set():
+            try:
+                connection = self._server.accept()
+            except OSError:
+                break
+
+            try:
+                connection.send_bytes(self._execute(connection.recv_bytes()))
+            except (OSError, EOFError):
+                pass
+            finally:
+                connection.close()
+
+
+    def stop(self):
+        self._stopping.set()
+        if self._server is not None:
+            if self.kind != 'pipe':
+                try:
+                    self._server.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+            self._server.close()
+            self._server = None
+
+        if self.kind == 'unix' and os.path.exists(self.target):
+            os.remove(self.target)